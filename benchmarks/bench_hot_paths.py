@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""解析、组合和导入热点路径的微基准(pyperf)：列表各种响应格式、深度搜索、详情页解析、额外详情处理、数据组合、CSV导出和导入器构造行"""
+
+import contextlib
+import copy
+import functools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pyperf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from mock_server import MockSite
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RECORDED_MORE_DETAIL = os.path.join(REPO_ROOT, 'product_detail_3886.json')
+
+DEFAULT_SIZES = "1000,10000,100000"
+PAGE_SIZE = 20
+# 逐项解析的基准使用的不同页面数，结果为每项的耗时
+PARSE_SAMPLE = 100
+
+LISTING_FORMATS = ['new_api', 'old_api', 'list_in_key', 'deep_search']
+
+
+def quiet():
+    """屏蔽被测代码的print、进度条和控制台日志，输出本身的开销仍计入耗时"""
+    devnull = open(os.devnull, 'w', encoding='utf-8')
+    stack = contextlib.ExitStack()
+    stack.enter_context(devnull)
+    stack.enter_context(contextlib.redirect_stdout(devnull))
+    stack.enter_context(contextlib.redirect_stderr(devnull))
+    return stack
+
+
+@functools.lru_cache(maxsize=None)
+def site(count):
+    """模拟站点，提供与线上格式一致的列表项、详情页HTML和额外详情"""
+    return MockSite(products=count, per_page=PAGE_SIZE, fixtures_dir=os.devnull)
+
+
+@functools.lru_cache(maxsize=None)
+def recorded_more_detail():
+    with open(RECORDED_MORE_DETAIL, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def listing_envelope(items, fmt):
+    """把一页列表项包装为列表接口的某种响应格式"""
+    if fmt == 'new_api':
+        return {'code': 0, 'msg': 'success', 'data': {'list': items, 'total': 0, 'per_page': PAGE_SIZE}}
+    if fmt == 'old_api':
+        return {'normal': items[2:], 'topping': items[:2]}
+    if fmt == 'list_in_key':
+        return {'code': 0, 'products': items}
+    # 没有顶层列表字段，只能由deep_search_products找到
+    return {'code': 0, 'result': {'payload': {'page': {'items': items}}}}
+
+
+@functools.lru_cache(maxsize=None)
+def listing_pages(count, fmt):
+    items = [site(count).listing_item(p) for p in site(count).listing]
+    return [listing_envelope(items[i:i + PAGE_SIZE], fmt) for i in range(0, len(items), PAGE_SIZE)]
+
+
+def old_format_more_detail(product):
+    """老格式额外详情接口的响应"""
+    return {'code': 0, 'data': {
+        'info': {'brand': product['品牌'], 'origin': product['产地'], 'stage': product['段位'],
+                 'spec': product['规格'], 'register_no': product['配方注册号']},
+        'formula': [{'name': name} for name in product['配料表'].split('、')[:8]],
+        'features': [{'title': f"特点{i}", 'content': product['配方评价'][:60]} for i in range(3)],
+        'comments': {
+            'list': [{'nickname': f"用户{i}", 'score': 5 - i % 3, 'content': "宝宝喝了不上火", 'create_time': "2024-05-01"}
+                     for i in range(5)],
+            'total': {'score': 4.6, 'count': 5},
+        },
+    }}
+
+
+def recorded_style_more_detail(product):
+    """以录制的真实响应为模板、换成合成产品ID和文本的新格式额外详情，字段和营养成分描述的长度与线上一致"""
+    data = copy.deepcopy(recorded_more_detail())
+    data['id'] = product['id']
+    data['fg_comment'] = product['配方评价']
+    data['mixture'] = product['配料表']
+    return data
+
+
+def detail_record(product, nutrient_text):
+    """与parse_detail_page结果相同结构的详情记录(大规模输入直接构造，不经过HTML解析)"""
+    record = {'id': str(product['id']), 'name': product['name']}
+    for key in ['品牌', '系列', '产地', '奶源', '适用年龄', '段位', '规格', '类别', '版本',
+                '厂家', '运营商', '参考价', '配方注册号']:
+        record[key] = product[key]
+    record['配料表'] = product['配料表']
+    record['营养成分'] = nutrient_text
+    record['奶粉点评'] = product['配方评价']
+    return record
+
+
+@functools.lru_cache(maxsize=None)
+def stage_records(count):
+    """
+    各阶段的输出记录
+    返回:
+        (列表产品, 详情, 额外详情, 完整数据)
+    """
+    from naifenzhiku_crawler import NaifenzhikuCrawler
+    from naifenzhiku_more_detail_crawler import NaifenzhikuMoreDetailCrawler
+
+    with quiet():
+        crawler = NaifenzhikuCrawler()
+        products = []
+        for page, envelope in enumerate(listing_pages(count, 'new_api'), start=1):
+            products.extend(crawler.process_product_data(envelope, page))
+        more_crawler = NaifenzhikuMoreDetailCrawler()
+
+        catalog = site(count).by_id
+        details = []
+        more_details = []
+        for product in products:
+            source = catalog[product['id']]
+            details.append(detail_record(source, '；'.join(f"{n['ingredient_name']} {n['content']}{n['unit']}"
+                                                         for n in site(count).nutrients(source))))
+            more_details.append(more_crawler.process_more_detail(recorded_style_more_detail(source), source['id']))
+
+    full_data = []
+    for product, detail, more_detail in zip(products, details, more_details):
+        item = {**product, **detail}
+        item.update({k: v for k, v in more_detail.items() if k != 'id'})
+        full_data.append(item)
+    return products, details, more_details, full_data
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    return path
+
+
+def clear_outputs(directory, keep):
+    """删除被测方法写出的文件，避免大规模输入的输出堆满磁盘"""
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if path not in keep and os.path.isfile(path):
+            os.unlink(path)
+
+
+def time_calls(loops, call, cleanup=None):
+    """调用loops次并返回总耗时，cleanup在计时之外执行"""
+    total = 0.0
+    for _ in range(loops):
+        with quiet():
+            start = time.perf_counter()
+            call()
+            total += time.perf_counter() - start
+        if cleanup:
+            cleanup()
+    return total
+
+
+# ---- 各基准的计时函数，参数loops由pyperf校准 ----
+
+def bench_listing(loops, count, fmt):
+    from naifenzhiku_crawler import NaifenzhikuCrawler
+    pages = listing_pages(count, fmt)
+    with quiet():
+        crawler = NaifenzhikuCrawler()
+
+    def call():
+        for page, envelope in enumerate(pages, start=1):
+            crawler.process_product_data(envelope, page)
+    return time_calls(loops, call)
+
+
+def bench_deep_search(loops, count):
+    from naifenzhiku_crawler import NaifenzhikuCrawler
+    pages = listing_pages(count, 'deep_search')
+    crawler = NaifenzhikuCrawler()
+
+    def call():
+        for envelope in pages:
+            crawler.deep_search_products(envelope)
+    return time_calls(loops, call)
+
+
+def bench_parse_detail_page(loops):
+    from naifenzhiku_detail_crawler import NaifenzhikuDetailCrawler
+    sample = site(PARSE_SAMPLE).listing
+    pages = [(site(PARSE_SAMPLE).detail_page(p), str(p['id'])) for p in sample]
+    with quiet():
+        crawler = NaifenzhikuDetailCrawler(output_dir='data')
+
+    def call():
+        for html_content, product_id in pages:
+            crawler.parse_detail_page(html_content, product_id)
+    return time_calls(loops, call)
+
+
+def bench_process_more_detail(loops, variant):
+    from naifenzhiku_more_detail_crawler import NaifenzhikuMoreDetailCrawler
+    sample = site(PARSE_SAMPLE).listing
+    if variant == 'recorded':
+        responses = [recorded_style_more_detail(p) for p in sample]
+    elif variant == 'new_format':
+        responses = [site(PARSE_SAMPLE).more_detail(p) for p in sample]
+    else:
+        responses = [old_format_more_detail(p) for p in sample]
+    # 老格式响应中没有产品ID，按请求的ID处理
+    pairs = [(data, data.get('id', p['id'])) for data, p in zip(responses, sample)]
+    with quiet():
+        crawler = NaifenzhikuMoreDetailCrawler()
+
+    def call():
+        for data, product_id in pairs:
+            crawler.process_more_detail(data, product_id)
+    return time_calls(loops, call)
+
+
+def pipeline_with_inputs(count, workdir):
+    """准备写好各阶段输入文件的CrawlerPipeline"""
+    from run_crawler_pipeline import CrawlerPipeline
+    products, details, more_details, _ = stage_records(count)
+    output_dir = os.path.join(workdir, f"pipeline_{count}")
+    os.makedirs(output_dir, exist_ok=True)
+    with quiet():
+        pipeline = CrawlerPipeline(output_dir=output_dir)
+    pipeline.latest_product_file = write_json(os.path.join(output_dir, 'input_products.json'), products)
+    pipeline.latest_detail_file = write_json(os.path.join(output_dir, 'input_details.json'), details)
+    pipeline.latest_more_detail_file = write_json(os.path.join(output_dir, 'input_more_details.json'), more_details)
+    return pipeline, output_dir
+
+
+def bench_combine_data(loops, count, workdir):
+    pipeline, output_dir = pipeline_with_inputs(count, workdir)
+    keep = {pipeline.latest_product_file, pipeline.latest_detail_file, pipeline.latest_more_detail_file}
+    return time_calls(loops, pipeline.combine_data, lambda: clear_outputs(output_dir, keep))
+
+
+def bench_combine_full_data(loops, count, workdir):
+    pipeline, output_dir = pipeline_with_inputs(count, workdir)
+    with quiet():
+        pipeline.combine_data()
+    keep = {pipeline.latest_product_file, pipeline.latest_detail_file, pipeline.latest_more_detail_file,
+            pipeline.combined_file, pipeline.combined_csv}
+    return time_calls(loops, pipeline.combine_full_data, lambda: clear_outputs(output_dir, keep))
+
+
+def bench_save_to_csv(loops, count, workdir):
+    from naifenzhiku_crawler import NaifenzhikuCrawler
+    with quiet():
+        crawler = NaifenzhikuCrawler()
+    crawler.all_products = stage_records(count)[0]
+    csv_file = os.path.join(workdir, f"products_{count}.csv")
+    return time_calls(loops, lambda: crawler.save_to_csv(csv_file), lambda: os.unlink(csv_file))
+
+
+def importer():
+    from db_import import DatabaseImporter
+    # 构造行只用到字段映射，不需要数据库连接
+    return DatabaseImporter.__new__(DatabaseImporter)
+
+
+def bench_build_reload_rows(loops, count):
+    data = stage_records(count)[3]
+    db_importer = importer()
+    return time_calls(loops, lambda: db_importer.build_reload_rows(data))
+
+
+def bench_copy_encode(loops, count):
+    from db_import import CopyRowStream
+    tables = importer().build_reload_rows(stage_records(count)[3])
+
+    def call():
+        for rows in tables.values():
+            stream = CopyRowStream(rows)
+            # copy_expert按8KB读取
+            while stream.read(8192):
+                pass
+    return time_calls(loops, call)
+
+
+def add_cmdline_args(cmd, args):
+    """把自定义参数传给pyperf的worker子进程"""
+    cmd.extend(['--sizes', args.sizes])
+    if args.only:
+        cmd.extend(['--only', args.only])
+
+
+def main():
+    """主函数"""
+    # worker子进程在临时目录中启动，脚本需使用绝对路径
+    runner = pyperf.Runner(program_args=(os.path.abspath(__file__),), add_cmdline_args=add_cmdline_args)
+    runner.metadata['description'] = "奶粉智库爬虫解析、组合和导入热点路径"
+    runner.argparser.add_argument("--sizes", type=str, default=DEFAULT_SIZES,
+                                  help=f"按产品数量变化的基准使用的规模，逗号分隔，默认为{DEFAULT_SIZES}")
+    runner.argparser.add_argument("--only", type=str, default="",
+                                  help="只运行名称包含该字符串的基准(如 listing、combine、10000)")
+    args = runner.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    # 被测代码会在当前目录创建data/和logs/，全部放在临时目录中
+    workdir = tempfile.mkdtemp(prefix="nfzk_bench_")
+    os.chdir(workdir)
+    os.makedirs("logs", exist_ok=True)
+
+    benchmarks = [
+        ("parse_detail_page", bench_parse_detail_page, (), PARSE_SAMPLE),
+        ("process_more_detail[recorded]", bench_process_more_detail, ('recorded',), PARSE_SAMPLE),
+        ("process_more_detail[new_format]", bench_process_more_detail, ('new_format',), PARSE_SAMPLE),
+        ("process_more_detail[old_format]", bench_process_more_detail, ('old_format',), PARSE_SAMPLE),
+    ]
+    for count in sizes:
+        for fmt in LISTING_FORMATS:
+            benchmarks.append((f"process_product_data[{fmt}] {count}", bench_listing, (count, fmt), None))
+        benchmarks.extend([
+            (f"deep_search_products {count}", bench_deep_search, (count,), None),
+            (f"combine_data {count}", bench_combine_data, (count, workdir), None),
+            (f"combine_full_data {count}", bench_combine_full_data, (count, workdir), None),
+            (f"save_to_csv {count}", bench_save_to_csv, (count, workdir), None),
+            (f"build_reload_rows {count}", bench_build_reload_rows, (count,), None),
+            (f"copy_encode {count}", bench_copy_encode, (count,), None),
+        ])
+
+    try:
+        for name, func, bench_args, inner_loops in benchmarks:
+            if args.only and args.only not in name:
+                continue
+            # 逐项基准的inner_loops为样本数，pyperf报告每项的耗时
+            runner.bench_time_func(name, func, *bench_args, inner_loops=inner_loops)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+数据库导入规模基准：把合成的完整数据文件(1万/10万/100万产品)导入一次性数据库，
+对每种导入模式报告吞吐量、WAL写入量、表和索引膨胀，以及导入期间的重锁持有时间和读请求延迟
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from synthetic_catalog import generate_catalog, write_catalog
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'schema.sql')
+
+DEFAULT_SIZES = "10000,100000"
+IMPORT_MODES = ("upsert", "reload")
+
+# 每次导入前清空的表(导入器写入或派生的全部数据)
+RESET_TABLES = ["milk_products", "milk_product_details", "milk_product_nutrients", "milk_product_extra_details",
+                "product_full", "product_ingredients", "product_ingredient_sources", "ingredients",
+                "import_runs", "product_changes"]
+# 报告膨胀的表
+REPORT_TABLES = ["milk_products", "milk_product_details", "milk_product_nutrients", "milk_product_extra_details",
+                 "product_full", "product_ingredients", "product_changes"]
+# 会阻塞普通写入或读取的表级锁
+HEAVY_LOCK_MODES = ["ShareLock", "ShareRowExclusiveLock", "ExclusiveLock", "AccessExclusiveLock"]
+
+# 第二轮导入中被修改的产品比例(每N个产品修改一个)
+CHANGE_EVERY = 10
+
+
+def mutate_product(product):
+    """第二轮导入的数据：每CHANGE_EVERY个产品修改价格、点击数和一项营养成分，其余保持不变"""
+    if product['id'] % CHANGE_EVERY:
+        return product
+    product['price'] += 1
+    product['参考价'] = str(product['price'])
+    product['click_count'] += 100
+    name = next(iter(product['营养成分']))
+    product['营养成分'][name]['含量'] = f"{float(product['营养成分'][name]['含量']) + 0.1:.1f}"
+    return product
+
+
+def prepare_files(data_dir, size, seed):
+    """
+    生成(或复用已生成的)两轮导入的数据文件
+    返回:
+        (首轮文件, 第二轮文件)
+    """
+    initial = os.path.join(data_dir, f"synthetic_full_{size}_{seed}_initial.json")
+    reimport = os.path.join(data_dir, f"synthetic_full_{size}_{seed}_reimport.json")
+    if not os.path.exists(initial):
+        start = time.perf_counter()
+        write_catalog(initial, generate_catalog(size, seed=seed, full=True))
+        print(f"已生成 {initial} ({os.path.getsize(initial) / 1024 / 1024:.0f} MB)，"
+              f"耗时 {time.perf_counter() - start:.1f} 秒")
+    if not os.path.exists(reimport):
+        write_catalog(reimport, (mutate_product(p) for p in generate_catalog(size, seed=seed, full=True)))
+    return initial, reimport
+
+
+def reset_tables(conn):
+    """清空导入器涉及的表，使每种模式都从空库开始"""
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(RESET_TABLES)} RESTART IDENTITY CASCADE")
+    conn.commit()
+
+
+def wal_lsn(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_current_wal_lsn()")
+        lsn = cur.fetchone()[0]
+    conn.commit()
+    return lsn
+
+
+def wal_bytes_since(conn, lsn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (lsn,))
+        diff = int(cur.fetchone()[0])
+    conn.commit()
+    return diff
+
+
+def table_stats(conn):
+    """
+    各表的存活/死元组数和表、索引大小；先ANALYZE，使计数不依赖其他会话何时上报统计
+    返回:
+        {表名: {...}}
+    """
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for table in REPORT_TABLES:
+            cur.execute(f"ANALYZE {table}")
+    conn.autocommit = False
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_stat_clear_snapshot()")
+        cur.execute("""
+            SELECT s.relname, s.n_live_tup, s.n_dead_tup, pg_table_size(s.relid), pg_indexes_size(s.relid)
+            FROM pg_stat_user_tables s
+            WHERE s.schemaname = current_schema() AND s.relname = ANY(%s)
+        """, (REPORT_TABLES,))
+        rows = cur.fetchall()
+    conn.commit()
+    stats = {}
+    for name, live, dead, heap, indexes in rows:
+        stats[name] = {
+            'live_tuples': live,
+            'dead_tuples': dead,
+            'dead_ratio': round(dead / (live + dead), 4) if live + dead else 0.0,
+            'table_mb': round(heap / 1024 / 1024, 2),
+            'index_mb': round(indexes / 1024 / 1024, 2),
+        }
+    return stats
+
+
+class LockSampler(threading.Thread):
+    """后台定时查询pg_locks，累计导入会话持有各种重锁的时间"""
+
+    def __init__(self, conn_params, pid, interval=0.01):
+        super().__init__(name="lock-sampler", daemon=True)
+        self.conn_params = conn_params
+        self.pid = pid
+        self.interval = interval
+        self.stop_event = threading.Event()
+        # {锁模式: 秒}
+        self.held = {}
+        # {锁模式: 涉及的表}
+        self.relations = {}
+
+    def run(self):
+        conn = psycopg2.connect(**self.conn_params)
+        conn.autocommit = True
+        last = time.perf_counter()
+        try:
+            with conn.cursor() as cur:
+                while not self.stop_event.is_set():
+                    cur.execute("""
+                        SELECT l.mode, c.relname
+                        FROM pg_locks l JOIN pg_class c ON c.oid = l.relation
+                        WHERE l.pid = %s AND l.granted AND l.locktype = 'relation' AND l.mode = ANY(%s)
+                    """, (self.pid, HEAVY_LOCK_MODES))
+                    now = time.perf_counter()
+                    modes = set()
+                    for mode, relname in cur.fetchall():
+                        modes.add(mode)
+                        self.relations.setdefault(mode, set()).add(relname)
+                    for mode in modes:
+                        self.held[mode] = self.held.get(mode, 0.0) + (now - last)
+                    last = now
+                    self.stop_event.wait(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+class ReadProbe(threading.Thread):
+    """后台持续按主键读取产品，记录导入期间读请求的延迟(被锁阻塞时延迟会显著升高)"""
+
+    def __init__(self, conn_params, max_id, interval=0.005):
+        super().__init__(name="read-probe", daemon=True)
+        self.conn_params = conn_params
+        self.max_id = max_id
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.timings = []
+
+    def run(self):
+        conn = psycopg2.connect(**self.conn_params)
+        conn.autocommit = True
+        rng = random.Random(0)
+        try:
+            with conn.cursor() as cur:
+                while not self.stop_event.is_set():
+                    start = time.perf_counter()
+                    cur.execute("SELECT name, price FROM milk_products WHERE product_id = %s",
+                                (rng.randint(1, self.max_id),))
+                    cur.fetchall()
+                    self.timings.append((time.perf_counter() - start) * 1000)
+                    self.stop_event.wait(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+    def summary(self):
+        if not self.timings:
+            return {'reads': 0, 'p99_ms': None, 'max_ms': None}
+        ordered = sorted(self.timings)
+        return {
+            'reads': len(ordered),
+            'p99_ms': round(ordered[min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))], 2),
+            'max_ms': round(ordered[-1], 2),
+        }
+
+
+def run_import(conn_params, admin, json_file, mode, size):
+    """
+    在探测线程运行的同时执行一次导入
+    返回:
+        一行结果字典
+    """
+    from db_import import DatabaseImporter
+
+    conn = psycopg2.connect(application_name="nfzk_bench_import", **conn_params)
+    sampler = LockSampler(conn_params, conn.get_backend_pid())
+    probe = ReadProbe(conn_params, size)
+    lsn = wal_lsn(admin)
+    sampler.start()
+    probe.start()
+
+    start = time.perf_counter()
+    try:
+        ok = DatabaseImporter(json_file=json_file, mode=mode, conn=conn).import_data()
+    finally:
+        wall = time.perf_counter() - start
+        probe.stop()
+        sampler.stop()
+    wal = wal_bytes_since(admin, lsn)
+    conn.close()
+
+    return {
+        'ok': bool(ok),
+        'wall_seconds': round(wall, 3),
+        'products_per_second': round(size / wall, 1) if wall > 0 else 0.0,
+        'wal_mb': round(wal / 1024 / 1024, 2),
+        'wal_bytes_per_product': round(wal / size),
+        'heavy_locks_ms': {mode: round(seconds * 1000, 1) for mode, seconds in sampler.held.items()},
+        'heavy_lock_tables': {mode: sorted(names) for mode, names in sampler.relations.items()},
+        'reads': probe.summary(),
+        'tables': table_stats(admin),
+    }
+
+
+def print_results(results):
+    """打印吞吐量/WAL/锁和各表膨胀两张表"""
+    print()
+    print(f"{'产品数':>8} {'模式':<7} {'轮次':<9} {'耗时(s)':>9} {'产品/秒':>9} {'WAL(MB)':>9} {'WAL/产品':>9} "
+          f"{'重锁(ms)':>9} {'读p99(ms)':>10} {'读max(ms)':>10}")
+    for row in results:
+        lock_ms = sum(row['heavy_locks_ms'].values())
+        reads = row['reads']
+        p99 = f"{reads['p99_ms']:.2f}" if reads['p99_ms'] is not None else '-'
+        max_ms = f"{reads['max_ms']:.2f}" if reads['max_ms'] is not None else '-'
+        status = '' if row['ok'] else ' (导入失败)'
+        print(f"{row['size']:>8} {row['mode']:<7} {row['pass']:<9} {row['wall_seconds']:>9.2f} "
+              f"{row['products_per_second']:>9.1f} {row['wal_mb']:>9.1f} {row['wal_bytes_per_product']:>9} "
+              f"{lock_ms:>9.1f} {p99:>10} {max_ms:>10}{status}")
+
+    print()
+    print(f"{'产品数':>8} {'模式':<7} {'轮次':<9} {'表':<28} {'存活元组':>10} {'死元组':>10} {'死元组比':>8} "
+          f"{'表(MB)':>9} {'索引(MB)':>9}")
+    for row in results:
+        for table in REPORT_TABLES:
+            stats = row['tables'].get(table)
+            if not stats:
+                continue
+            print(f"{row['size']:>8} {row['mode']:<7} {row['pass']:<9} {table:<28} {stats['live_tuples']:>10} "
+                  f"{stats['dead_tuples']:>10} {stats['dead_ratio']:>8.1%} {stats['table_mb']:>9.1f} "
+                  f"{stats['index_mb']:>9.1f}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="数据库导入规模基准(会清空目标数据库中的产品相关表，请使用一次性数据库)")
+    parser.add_argument("--sizes", type=str, default=DEFAULT_SIZES,
+                        help=f"合成产品数量，逗号分隔，默认为{DEFAULT_SIZES}(1000000约需8GB数据文件和数十GB内存)")
+    parser.add_argument("--modes", type=str, default=",".join(IMPORT_MODES),
+                        help=f"导入模式，逗号分隔，默认为{','.join(IMPORT_MODES)}")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，默认为42")
+    parser.add_argument("--data-dir", type=str, default="bench_data",
+                        help="合成数据文件和导入日志目录，已生成的文件会复用，默认为bench_data")
+    parser.add_argument("--init-schema", action="store_true", help="开始前执行database/schema.sql")
+    parser.add_argument("--output", type=str, help="把结果另存为JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示导入器的日志和进度条")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products_bench", help="数据库名称，默认为milk_products_bench")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = set(modes) - set(IMPORT_MODES)
+    if unknown:
+        parser.error(f"未知导入模式: {', '.join(sorted(unknown))}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    os.makedirs(args.data_dir, exist_ok=True)
+    # 导入器把日志写到当前目录的logs/下
+    os.chdir(args.data_dir)
+    if not args.verbose:
+        os.environ.setdefault("TQDM_DISABLE", "1")
+        logging.getLogger("DatabaseImporter").setLevel(logging.WARNING)
+
+    conn_params = {'host': args.host, 'port': args.port, 'dbname': args.dbname,
+                   'user': args.user, 'password': args.password}
+    admin = psycopg2.connect(**conn_params)
+    if args.init_schema:
+        with admin.cursor() as cur, open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+            cur.execute(f.read())
+        admin.commit()
+
+    results = []
+    for size in sizes:
+        files = prepare_files('.', size, args.seed)
+        for mode in modes:
+            reset_tables(admin)
+            for pass_name, json_file in zip(("initial", "reimport"), files):
+                print(f"{size} 个产品，{mode} 模式，{pass_name} ...")
+                row = run_import(conn_params, admin, json_file, mode, size)
+                results.append({'size': size, 'mode': mode, 'pass': pass_name, **row})
+    admin.close()
+
+    print_results(results)
+    print(f"\n读请求统计的是导入期间按主键读取milk_products的延迟；重锁为导入会话持有{'/'.join(HEAVY_LOCK_MODES)}的采样时间")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'config': {'sizes': sizes, 'modes': modes, 'seed': args.seed, 'change_every': CHANGE_EVERY},
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""配料表/配方评价检索延迟基准：在一次性数据库中装入合成目录后测量 ProductSearch 的查询延迟"""
+
+import argparse
+import csv
+import io
+import os
+import statistics
+import sys
+import time
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from product_search import ProductSearch
+from synthetic_catalog import generate_catalog
+
+DEFAULT_KEYWORDS = ["乳铁蛋白", "低聚半乳糖", "OPN骨桥蛋白", "鼠李糖乳杆菌", "叶黄素", "二十二碳六烯酸", "不存在的成分"]
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'schema.sql')
+
+
+def load_catalog(conn, count, seed):
+    """通过COPY把合成目录写入产品表和详情表"""
+    products = io.StringIO()
+    details = io.StringIO()
+    product_writer = csv.writer(products)
+    detail_writer = csv.writer(details)
+    for item in generate_catalog(count, seed=seed):
+        product_writer.writerow([item['id'], item['name'], item['price'], item['tag_time']])
+        detail_writer.writerow([item['id'], item['品牌'], item['段位'], item['产地'],
+                                item['配方评价'], item['配料表']])
+    products.seek(0)
+    details.seek(0)
+
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE milk_products CASCADE")
+        cur.copy_expert("COPY milk_products (product_id, name, price, tag_time) FROM STDIN WITH (FORMAT csv)",
+                        products)
+        cur.copy_expert("COPY milk_product_details (product_id, brand, stage, origin, formula_evaluation, ingredients) "
+                        "FROM STDIN WITH (FORMAT csv)", details)
+        cur.execute("ANALYZE milk_products")
+        cur.execute("ANALYZE milk_product_details")
+    conn.commit()
+
+
+def measure(searcher, keywords, repeat, limit):
+    """对每个关键词重复检索，返回所有查询的耗时(毫秒)"""
+    timings = []
+    for _ in range(repeat):
+        for keyword in keywords:
+            start = time.perf_counter()
+            searcher.search(keyword, limit=limit)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(label, timings):
+    """打印延迟分位数"""
+    ordered = sorted(timings)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    print(f"{label:<16} n={len(ordered):<5} mean={statistics.mean(ordered):8.2f}ms "
+          f"p50={pick(0.50):8.2f}ms p95={pick(0.95):8.2f}ms p99={pick(0.99):8.2f}ms")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="检索延迟基准(会清空目标数据库中的产品表，请使用一次性数据库)")
+    parser.add_argument("--products", type=int, default=100000, help="合成产品数量，默认为100000")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，默认为42")
+    parser.add_argument("--repeat", type=int, default=5, help="每个关键词的重复次数，默认为5")
+    parser.add_argument("--limit", type=int, default=20, help="每次检索返回的产品数，默认为20")
+    parser.add_argument("--keyword", action="append", help="检索关键词，可重复指定")
+    parser.add_argument("--skip-load", action="store_true", help="跳过装载，直接使用库中已有数据")
+    parser.add_argument("--init-schema", action="store_true", help="装载前执行database/schema.sql")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products_bench", help="数据库名称，默认为milk_products_bench")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    keywords = args.keyword or DEFAULT_KEYWORDS
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+
+    if args.init_schema:
+        with conn.cursor() as cur, open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+            cur.execute(f.read())
+        conn.commit()
+
+    if not args.skip_load:
+        start = time.perf_counter()
+        load_catalog(conn, args.products, args.seed)
+        print(f"已装载 {args.products} 个合成产品，耗时 {time.perf_counter() - start:.1f} 秒")
+
+    searcher = ProductSearch(conn=conn)
+    print(f"pg_trgm: {'可用' if searcher.has_trgm else '不可用'}, 中文分词: {'可用' if searcher.has_fts else '不可用'}")
+
+    # 预热缓存后再计时
+    measure(searcher, keywords, 1, args.limit)
+    summarize("索引检索", measure(searcher, keywords, args.repeat, args.limit))
+
+    # 关闭索引扫描，得到原先 LIKE '%...%' 顺序扫描的基线
+    with conn.cursor() as cur:
+        cur.execute("SET enable_bitmapscan = off")
+        cur.execute("SET enable_indexscan = off")
+    conn.commit()
+    summarize("顺序扫描基线", measure(searcher, keywords, args.repeat, args.limit))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
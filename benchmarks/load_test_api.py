@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""产品API压测：以固定并发请求一组URL，报告吞吐量、延迟分位数和缓存命中情况"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+import aiohttp
+
+DEFAULT_PATHS = [
+    "/products?limit=20",
+    "/products?stage=3&limit=20",
+    "/products?min_price=200&max_price=400&limit=50",
+    "/nutrients/乳铁蛋白/products?limit=20",
+]
+
+
+async def worker(session, base_url, paths, deadline, timings, statuses, cache_states, use_etag, etags):
+    """循环请求直到截止时间"""
+    while time.perf_counter() < deadline:
+        path = random.choice(paths)
+        headers = {}
+        if use_etag and path in etags:
+            headers['If-None-Match'] = etags[path]
+        start = time.perf_counter()
+        try:
+            async with session.get(base_url + path, headers=headers) as resp:
+                await resp.read()
+                statuses[resp.status] += 1
+                cache_states[resp.headers.get('X-Cache', '-')] += 1
+                if 'ETag' in resp.headers:
+                    etags[path] = resp.headers['ETag']
+        except aiohttp.ClientError:
+            statuses['error'] += 1
+        timings.append((time.perf_counter() - start) * 1000)
+
+
+async def run(args):
+    """按指定并发和时长执行压测"""
+    paths = args.path or DEFAULT_PATHS
+    if args.product_ids:
+        paths = paths + [f"/products/{pid}" for pid in range(1, args.product_ids + 1)]
+
+    timings = []
+    statuses = Counter()
+    cache_states = Counter()
+    etags = {}
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # 预热：每个URL请求一次
+        for path in paths[:args.warmup]:
+            async with session.get(args.url + path) as resp:
+                await resp.read()
+
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            worker(session, args.url, paths, deadline, timings, statuses, cache_states, args.etag, etags)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    ordered = sorted(timings)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    print(f"并发 {args.concurrency}，时长 {elapsed:.1f} 秒，共 {len(ordered)} 个请求，{len(ordered) / elapsed:.0f} 请求/秒")
+    print(f"延迟 mean={statistics.mean(ordered):.2f}ms p50={pick(0.50):.2f}ms "
+          f"p95={pick(0.95):.2f}ms p99={pick(0.99):.2f}ms max={ordered[-1]:.2f}ms")
+    print(f"状态码 {dict(statuses)}，缓存 {dict(cache_states)}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="产品API压测")
+    parser.add_argument("--url", type=str, default="http://localhost:8080", help="API服务地址，默认为http://localhost:8080")
+    parser.add_argument("--path", action="append", help="请求路径，可重复指定，默认使用一组列表和营养成分查询")
+    parser.add_argument("--product-ids", type=int, default=1000, help="额外请求/products/1..N的单品详情，默认为1000")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发数，默认为50")
+    parser.add_argument("--duration", type=float, default=10.0, help="压测时长(秒)，默认为10")
+    parser.add_argument("--warmup", type=int, default=0, help="压测前预热的URL数，默认为0")
+    parser.add_argument("--etag", action="store_true", help="携带If-None-Match，模拟会重新验证的客户端")
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
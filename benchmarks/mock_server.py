@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""奶粉智库模拟服务：按真实接口的路径和响应格式提供合成数据，可配置延迟、错误率和登录过期，供离线基准测试使用"""
+
+import argparse
+import asyncio
+import glob
+import html
+import json
+import os
+import random
+import re
+import threading
+import uuid
+from collections import Counter
+
+from aiohttp import web
+
+from synthetic_catalog import generate_catalog, make_product
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# 详情页左右两栏展示的字段
+LEFT_FIELDS = ['品牌', '系列', '产地', '奶源', '适用年龄', '段位', '规格', '类别', '版本']
+RIGHT_FIELDS = ['厂家', '运营商', '参考价', '配方注册号']
+
+NUTRIENTS = [("蛋白质", "g"), ("脂肪", "g"), ("碳水化合物", "g"), ("钙", "mg"), ("铁", "mg"), ("锌", "mg"),
+             ("维生素A", "μgRE"), ("维生素D", "μg"), ("二十二碳六烯酸(DHA)", "mg"), ("乳铁蛋白", "mg")]
+
+
+class MockSite:
+    """模拟站点的数据和状态：产品目录、已发放的token、请求计数"""
+
+    def __init__(self, products=600, per_page=20, seed=42, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, token_uses=0, fixtures_dir=REPO_ROOT):
+        """
+        初始化模拟站点
+        参数:
+            products: 合成产品数量
+            per_page: 列表每页产品数
+            seed: 随机种子，相同种子生成相同目录
+            latency_ms: 每个请求的基础延迟(毫秒)
+            jitter_ms: 在基础延迟上增加的0~jitter_ms毫秒随机延迟
+            error_rate: 返回500错误的概率(0~1)
+            token_uses: 每个token可用于额外详情接口的次数，用完后返回303"请先登录"，0表示不过期
+            fixtures_dir: 存放product_detail_<id>.json的目录，有对应文件的产品额外详情直接返回该文件
+        """
+        self.fixtures = {}
+        for path in glob.glob(os.path.join(fixtures_dir, 'product_detail_*.json')):
+            match = re.search(r'product_detail_(\d+)\.json$', path)
+            if match:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.fixtures[int(match.group(1))] = json.load(f)
+
+        self.catalog = list(generate_catalog(products, seed=seed))
+        # 有固定额外详情的产品也加入目录，使其能被列表和详情页访问到
+        known_ids = {product['id'] for product in self.catalog}
+        fixture_rng = random.Random(seed)
+        self.catalog.extend(make_product(product_id, fixture_rng)
+                            for product_id in sorted(self.fixtures) if product_id not in known_ids)
+        self.by_id = {product['id']: product for product in self.catalog}
+        # 列表按更新时间倒序，与线上默认排序一致
+        self.listing = sorted(self.catalog, key=lambda p: p['tag_time'], reverse=True)
+        self.per_page = per_page
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.token_uses = token_uses
+        self.rng = random.Random(seed)
+        self.tokens = {}
+        self.requests = Counter()
+
+    def listing_item(self, product):
+        """列表接口中的一个产品，字段名与线上接口一致"""
+        return {
+            'id': product['id'],
+            'name': product['name'],
+            'image': product['thumbnail'],
+            'm_click': product['click_count'],
+            'price': product['price'],
+            'country': product['产地'],
+            'tag': product['tag'],
+            'tag_time': product['tag_time'],
+            'icon': product['icon'],
+        }
+
+    def listing_page(self, page):
+        start = (page - 1) * self.per_page
+        items = self.listing[start:start + self.per_page]
+        return {
+            'code': 0,
+            'msg': 'success',
+            'data': {
+                'list': [self.listing_item(p) for p in items],
+                'total': len(self.listing),
+                'per_page': self.per_page,
+                'current_page': page,
+            }
+        }
+
+    def nutrients(self, product):
+        rng = random.Random(product['id'])
+        return [{'ingredient_name': name, 'content': f"{rng.uniform(0.5, 60):.1f}", 'unit': unit, 'desc': ''}
+                for name, unit in NUTRIENTS]
+
+    def detail_page(self, product):
+        """详情页HTML，结构与爬虫解析的选择器一致"""
+        def items(fields):
+            return ''.join(f'<li class="item">{html.escape(key)}：{html.escape(str(product[key]))}</li>'
+                           for key in fields if key in product)
+
+        nutrient_text = '；'.join(f"{n['ingredient_name']} {n['content']}{n['unit']}" for n in self.nutrients(product))
+        return (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"><title>'
+            f"{html.escape(product['name'])}</title></head><body>"
+            f"<h1 class=\"title\">{html.escape(product['name'])}</h1>"
+            f"<ul class=\"left new-left-box\">{items(LEFT_FIELDS)}</ul>"
+            f"<ul class=\"right\">{items(RIGHT_FIELDS)}</ul>"
+            f"<div id=\"mixtu\">{html.escape(product['配料表'])}</div>"
+            f"<div id=\"nutrient\">{html.escape(nutrient_text)}</div>"
+            f"<div id=\"fg_comment\">{html.escape(product['配方评价'])}</div>"
+            '</body></html>'
+        )
+
+    def more_detail(self, product):
+        """额外详情接口的新格式响应"""
+        return {
+            'id': product['id'],
+            'fg_comment': product['配方评价'],
+            'mixture': product['配料表'],
+            'nutrient': self.nutrients(product),
+            'milk_source_desc': f"{product['奶源']}，{product['产地']}生产",
+            'score': round(random.Random(product['id']).uniform(6, 10), 1),
+        }
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        self.tokens[token] = self.token_uses
+        return token
+
+    def use_token(self, token):
+        """消耗一次token，返回token是否有效"""
+        if token not in self.tokens:
+            return False
+        if self.token_uses <= 0:
+            return True
+        if self.tokens[token] <= 0:
+            return False
+        self.tokens[token] -= 1
+        return True
+
+
+def create_app(site):
+    """创建aiohttp应用：站点接口 + /__stats 请求计数"""
+
+    @web.middleware
+    async def simulate(request, handler):
+        if request.path.startswith('/__'):
+            return await handler(request)
+        delay = site.latency_ms + site.rng.uniform(0, site.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        endpoint = request.match_info.route.resource.canonical if request.match_info.route.resource else 'unknown'
+        if site.error_rate and site.rng.random() < site.error_rate:
+            site.requests[f"{endpoint} 500"] += 1
+            return web.Response(status=500, text="Internal Server Error")
+        response = await handler(request)
+        site.requests[f"{endpoint} {response.status}"] += 1
+        return response
+
+    async def listing(request):
+        try:
+            page = max(int(request.query.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        return web.json_response(site.listing_page(page), dumps=lambda o: json.dumps(o, ensure_ascii=False))
+
+    async def detail(request):
+        product = site.by_id.get(int(request.match_info['product_id']))
+        if product is None:
+            return web.Response(status=404, text="Not Found")
+        return web.Response(text=site.detail_page(product), content_type='text/html')
+
+    async def more_detail(request):
+        if not site.use_token(request.headers.get('authorization', '')):
+            return web.json_response({'status': 303, 'mesg': '请先登录'})
+        try:
+            product_id = int(request.query.get('product_id', ''))
+        except ValueError:
+            return web.json_response({'code': 1, 'msg': '参数错误'})
+        if product_id in site.fixtures:
+            return web.json_response(site.fixtures[product_id], dumps=lambda o: json.dumps(o, ensure_ascii=False))
+        product = site.by_id.get(product_id)
+        if product is None:
+            return web.json_response({'code': 1, 'msg': '产品不存在'})
+        return web.json_response(site.more_detail(product), dumps=lambda o: json.dumps(o, ensure_ascii=False))
+
+    async def login(request):
+        try:
+            payload = json.loads(await request.text())
+        except ValueError:
+            payload = {}
+        if not payload.get('tel') or not payload.get('password'):
+            return web.json_response({'status': 0, 'mesg': '账号或密码错误'})
+        return web.json_response({'status': 1, 'mesg': '登录成功', 'token': site.issue_token(), 'tel': 1})
+
+    async def stats(request):
+        return web.json_response({'requests': dict(site.requests), 'products': len(site.catalog),
+                                  'tokens_issued': len(site.tokens)})
+
+    async def reset(request):
+        site.requests.clear()
+        return web.json_response({'reset': True})
+
+    app = web.Application(middlewares=[simulate])
+    app.router.add_get('/index/powder/index', listing)
+    app.router.add_get('/index/powder/detailMore', more_detail)
+    app.router.add_post('/index/login/login', login)
+    app.router.add_get(r'/powder/detail-{product_id:\d+}.html', detail)
+    app.router.add_get('/__stats', stats)
+    app.router.add_post('/__reset', reset)
+    return app
+
+
+def start_in_thread(site, host="127.0.0.1", port=0):
+    """
+    在后台线程中启动模拟服务
+    返回:
+        (基础URL, 停止函数)
+    """
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(create_app(site), access_log=None)
+    loop.run_until_complete(runner.setup())
+    tcp_site = web.TCPSite(runner, host, port)
+    loop.run_until_complete(tcp_site.start())
+    bound_port = tcp_site._server.sockets[0].getsockname()[1]
+
+    thread = threading.Thread(target=loop.run_forever, name="mock-server", daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return f"http://{host}:{bound_port}", stop
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="奶粉智库模拟服务(列表、详情页、额外详情、登录)")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="监听地址，默认为127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900, help="监听端口，默认为8900")
+    parser.add_argument("--products", type=int, default=600, help="合成产品数量，默认为600")
+    parser.add_argument("--per-page", type=int, default=20, help="列表每页产品数，默认为20")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，默认为42")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的基础延迟(毫秒)，默认为0")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="额外的随机延迟上限(毫秒)，默认为0")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的概率，默认为0")
+    parser.add_argument("--token-uses", type=int, default=0, help="每个token可用次数，用完后返回303需重新登录，0表示不过期(默认)")
+    parser.add_argument("--fixtures-dir", type=str, default=REPO_ROOT, help="product_detail_<id>.json所在目录，默认为仓库根目录")
+    args = parser.parse_args()
+
+    site = MockSite(products=args.products, per_page=args.per_page, seed=args.seed,
+                    latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                    token_uses=args.token_uses, fixtures_dir=args.fixtures_dir)
+    print(f"模拟服务: http://{args.host}:{args.port} ，{len(site.catalog)} 个产品，{len(site.fixtures)} 个固定额外详情")
+    print(f"爬虫使用: NFZK_API_BASE=http://{args.host}:{args.port} NFZK_WEB_BASE=http://{args.host}:{args.port}")
+    web.run_app(create_app(site), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+基准结果库：保存端到端基准、热点路径微基准(pyperf)和导入规模基准的结果及当时的git版本和机器信息，
+比较任意两次运行，用Welch t检验标出统计上显著的性能回退
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_STORE = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+SUITES = ('e2e', 'pyperf', 'import')
+
+# 端到端基准的指标：(字段, 单位, 是否越小越好)
+E2E_METRICS = [
+    ('products_per_second', '产品/秒', False),
+    ('wall_seconds', '秒', True),
+    ('requests_per_product', '请求/产品', True),
+    ('peak_rss_mb', 'MB', True),
+]
+# 导入规模基准的指标
+IMPORT_METRICS = [
+    ('products_per_second', '产品/秒', False),
+    ('wal_bytes_per_product', '字节/产品', True),
+    ('heavy_lock_ms', 'ms', True),
+    ('read_p99_ms', 'ms', True),
+]
+
+DEFAULT_ALPHA = 0.05
+# 变化小于该比例时即使显著也不标记，避免把微小的系统性差异当作回退
+DEFAULT_MIN_CHANGE = 0.02
+# 只有一个样本时无法检验，变化超过该比例时标记为"可能回退"
+SINGLE_SAMPLE_CHANGE = 0.10
+
+
+def git_info():
+    """当前仓库的git版本、分支和工作区是否有未提交的修改"""
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'revision': git('rev-parse', 'HEAD'),
+        'branch': git('rev-parse', '--abbrev-ref', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+    }
+
+
+def machine_info():
+    """运行基准的机器信息，比较不同机器上的结果时给出提示"""
+    cpu_model = None
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu_model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    try:
+        memory_gb = round(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 3, 1)
+    except (ValueError, OSError, AttributeError):
+        memory_gb = None
+    return {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_model': cpu_model or platform.processor() or None,
+        'cpu_count': os.cpu_count(),
+        'memory_gb': memory_gb,
+    }
+
+
+def detect_suite(payload):
+    """由结果文件的结构判断基准类型"""
+    if 'benchmarks' in payload and 'version' in payload:
+        return 'pyperf'
+    results = payload.get('results') or []
+    if results and 'scenario' in results[0]:
+        return 'e2e'
+    if results and 'mode' in results[0] and 'pass' in results[0]:
+        return 'import'
+    raise ValueError("无法识别的基准结果文件")
+
+
+def add_sample(benchmarks, name, unit, lower_is_better, values):
+    entry = benchmarks.setdefault(name, {'unit': unit, 'lower_is_better': lower_is_better, 'values': []})
+    entry['values'].extend(value for value in values if value is not None)
+
+
+def pyperf_samples(path, benchmarks):
+    """pyperf结果：每个基准取全部worker的测量值(秒)"""
+    import pyperf
+    for bench in pyperf.BenchmarkSuite.load(path).get_benchmarks():
+        add_sample(benchmarks, bench.get_name(), '秒', True, bench.get_values())
+
+
+def e2e_samples(payload, benchmarks):
+    """端到端基准：每个场景的各项指标，--repeat运行时使用每次的取值"""
+    for row in payload['results']:
+        samples = row.get('samples', {})
+        for field, unit, lower in E2E_METRICS:
+            add_sample(benchmarks, f"e2e {row['scenario']} {field}", unit, lower,
+                       samples.get(field, [row.get(field)]))
+
+
+def import_samples(payload, benchmarks):
+    """导入规模基准：每个(规模, 模式, 轮次)的吞吐量、WAL、重锁时间和读延迟"""
+    for row in payload['results']:
+        values = {
+            'products_per_second': row.get('products_per_second'),
+            'wal_bytes_per_product': row.get('wal_bytes_per_product'),
+            'heavy_lock_ms': sum(row.get('heavy_locks_ms', {}).values()),
+            'read_p99_ms': row.get('reads', {}).get('p99_ms'),
+        }
+        for field, unit, lower in IMPORT_METRICS:
+            add_sample(benchmarks, f"import {row['mode']} {row['pass']} {row['size']} {field}", unit, lower,
+                       [values[field]])
+
+
+def load_results(paths, suite=None):
+    """
+    读取一个或多个结果文件并合并为各基准的样本；同一基准的多个文件(如多次运行的端到端基准)的取值合并为样本
+    返回:
+        (基准类型, 基准配置, {基准名称: {unit, lower_is_better, values}})
+    """
+    benchmarks = {}
+    config = None
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+        file_suite = detect_suite(payload)
+        if suite and file_suite != suite:
+            raise ValueError(f"{path} 是{file_suite}结果，与指定的{suite}不一致")
+        suite = file_suite
+        if suite == 'pyperf':
+            pyperf_samples(path, benchmarks)
+        else:
+            config = config or payload.get('config')
+            (e2e_samples if suite == 'e2e' else import_samples)(payload, benchmarks)
+    return suite, config, benchmarks
+
+
+class ResultsStore:
+    """结果库：每次运行保存为目录中的一个JSON文件"""
+
+    def __init__(self, directory=DEFAULT_STORE):
+        self.directory = directory
+
+    def record(self, paths, suite=None, label=None):
+        """
+        保存一次运行
+        返回:
+            运行记录字典
+        """
+        suite, config, benchmarks = load_results(paths, suite)
+        if not benchmarks:
+            raise ValueError("结果文件中没有基准数据")
+        git = git_info()
+        now = datetime.now()
+        run_id = f"{now.strftime('%Y%m%d_%H%M%S')}_{suite}_{(git['revision'] or 'norev')[:8]}"
+        run = {
+            'id': run_id,
+            'suite': suite,
+            'label': label,
+            'created_at': now.isoformat(timespec='seconds'),
+            'git': git,
+            'machine': machine_info(),
+            'config': config,
+            'sources': [os.path.abspath(path) for path in paths],
+            'benchmarks': benchmarks,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"{run_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+        return run
+
+    def runs(self, suite=None):
+        """按时间顺序返回已保存的运行"""
+        runs = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            with open(path, 'r', encoding='utf-8') as f:
+                run = json.load(f)
+            if suite is None or run['suite'] == suite:
+                runs.append(run)
+        return runs
+
+    def find(self, ref, suite=None):
+        """
+        按ID(或其唯一前缀)、git版本前缀、标签或latest/previous查找运行
+        参数:
+            ref: 运行引用
+            suite: 只在该类型的运行中查找
+        """
+        runs = self.runs(suite)
+        if not runs:
+            raise LookupError("结果库中没有运行记录")
+        if ref in ('latest', 'previous'):
+            index = -1 if ref == 'latest' else -2
+            if len(runs) < -index:
+                raise LookupError(f"没有{ref}运行")
+            return runs[index]
+        matches = [run for run in runs
+                   if run['id'].startswith(ref) or run.get('label') == ref
+                   or (run['git'].get('revision') or '').startswith(ref)]
+        if not matches:
+            raise LookupError(f"未找到运行: {ref}")
+        if len({run['id'] for run in matches}) > 1 and not all(run.get('label') == ref for run in matches):
+            raise LookupError(f"{ref} 匹配多个运行: {', '.join(run['id'] for run in matches)}")
+        # 同一标签或版本有多次运行时取最近一次
+        return matches[-1]
+
+
+def _betacf(a, b, x):
+    """不完全贝塔函数的连分式(Numerical Recipes betacf)"""
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 201):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 3e-12:
+            break
+    return h
+
+
+def regularized_beta(a, b, x):
+    """正则化不完全贝塔函数I_x(a, b)"""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def welch_t_test(base, new):
+    """
+    Welch t检验(不假设方差相等)
+    返回:
+        (t值, 自由度, 双侧p值)，任一组少于2个样本时返回None
+    """
+    if len(base) < 2 or len(new) < 2:
+        return None
+    var_base = statistics.variance(base) / len(base)
+    var_new = statistics.variance(new) / len(new)
+    diff = statistics.mean(new) - statistics.mean(base)
+    if var_base + var_new == 0:
+        # 两组都没有波动：有差异即视为显著
+        return (math.inf if diff else 0.0), float(len(base) + len(new) - 2), (0.0 if diff else 1.0)
+    t = diff / math.sqrt(var_base + var_new)
+    df = (var_base + var_new) ** 2 / (var_base ** 2 / (len(base) - 1) + var_new ** 2 / (len(new) - 1))
+    p = regularized_beta(df / 2.0, 0.5, df / (df + t * t))
+    return t, df, p
+
+
+def compare_runs(base, new, alpha=DEFAULT_ALPHA, min_change=DEFAULT_MIN_CHANGE):
+    """
+    比较两次运行中共同的基准
+    返回:
+        行列表，每行包含均值、变化比例、p值和结论(regression/improvement/unchanged及单样本时的suspect_*)
+    """
+    rows = []
+    for name in sorted(set(base['benchmarks']) & set(new['benchmarks'])):
+        old_bench, new_bench = base['benchmarks'][name], new['benchmarks'][name]
+        old_values, new_values = old_bench['values'], new_bench['values']
+        if not old_values or not new_values:
+            continue
+        old_mean, new_mean = statistics.mean(old_values), statistics.mean(new_values)
+        change = (new_mean - old_mean) / old_mean if old_mean else (0.0 if new_mean == old_mean else math.inf)
+        worse = change > 0 if new_bench['lower_is_better'] else change < 0
+
+        test = welch_t_test(old_values, new_values)
+        p_value = test[2] if test else None
+        if test is None:
+            verdict = ('suspect_regression' if worse else 'suspect_improvement') \
+                if abs(change) >= SINGLE_SAMPLE_CHANGE else 'unchanged'
+        elif p_value < alpha and abs(change) >= min_change:
+            verdict = 'regression' if worse else 'improvement'
+        else:
+            verdict = 'unchanged'
+        rows.append({
+            'benchmark': name,
+            'unit': new_bench['unit'],
+            'lower_is_better': new_bench['lower_is_better'],
+            'base_mean': old_mean,
+            'new_mean': new_mean,
+            'base_n': len(old_values),
+            'new_n': len(new_values),
+            'change': change,
+            'p_value': p_value,
+            'verdict': verdict,
+        })
+    return rows
+
+
+VERDICT_LABELS = {
+    'regression': '回退',
+    'improvement': '改进',
+    'unchanged': '',
+    'suspect_regression': '可能回退(单样本)',
+    'suspect_improvement': '可能改进(单样本)',
+}
+
+
+def format_value(value):
+    if value is None or (isinstance(value, float) and math.isinf(value)):
+        return '-'
+    if abs(value) >= 1000:
+        return f"{value:,.0f}"
+    if abs(value) >= 1:
+        return f"{value:.3f}"
+    return f"{value:.3g}"
+
+
+def describe_run(run):
+    git = run['git']
+    revision = (git.get('revision') or '?')[:10] + ('+dirty' if git.get('dirty') else '')
+    label = f" [{run['label']}]" if run.get('label') else ''
+    return f"{run['id']}{label} {run['created_at']} {git.get('branch') or '?'}@{revision} {run['machine']['hostname']}"
+
+
+def print_comparison(base, new, rows, show_all=False):
+    """打印两次运行各基准的变化表"""
+    print(f"基线: {describe_run(base)}")
+    print(f"对比: {describe_run(new)}")
+    machine_keys = ('hostname', 'cpu_model', 'cpu_count', 'python')
+    differing = [key for key in machine_keys if base['machine'].get(key) != new['machine'].get(key)]
+    if differing:
+        print(f"注意: 两次运行的机器信息不同({', '.join(differing)})，差异可能来自环境")
+    if base.get('config') != new.get('config'):
+        print("注意: 两次运行的基准参数不同，结果不一定可比")
+    print()
+
+    width = max([len(row['benchmark']) for row in rows] + [10])
+    print(f"{'基准':<{width}} {'单位':<10} {'基线':>12} {'对比':>12} {'变化':>9} {'p值':>8} {'样本':>7}  结论")
+    shown = 0
+    for row in rows:
+        if not show_all and row['verdict'] == 'unchanged':
+            continue
+        shown += 1
+        change = '-' if math.isinf(row['change']) else f"{row['change']:+.1%}"
+        p_value = f"{row['p_value']:.3f}" if row['p_value'] is not None else '-'
+        direction = '↓' if row['lower_is_better'] else '↑'
+        print(f"{row['benchmark']:<{width}} {row['unit'] + direction:<10} {format_value(row['base_mean']):>12} "
+              f"{format_value(row['new_mean']):>12} {change:>9} {p_value:>8} {row['base_n']:>3}/{row['new_n']:<3}  "
+              f"{VERDICT_LABELS[row['verdict']]}")
+    if not show_all and shown < len(rows):
+        print(f"({len(rows) - shown} 个无显著变化的基准未列出，使用--all显示全部)")
+
+    counts = {verdict: sum(1 for row in rows if row['verdict'] == verdict) for verdict in VERDICT_LABELS}
+    print()
+    print(f"共 {len(rows)} 个基准: 回退 {counts['regression']}，改进 {counts['improvement']}，"
+          f"单样本可能回退 {counts['suspect_regression']}，无显著变化 {counts['unchanged']}"
+          f"(↓越小越好，↑越大越好)")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="基准结果库：保存基准结果并比较两次运行")
+    parser.add_argument("--store", type=str, default=DEFAULT_STORE, help="结果库目录，默认为benchmarks/results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="保存一次运行的结果")
+    record_parser.add_argument("files", nargs="+",
+                               help="结果文件(run_e2e.py/bench_import_scaling.py的--output或pyperf的-o)，"
+                                    "同一基准的多个文件合并为样本")
+    record_parser.add_argument("--suite", type=str, choices=SUITES, help="基准类型，默认按文件内容判断")
+    record_parser.add_argument("--label", type=str, help="运行标签，如优化前/优化后，可在比较时代替运行ID")
+
+    list_parser = subparsers.add_parser("list", help="列出已保存的运行")
+    list_parser.add_argument("--suite", type=str, choices=SUITES, help="只列出该类型的运行")
+
+    compare_parser = subparsers.add_parser("compare", help="比较两次运行")
+    compare_parser.add_argument("base", nargs="?", default="previous",
+                                help="基线运行：ID(前缀)、git版本前缀、标签或latest/previous，默认为previous")
+    compare_parser.add_argument("new", nargs="?", default="latest", help="对比运行，默认为latest")
+    compare_parser.add_argument("--suite", type=str, choices=SUITES, help="在该类型的运行中查找(使用latest/previous时建议指定)")
+    compare_parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help=f"显著性水平，默认为{DEFAULT_ALPHA}")
+    compare_parser.add_argument("--min-change", type=float, default=DEFAULT_MIN_CHANGE,
+                                help=f"标记为回退或改进所需的最小变化比例，默认为{DEFAULT_MIN_CHANGE}")
+    compare_parser.add_argument("--all", action="store_true", help="显示无显著变化的基准")
+    compare_parser.add_argument("--fail-on-regression", action="store_true", help="有显著回退时以退出码1结束(用于CI)")
+
+    args = parser.parse_args()
+    store = ResultsStore(args.store)
+
+    try:
+        if args.command == "record":
+            run = store.record(args.files, suite=args.suite, label=args.label)
+            samples = sum(len(bench['values']) for bench in run['benchmarks'].values())
+            print(f"已保存运行 {run['id']}: {len(run['benchmarks'])} 个基准，{samples} 个样本")
+            return 0
+
+        if args.command == "list":
+            for run in store.runs(args.suite):
+                print(f"{describe_run(run)}  {len(run['benchmarks'])} 个基准")
+            return 0
+
+        base = store.find(args.base, args.suite)
+        new = store.find(args.new, args.suite)
+    except (LookupError, ValueError, OSError) as e:
+        print(f"错误: {e}")
+        return 2
+
+    if base['suite'] != new['suite']:
+        print(f"错误: 不能比较不同类型的运行({base['suite']} 与 {new['suite']})")
+        return 2
+    rows = compare_runs(base, new, alpha=args.alpha, min_change=args.min_change)
+    if not rows:
+        print("两次运行没有共同的基准")
+        return 2
+    print_comparison(base, new, rows, show_all=args.all)
+    regressions = sum(1 for row in rows if row['verdict'] == 'regression')
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""离线端到端基准：在本地模拟服务上运行各爬虫和完整流水线，报告每秒产品数、每个产品的请求数、峰值内存和耗时"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from mock_server import MockSite, start_in_thread
+
+SCENARIOS = ['listing', 'detail', 'more_detail', 'pipeline']
+
+# 模拟服务接受任意非空账号密码
+BENCH_USERNAME = "13800000000"
+BENCH_PASSWORD = "benchmark"
+
+
+def run_scenario(scenario, product_file):
+    """
+    在当前进程中运行一个场景(由worker子进程调用，当前目录为临时目录)
+    返回:
+        得到数据的产品数
+    """
+    import requests
+    from naifenzhiku_crawler import NaifenzhikuCrawler
+    from naifenzhiku_detail_crawler import NaifenzhikuDetailCrawler
+    from naifenzhiku_more_detail_crawler import NaifenzhikuMoreDetailCrawler
+    from run_crawler_pipeline import CrawlerPipeline
+
+    # 详情爬虫在创建logs目录之前就打开日志文件
+    os.makedirs("logs", exist_ok=True)
+    session = requests.Session()
+    if scenario == 'listing':
+        crawler = NaifenzhikuCrawler(session=session)
+        crawler.retry_delay = 0
+        crawler.page_delay = 0
+        return len(crawler.crawl_all_products())
+
+    if scenario == 'detail':
+        crawler = NaifenzhikuDetailCrawler(input_file=product_file, delay_range=(0, 0), session=session)
+        crawler.retry_delay = 0
+        return len(crawler.crawl_all_details())
+
+    if scenario == 'more_detail':
+        crawler = NaifenzhikuMoreDetailCrawler(product_file=product_file, delay_range=(0, 0), session=session,
+                                               username=BENCH_USERNAME, password=BENCH_PASSWORD)
+        crawler.retry_delay = 0
+        more_details = crawler.crawl_all_more_details()
+        return len(more_details) - len(crawler.failed)
+
+    pipeline = CrawlerPipeline(min_delay=0, max_delay=0, username=BENCH_USERNAME, password=BENCH_PASSWORD,
+                               session=session)
+    pipeline.run_pipeline()
+    return len(pipeline.full_data)
+
+
+def worker(args):
+    """worker子进程：运行一个场景并把结果写入结果文件"""
+    import tracing
+    if not args.keep_delays:
+        # 爬虫中的等待(页间延迟、每5页的额外延迟、重试退避)都经过tracing.sleep，基准只测量实际工作
+        tracing.sleep = lambda seconds: None
+
+    start = time.perf_counter()
+    items = run_scenario(args.worker, args.product_file)
+    wall = time.perf_counter() - start
+    with open(args.result_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'items': items,
+            'wall': wall,
+            # Linux上ru_maxrss的单位为KB
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }, f)
+
+
+def run_worker(scenario, base_url, product_file, keep_delays, verbose):
+    """在临时目录中启动worker子进程运行一个场景，返回worker写出的结果"""
+    with tempfile.TemporaryDirectory(prefix=f"nfzk_e2e_{scenario}_") as workdir:
+        result_file = os.path.join(workdir, 'result.json')
+        command = [sys.executable, os.path.abspath(__file__), '--worker', scenario,
+                   '--product-file', product_file, '--result-file', result_file]
+        if keep_delays:
+            command.append('--keep-delays')
+        env = dict(os.environ, NFZK_API_BASE=base_url, NFZK_WEB_BASE=base_url)
+        output = None if verbose else subprocess.DEVNULL
+        subprocess.run(command, cwd=workdir, env=env, stdout=output, stderr=output, check=True)
+        with open(result_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+def summarize(scenario, result, requests):
+    """由worker结果和模拟服务的请求计数得出一行报告"""
+    total = sum(requests.values())
+    errors = sum(count for key, count in requests.items() if not key.endswith(' 200'))
+    items = result['items']
+    return {
+        'scenario': scenario,
+        'products': items,
+        'wall_seconds': round(result['wall'], 3),
+        'products_per_second': round(items / result['wall'], 2) if result['wall'] > 0 else 0.0,
+        'requests': total,
+        'requests_per_product': round(total / items, 3) if items else None,
+        'error_responses': errors,
+        'peak_rss_mb': round(result['peak_rss_kb'] / 1024, 1),
+        'requests_by_endpoint': dict(requests),
+    }
+
+
+# 重复运行时保留每次取值的指标，供results_store.py做显著性检验
+SAMPLED_FIELDS = ['wall_seconds', 'products_per_second', 'requests_per_product', 'peak_rss_mb']
+
+
+def combine_repeats(rows):
+    """把同一场景多次运行的报告合并为一行：指标取中位数，samples中保留每次的取值"""
+    row = dict(rows[0])
+    row['samples'] = {field: [r[field] for r in rows] for field in SAMPLED_FIELDS}
+    for field in SAMPLED_FIELDS:
+        values = [value for value in row['samples'][field] if value is not None]
+        row[field] = statistics.median(values) if values else None
+    return row
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="在本地模拟服务上运行爬虫和完整流水线的端到端基准")
+    parser.add_argument("--products", type=int, default=200, help="合成产品数量，默认为200")
+    parser.add_argument("--per-page", type=int, default=20, help="列表每页产品数，默认为20")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，默认为42")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="模拟服务每个请求的基础延迟(毫秒)，默认为20")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="额外的随机延迟上限(毫秒)，默认为10")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回500的概率，默认为0")
+    parser.add_argument("--token-uses", type=int, default=0, help="每个token可用次数，用完后返回303需重新登录，默认为0(不过期)")
+    parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS),
+                        help=f"要运行的场景，逗号分隔，默认为{','.join(SCENARIOS)}")
+    parser.add_argument("--keep-delays", action="store_true", help="保留爬虫中的等待(默认跳过，只测量实际工作)")
+    parser.add_argument("--repeat", type=int, default=1, help="每个场景重复运行的次数，报告取中位数，默认为1")
+    parser.add_argument("--output", type=str, help="把结果另存为JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示爬虫自身的输出")
+    # worker子进程使用的参数
+    parser.add_argument("--worker", type=str, choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--product-file", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    site = MockSite(products=args.products, per_page=args.per_page, seed=args.seed,
+                    latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                    token_uses=args.token_uses)
+    base_url, stop = start_in_thread(site)
+    print(f"模拟服务: {base_url} ，{len(site.catalog)} 个产品，延迟 {args.latency_ms}+{args.jitter_ms}ms，"
+          f"错误率 {args.error_rate}，token可用次数 {args.token_uses or '不限'}")
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="nfzk_e2e_") as workdir:
+            # 详情和额外详情场景使用与列表相同的产品ID
+            product_file = os.path.join(workdir, 'products.json')
+            with open(product_file, 'w', encoding='utf-8') as f:
+                json.dump([{'id': product['id']} for product in site.listing], f)
+
+            for scenario in scenarios:
+                rows = []
+                for _ in range(max(args.repeat, 1)):
+                    site.requests.clear()
+                    result = run_worker(scenario, base_url, product_file, args.keep_delays, args.verbose)
+                    rows.append(summarize(scenario, result, Counter(site.requests)))
+                results.append(combine_repeats(rows) if len(rows) > 1 else rows[0])
+    finally:
+        stop()
+
+    print(f"{'场景':<12} {'产品数':>8} {'耗时(s)':>10} {'产品/秒':>10} {'请求数':>8} {'请求/产品':>10} "
+          f"{'错误响应':>8} {'峰值RSS(MB)':>12}")
+    for row in results:
+        requests_per_product = f"{row['requests_per_product']:.3f}" if row['requests_per_product'] else '-'
+        print(f"{row['scenario']:<12} {row['products']:>8} {row['wall_seconds']:>10.3f} "
+              f"{row['products_per_second']:>10.2f} {row['requests']:>8} {requests_per_product:>10} "
+              f"{row['error_responses']:>8} {row['peak_rss_mb']:>12.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': {k: v for k, v in vars(args).items()
+                                  if k not in ('worker', 'product_file', 'result_file', 'output', 'verbose')},
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""合成奶粉产品目录：按爬虫完整数据文件(naifenzhiku_full_data_*.json)的格式生成可复现的测试数据"""
+
+import argparse
+import json
+import random
+
+BRANDS = ["飞鹤", "君乐宝", "伊利", "美赞臣", "雅培", "惠氏", "爱他美", "a2", "海普诺凯", "澳优",
+          "合生元", "贝因美", "完达山", "雀巢", "美素佳儿", "佳贝艾特", "蓝河", "圣元", "银桥", "纽瑞滋"]
+SERIES = ["星飞帆", "臻稚", "启赋", "蓝臻", "菁挚", "至初", "卓萃", "荷致", "经典", "超级"]
+ORIGINS = ["中国", "荷兰", "新西兰", "澳大利亚", "爱尔兰", "法国", "德国", "丹麦", "美国", "西班牙"]
+MILK_SOURCES = ["生牛乳", "生羊乳", "全脂乳粉", "脱脂乳粉", "乳清粉"]
+STAGES = ["1段", "2段", "3段", "4段"]
+CATEGORIES = ["婴幼儿配方奶粉", "较大婴儿配方奶粉", "幼儿配方奶粉", "儿童奶粉"]
+
+BASE_INGREDIENTS = ["生牛乳", "乳糖", "脱脂乳粉", "乳清蛋白粉", "浓缩乳清蛋白粉", "水解乳清蛋白粉",
+                    "脱盐乳清粉", "低芥酸菜籽油", "葵花籽油", "椰子油", "大豆油", "磷脂"]
+OPTIONAL_INGREDIENTS = ["乳铁蛋白", "低聚半乳糖(GOS)", "低聚果糖(FOS)", "1,3-二油酸2-棕榈酸甘油三酯",
+                        "2'-岩藻糖基乳糖", "乳脂球膜", "OPN骨桥蛋白", "酪蛋白磷酸肽", "核苷酸",
+                        "叶黄素", "二十二碳六烯酸(DHA)", "花生四烯酸(ARA)", "鼠李糖乳杆菌",
+                        "动物双歧杆菌", "牛磺酸", "肌醇", "左旋肉碱", "胆碱"]
+MINERALS = ["磷酸三钙", "柠檬酸钾", "碳酸钙", "氯化钠", "氯化镁", "硫酸亚铁", "硫酸锌", "硫酸铜",
+            "硫酸锰", "碘化钾", "亚硒酸钠", "L-抗坏血酸", "醋酸维生素A", "胆钙化醇", "维生素K1"]
+HIGHLIGHTS = ["乳铁蛋白", "OPO结构脂", "HMO母乳低聚糖", "益生菌", "益生元", "α-乳清蛋白",
+              "乳脂球膜", "DHA", "叶黄素", "核苷酸", "A2β-酪蛋白", "水解蛋白"]
+
+# 营养成分表：(名称, 单位, 含量下限, 含量上限)，前部为每个产品都有的必需成分，其余为可选成分
+REQUIRED_NUTRIENTS = [
+    ("能量", "kJ", 1900, 2200), ("蛋白质", "g", 9, 16), ("脂肪", "g", 18, 28), ("亚油酸", "g", 2, 5),
+    ("α-亚麻酸", "mg", 200, 600), ("碳水化合物", "g", 50, 62), ("钠", "mg", 100, 250), ("钾", "mg", 450, 800),
+    ("铜", "μg", 200, 450), ("镁", "mg", 30, 80), ("铁", "mg", 4, 9), ("锌", "mg", 2.5, 6), ("锰", "μg", 20, 100),
+    ("钙", "mg", 350, 800), ("磷", "mg", 200, 500), ("碘", "μg", 50, 150), ("氯", "mg", 250, 500),
+    ("硒", "μg", 8, 25), ("维生素A", "μg RE", 300, 600), ("维生素D", "μg", 6, 15), ("维生素E", "mg α-TE", 3, 10),
+    ("维生素K₁", "μg", 20, 60), ("维生素B₁", "μg", 300, 800), ("维生素B₂", "μg", 500, 1200),
+]
+OPTIONAL_NUTRIENTS = [
+    ("维生素B₆", "μg", 200, 600), ("维生素B₁₂", "μg", 1, 3), ("烟酸(烟酰胺)", "μg", 2000, 5000),
+    ("叶酸", "μg", 60, 150), ("泛酸", "μg", 2000, 5000), ("维生素C", "mg", 40, 120), ("生物素", "μg", 10, 30),
+    ("胆碱", "mg", 100, 300), ("肌醇", "mg", 20, 60), ("牛磺酸", "mg", 20, 45), ("左旋肉碱", "mg", 5, 20),
+    ("DHA", "mg", 50, 150), ("ARA/AA", "mg", 50, 150), ("低聚半乳糖", "g", 1, 4), ("低聚果糖", "g", 0.1, 1),
+    ("OPO", "g", 2, 6), ("叶黄素", "μg", 100, 300), ("核苷酸", "mg", 15, 30), ("乳铁蛋白", "mg", 50, 300),
+    ("CPP", "mg", 100, 200),
+]
+# 营养成分描述与线上一致为HTML片段，同名成分的描述相同
+NUTRIENT_DESCRIPTION = "<p>作用：{name}是婴幼儿生长发育所需的营养素之一；</p><p>摄取途径：母乳、婴儿配方奶粉、辅食等。</p>"
+
+
+def make_ingredients(rng):
+    """生成一段配料表文本，形式接近详情页的mixture字段"""
+    base = rng.sample(BASE_INGREDIENTS, rng.randint(4, 8))
+    optional = rng.sample(OPTIONAL_INGREDIENTS, rng.randint(2, 9))
+    minerals = rng.sample(MINERALS, rng.randint(6, len(MINERALS)))
+    if rng.random() < 0.3:
+        # 部分产品以"基粉【...】"的形式给出预混料
+        return f"基粉【{'、'.join(base)}】、{'、'.join(optional + minerals)}"
+    return '、'.join(base + optional + minerals)
+
+
+def make_evaluation(rng, brand, origin):
+    """生成一段配方评价文本"""
+    highlights = rng.sample(HIGHLIGHTS, rng.randint(2, 5))
+    return (f"{brand}奶粉属于{origin}生产的产品，采用优质奶源，以{rng.choice(MILK_SOURCES)}作为第一奶基原料。"
+            f"添加了{'、'.join(highlights)}等特色成分，可选成分在脑视力营养、免疫力营养和消化吸收营养方面"
+            f"{rng.choice(['有优势', '表现一般', '较为全面'])}。要特别提醒的是，母乳是婴儿最好的食物。")
+
+
+def make_nutrients(rng):
+    """生成营养成分字典{名称: {含量, 单位, 描述}}，约30项，形式与额外详情爬虫的输出一致"""
+    chosen = REQUIRED_NUTRIENTS + rng.sample(OPTIONAL_NUTRIENTS, rng.randint(3, 12))
+    return {name: {'含量': f"{rng.uniform(low, high):.1f}", '单位': unit, '描述': NUTRIENT_DESCRIPTION.format(name=name)}
+            for name, unit, low, high in chosen}
+
+
+def make_extra_details(rng):
+    """生成额外详情接口中未单独处理的字段(详情_*)"""
+    extra = {
+        '详情_select_unit': rng.randint(0, 1),
+        '详情_category': str(rng.randint(1, 3)),
+        '详情_level': rng.randint(1, 5),
+    }
+    if rng.random() < 0.2:
+        # 少数产品带有榜单信息
+        extra['详情_rank'] = [{'rank_id': rng.randint(1, 50), 'title': f"{rng.choice(CATEGORIES)}榜",
+                              'position': rng.randint(1, 100)} for _ in range(rng.randint(1, 3))]
+        extra['详情_rank_category_cate'] = rng.randint(1, 4)
+    return extra
+
+
+def make_product(product_id, rng, full=False):
+    """
+    生成一个与爬虫完整数据格式一致的产品
+    参数:
+        product_id: 产品ID
+        rng: random.Random实例
+        full: 是否同时生成营养成分和额外详情(详情_*)，与流水线合并额外详情后的完整数据一致
+    返回:
+        产品字典
+    """
+    brand = rng.choice(BRANDS)
+    origin = rng.choice(ORIGINS)
+    stage = rng.choice(STAGES)
+    price = rng.randint(150, 600)
+    product = {
+        'id': product_id,
+        'name': f"{brand}{rng.choice(SERIES)}婴幼儿配方奶粉{stage}",
+        'thumbnail': f"https://img.naifenzhiku.com/powder/{product_id}.jpg",
+        'thumbnail_alt': f"{brand}奶粉",
+        'click_count': rng.randint(0, 200000),
+        'price': price,
+        'tag': rng.randint(1, 5),
+        'tag_time': 1600000000 + rng.randint(0, 150000000),
+        'icon': f"https://img.naifenzhiku.com/icon/{rng.randint(1, 40)}.png",
+        '品牌': brand,
+        '系列': rng.choice(SERIES),
+        '产地': origin,
+        '奶源': rng.choice(MILK_SOURCES),
+        '适用年龄': rng.choice(["0-6个月", "6-12个月", "12-36个月", "3岁以上"]),
+        '厂家': f"{brand}乳业有限公司",
+        '运营商': f"{brand}(中国)投资有限公司",
+        '规格': rng.choice(["400g", "800g", "900g"]),
+        '段位': stage,
+        '参考价': str(price),
+        '类别': rng.choice(CATEGORIES),
+        '版本': rng.choice(["国行版", "跨境版"]),
+        '配方注册号': f"国食注字YP{rng.randint(20160000, 20249999)}",
+        '配方评价': make_evaluation(rng, brand, origin),
+        '配料表': make_ingredients(rng),
+    }
+    if full:
+        product['营养成分'] = make_nutrients(rng)
+        product.update(make_extra_details(rng))
+    return product
+
+
+def generate_catalog(count, seed=42, start_id=1, full=False):
+    """
+    逐个生成合成产品
+    参数:
+        count: 产品数量
+        seed: 随机种子，相同种子生成相同数据
+        start_id: 起始产品ID
+        full: 是否生成营养成分和额外详情
+    返回:
+        产品字典生成器
+    """
+    rng = random.Random(seed)
+    for product_id in range(start_id, start_id + count):
+        yield make_product(product_id, rng, full=full)
+
+
+def write_catalog(path, products):
+    """
+    把产品逐个写成JSON数组，百万级产品时无需先在内存中构造整个列表
+    返回:
+        写入的产品数
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for product in products:
+            if count:
+                f.write(',\n')
+            json.dump(product, f, ensure_ascii=False)
+            count += 1
+        f.write(']\n')
+    return count
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="生成合成奶粉产品目录(完整数据JSON格式)")
+    parser.add_argument("--count", type=int, default=10000, help="产品数量，默认为10000")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子，默认为42")
+    parser.add_argument("--full", action="store_true", help="同时生成营养成分(约30项)和额外详情，与流水线的完整数据一致")
+    parser.add_argument("--output", "-o", type=str, required=True, help="输出JSON文件路径")
+
+    args = parser.parse_args()
+
+    count = write_catalog(args.output, generate_catalog(args.count, seed=args.seed, full=args.full))
+    print(f"已生成 {count} 个合成产品到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -94,4 +94,370 @@ FOR EACH ROW EXECUTE PROCEDURE update_updated_at_column();
 
 CREATE TRIGGER update_milk_product_extra_details_updated_at
 BEFORE UPDATE ON milk_product_extra_details
-FOR EACH ROW EXECUTE PROCEDURE update_updated_at_column(); 
\ No newline at end of file
+FOR EACH ROW EXECUTE PROCEDURE update_updated_at_column(); 
+
+-- 全文检索：配料表与配方评价
+-- pg_trgm三元组GIN索引让 ILIKE '%乳铁蛋白%' 之类的子串查询可以走索引
+-- 注意：三元组对中文字符生效要求数据库的LC_CTYPE为UTF-8类区域(如官方镜像默认的en_US.utf8)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS idx_milk_product_details_ingredients_trgm
+            ON milk_product_details USING GIN (ingredients gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_milk_product_details_formula_evaluation_trgm
+            ON milk_product_details USING GIN (formula_evaluation gin_trgm_ops);
+    ELSE
+        RAISE NOTICE '未安装pg_trgm扩展，跳过三元组索引';
+    END IF;
+END
+$$;
+
+-- 中文分词全文检索(可选)：仅当数据库安装了zhparser扩展时创建
+-- 表达式需与 src/product_search.py 中的 FTS_DOCUMENT 保持一致
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'zhparser') THEN
+        CREATE EXTENSION IF NOT EXISTS zhparser;
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'chinese_zh') THEN
+            CREATE TEXT SEARCH CONFIGURATION chinese_zh (PARSER = zhparser);
+            ALTER TEXT SEARCH CONFIGURATION chinese_zh ADD MAPPING FOR n,v,a,i,e,l,j WITH simple;
+        END IF;
+        CREATE INDEX IF NOT EXISTS idx_milk_product_details_fts
+            ON milk_product_details USING GIN (
+                to_tsvector('chinese_zh', coalesce(ingredients, '') || ' ' || coalesce(formula_evaluation, ''))
+            );
+    ELSE
+        RAISE NOTICE '未安装zhparser扩展，跳过中文分词索引';
+    END IF;
+END
+$$;
+
+-- 配料字典表：规范化后的配料名称
+CREATE TABLE IF NOT EXISTS ingredients (
+    id SERIAL PRIMARY KEY,                   -- 自增主键
+    name VARCHAR(255) UNIQUE NOT NULL,       -- 规范化配料名称
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()   -- 创建时间
+);
+
+-- 产品配料关联表：由配料表文本分词得到的倒排索引
+CREATE TABLE IF NOT EXISTS product_ingredients (
+    product_id INTEGER NOT NULL,             -- 产品ID
+    ingredient_id INTEGER NOT NULL REFERENCES ingredients(id),  -- 配料ID
+    position SMALLINT NOT NULL,              -- 在配料表中的位置(从1开始，越靠前含量越高)
+    PRIMARY KEY (product_id, ingredient_id)
+);
+
+-- 配料表文本指纹：只为配料表发生变化的产品重建关联
+CREATE TABLE IF NOT EXISTS product_ingredient_sources (
+    product_id INTEGER PRIMARY KEY,          -- 产品ID
+    source_hash CHAR(32) NOT NULL,           -- 配料表原文的MD5
+    indexed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()   -- 最近一次建立索引的时间
+);
+
+-- 按配料查产品的集合运算只需扫描该索引(index-only scan)
+CREATE INDEX IF NOT EXISTS idx_product_ingredients_ingredient_product ON product_ingredients(ingredient_id, product_id);
+
+-- 产品宽表：每个产品一行，供看板等只读场景直接查询，免去四表联结
+-- 采用增量维护的普通表而非物化视图：导入后只刷新本次涉及的产品，且不会阻塞整表重载时的换表
+CREATE TABLE IF NOT EXISTS product_full (
+    product_id INTEGER PRIMARY KEY,          -- 产品ID
+    name VARCHAR(255) NOT NULL,              -- 产品名称
+    thumbnail TEXT,                          -- 缩略图URL
+    click_count INTEGER,                     -- 点击次数
+    price NUMERIC,                           -- 价格
+    tag INTEGER,                             -- 标签ID
+    tag_time BIGINT,                         -- 标签时间戳
+    brand VARCHAR(100),                      -- 品牌
+    series VARCHAR(100),                     -- 系列
+    origin VARCHAR(100),                     -- 产地
+    milk_source VARCHAR(100),                -- 奶源
+    age_range VARCHAR(100),                  -- 适用年龄
+    manufacturer VARCHAR(255),               -- 厂家
+    operator VARCHAR(255),                   -- 运营商
+    specification VARCHAR(100),              -- 规格
+    stage VARCHAR(50),                       -- 段位
+    reference_price VARCHAR(100),            -- 参考价
+    category VARCHAR(100),                   -- 类别
+    version VARCHAR(100),                    -- 版本
+    formula_registration VARCHAR(100),       -- 配方注册号
+    formula_evaluation TEXT,                 -- 配方评价
+    ingredients TEXT,                        -- 配料表
+    nutrients JSONB NOT NULL DEFAULT '{}',   -- 营养成分 {名称: {含量, 单位, 描述}}
+    extra_details JSONB NOT NULL DEFAULT '{}',  -- 额外详情 {键名: 值}
+    stage_number INTEGER,                    -- 从段位中提取的数字(如"3段"为3)
+    reference_price_value NUMERIC,           -- 从参考价中提取的数值
+    nutrient_names TEXT[] NOT NULL DEFAULT '{}',  -- 营养成分名称列表
+    source_updated_at TIMESTAMP WITHOUT TIME ZONE,  -- 源表中最近的更新时间
+    refreshed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()  -- 宽表刷新时间
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_full_brand_stage ON product_full(brand, stage_number);
+CREATE INDEX IF NOT EXISTS idx_product_full_nutrients ON product_full USING GIN (nutrients jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS idx_product_full_nutrient_names ON product_full USING GIN (nutrient_names);
+
+-- 刷新宽表：ids为NULL时刷新全部产品，否则只刷新指定产品；源表中已不存在的产品会被删除
+CREATE OR REPLACE FUNCTION refresh_product_full(ids INTEGER[] DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    affected INTEGER;
+BEGIN
+    DELETE FROM product_full f
+    WHERE (ids IS NULL OR f.product_id = ANY(ids))
+      AND NOT EXISTS (SELECT 1 FROM milk_products p WHERE p.product_id = f.product_id);
+
+    INSERT INTO product_full (
+        product_id, name, thumbnail, click_count, price, tag, tag_time,
+        brand, series, origin, milk_source, age_range, manufacturer, operator, specification,
+        stage, reference_price, category, version, formula_registration, formula_evaluation, ingredients,
+        nutrients, extra_details, stage_number, reference_price_value, nutrient_names,
+        source_updated_at, refreshed_at
+    )
+    SELECT p.product_id, p.name, p.thumbnail, p.click_count, p.price, p.tag, p.tag_time,
+           d.brand, d.series, d.origin, d.milk_source, d.age_range, d.manufacturer, d.operator, d.specification,
+           d.stage, d.reference_price, d.category, d.version, d.formula_registration, d.formula_evaluation, d.ingredients,
+           coalesce(n.nutrients, '{}'), coalesce(e.extra_details, '{}'),
+           substring(d.stage FROM '[0-9]+')::INTEGER,
+           substring(d.reference_price FROM '[0-9]+(?:\.[0-9]+)?')::NUMERIC,
+           coalesce(n.names, '{}'),
+           greatest(p.updated_at, d.updated_at, n.updated_at, e.updated_at),
+           NOW()
+    FROM milk_products p
+    LEFT JOIN milk_product_details d ON d.product_id = p.product_id
+    LEFT JOIN (
+        SELECT product_id,
+               jsonb_object_agg(nutrient_name, jsonb_build_object('含量', content, '单位', unit, '描述', description)) AS nutrients,
+               array_agg(nutrient_name::TEXT ORDER BY nutrient_name) AS names,
+               max(updated_at) AS updated_at
+        FROM milk_product_nutrients
+        WHERE ids IS NULL OR product_id = ANY(ids)
+        GROUP BY product_id
+    ) n ON n.product_id = p.product_id
+    LEFT JOIN (
+        SELECT product_id, jsonb_object_agg(key, value) AS extra_details, max(updated_at) AS updated_at
+        FROM milk_product_extra_details
+        WHERE ids IS NULL OR product_id = ANY(ids)
+        GROUP BY product_id
+    ) e ON e.product_id = p.product_id
+    WHERE ids IS NULL OR p.product_id = ANY(ids)
+    ON CONFLICT (product_id) DO UPDATE SET
+        name = EXCLUDED.name, thumbnail = EXCLUDED.thumbnail, click_count = EXCLUDED.click_count,
+        price = EXCLUDED.price, tag = EXCLUDED.tag, tag_time = EXCLUDED.tag_time,
+        brand = EXCLUDED.brand, series = EXCLUDED.series, origin = EXCLUDED.origin,
+        milk_source = EXCLUDED.milk_source, age_range = EXCLUDED.age_range,
+        manufacturer = EXCLUDED.manufacturer, operator = EXCLUDED.operator,
+        specification = EXCLUDED.specification, stage = EXCLUDED.stage,
+        reference_price = EXCLUDED.reference_price, category = EXCLUDED.category,
+        version = EXCLUDED.version, formula_registration = EXCLUDED.formula_registration,
+        formula_evaluation = EXCLUDED.formula_evaluation, ingredients = EXCLUDED.ingredients,
+        nutrients = EXCLUDED.nutrients, extra_details = EXCLUDED.extra_details,
+        stage_number = EXCLUDED.stage_number, reference_price_value = EXCLUDED.reference_price_value,
+        nutrient_names = EXCLUDED.nutrient_names, source_updated_at = EXCLUDED.source_updated_at,
+        refreshed_at = EXCLUDED.refreshed_at;
+
+    GET DIAGNOSTICS affected = ROW_COUNT;
+    RETURN affected;
+END;
+$$ LANGUAGE 'plpgsql';
+
+-- 已有数据的库首次创建宽表时全量填充
+SELECT refresh_product_full() WHERE NOT EXISTS (SELECT 1 FROM product_full);
+
+-- 导入批次：每次执行导入器记录一行
+CREATE TABLE IF NOT EXISTS import_runs (
+    id SERIAL PRIMARY KEY,                   -- 批次ID
+    mode VARCHAR(20) NOT NULL,               -- 导入模式 upsert/reload
+    source_file TEXT,                        -- 导入的JSON文件
+    status VARCHAR(20) NOT NULL DEFAULT 'running',  -- running/success/failed
+    inserted INTEGER,                        -- 新增产品数
+    updated INTEGER,                         -- 更新产品数
+    deleted INTEGER,                         -- 删除产品数
+    started_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),  -- 开始时间
+    finished_at TIMESTAMP WITHOUT TIME ZONE  -- 结束时间
+);
+
+-- 产品变更记录：同一批次中每个产品一行
+CREATE TABLE IF NOT EXISTS product_changes (
+    id BIGSERIAL PRIMARY KEY,                -- 变更ID，消费者据此作为游标
+    run_id INTEGER NOT NULL REFERENCES import_runs(id) ON DELETE CASCADE,  -- 导入批次
+    product_id INTEGER NOT NULL,             -- 产品ID
+    op CHAR(1) NOT NULL,                     -- I新增 / U更新 / D删除
+    changed_fields TEXT[] NOT NULL DEFAULT '{}',  -- 更新时变化的字段：列名、nutrients.<名称>、extra_details.<键名>
+    changed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),  -- 记录时间
+    UNIQUE (run_id, product_id)
+);
+
+-- 比较同一行的新旧版本，返回变化的字段名
+CREATE OR REPLACE FUNCTION product_change_fields(source_table TEXT, old_row JSONB, new_row JSONB)
+RETURNS TEXT[] AS $$
+    SELECT CASE
+        WHEN source_table = 'milk_product_nutrients' THEN
+            CASE WHEN (old_row - 'id' - 'created_at' - 'updated_at') IS DISTINCT FROM (new_row - 'id' - 'created_at' - 'updated_at')
+                 THEN ARRAY['nutrients.' || (coalesce(new_row, old_row)->>'nutrient_name')] ELSE '{}' END
+        WHEN source_table = 'milk_product_extra_details' THEN
+            CASE WHEN (old_row - 'id' - 'created_at' - 'updated_at') IS DISTINCT FROM (new_row - 'id' - 'created_at' - 'updated_at')
+                 THEN ARRAY['extra_details.' || (coalesce(new_row, old_row)->>'key')] ELSE '{}' END
+        ELSE coalesce((
+            SELECT array_agg(k ORDER BY k)
+            FROM jsonb_object_keys(coalesce(new_row, old_row)) AS k
+            WHERE k NOT IN ('id', 'product_id', 'created_at', 'updated_at', 'slice_hash')
+              AND (old_row -> k) IS DISTINCT FROM (new_row -> k)
+        ), '{}')
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 把(旧行, 新行)对聚合为每个产品一条变更并合并到product_changes
+-- %s 处填入返回 (old_row JSONB, new_row JSONB) 的查询；$1为批次ID，$2为源表名
+CREATE OR REPLACE FUNCTION product_changes_merge_sql()
+RETURNS TEXT AS $$
+    SELECT $sql$
+    INSERT INTO product_changes (run_id, product_id, op, changed_fields)
+    SELECT $1, product_id,
+           CASE WHEN bool_or(op = 'D') THEN 'D' WHEN bool_or(op = 'I') THEN 'I' ELSE 'U' END,
+           CASE WHEN bool_or(op <> 'U') THEN '{}'
+                ELSE coalesce(array_agg(DISTINCT field ORDER BY field) FILTER (WHERE field IS NOT NULL), '{}') END
+    FROM (
+        SELECT (coalesce(new_row, old_row)->>'product_id')::INTEGER AS product_id,
+               CASE WHEN $2 <> 'milk_products' THEN 'U'
+                    WHEN old_row IS NULL THEN 'I'
+                    WHEN new_row IS NULL THEN 'D'
+                    ELSE 'U' END AS op,
+               product_change_fields($2, old_row, new_row) AS fields
+        FROM (%s) AS pairs(old_row, new_row)
+    ) c
+    LEFT JOIN LATERAL unnest(c.fields) AS field ON TRUE
+    GROUP BY product_id
+    HAVING bool_or(op <> 'U') OR count(field) > 0
+    ON CONFLICT (run_id, product_id) DO UPDATE SET
+        op = CASE WHEN 'D' IN (product_changes.op, EXCLUDED.op) THEN 'D'
+                  WHEN 'I' IN (product_changes.op, EXCLUDED.op) THEN 'I'
+                  ELSE 'U' END,
+        changed_fields = CASE WHEN product_changes.op <> 'U' OR EXCLUDED.op <> 'U' THEN '{}'
+                              ELSE ARRAY(SELECT DISTINCT f FROM unnest(product_changes.changed_fields || EXCLUDED.changed_fields) AS f ORDER BY f) END
+    $sql$;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 记录由任意查询给出的(旧行, 新行)对，整表重载时用于比较影子表与线上表
+CREATE OR REPLACE FUNCTION record_product_changes(run INTEGER, source_table TEXT, pairs_sql TEXT)
+RETURNS VOID AS $$
+BEGIN
+    EXECUTE format(product_changes_merge_sql(), pairs_sql) USING run, source_table;
+END;
+$$ LANGUAGE 'plpgsql';
+
+-- 语句级触发器：导入器通过 SET nfzk.run_id 标明批次，未设置时不记录(如手工修改数据)
+CREATE OR REPLACE FUNCTION capture_product_changes()
+RETURNS TRIGGER AS $$
+DECLARE
+    run INTEGER := nullif(current_setting('nfzk.run_id', true), '')::INTEGER;
+    pairs TEXT;
+BEGIN
+    IF run IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        pairs := 'SELECT NULL::JSONB, to_jsonb(n) FROM new_rows n';
+    ELSIF TG_OP = 'UPDATE' THEN
+        pairs := 'SELECT to_jsonb(o), to_jsonb(n) FROM old_rows o JOIN new_rows n ON n.id = o.id';
+    ELSE
+        pairs := 'SELECT to_jsonb(o), NULL::JSONB FROM old_rows o';
+    END IF;
+
+    -- 转换表只在本函数的查询中可见，因此在此处直接执行合并语句
+    EXECUTE format(product_changes_merge_sql(), pairs) USING run, TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE 'plpgsql';
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['milk_products', 'milk_product_details', 'milk_product_nutrients', 'milk_product_extra_details'] LOOP
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'capture_' || t || '_insert') THEN
+            EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+                           'FOR EACH STATEMENT EXECUTE PROCEDURE capture_product_changes()', 'capture_' || t || '_insert', t);
+            EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                           'FOR EACH STATEMENT EXECUTE PROCEDURE capture_product_changes()', 'capture_' || t || '_update', t);
+            EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                           'FOR EACH STATEMENT EXECUTE PROCEDURE capture_product_changes()', 'capture_' || t || '_delete', t);
+        END IF;
+    END LOOP;
+END
+$$;
+
+-- 图片资源：按URL去重，文件按内容SHA-256寻址存放，相同内容只保存一份
+CREATE TABLE IF NOT EXISTS image_assets (
+    url TEXT PRIMARY KEY,                    -- 图片URL
+    sha256 CHAR(64),                         -- 内容SHA-256
+    local_path TEXT,                         -- 原图本地路径(相对图片目录)
+    variants JSONB NOT NULL DEFAULT '{}',    -- 缩放变体 {最长边像素: 本地路径}
+    content_type VARCHAR(100),               -- 内容类型
+    size_bytes INTEGER,                      -- 原图字节数
+    etag TEXT,                               -- 服务器返回的ETag，用于条件请求
+    last_modified TEXT,                      -- 服务器返回的Last-Modified，用于条件请求
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- ok/failed/pending
+    error TEXT,                              -- 最近一次失败原因
+    fetched_at TIMESTAMP WITHOUT TIME ZONE,  -- 最近一次下载到新内容的时间
+    checked_at TIMESTAMP WITHOUT TIME ZONE   -- 最近一次检查的时间
+);
+
+-- 产品图片：产品的缩略图和图标分别对应的图片URL
+CREATE TABLE IF NOT EXISTS product_images (
+    product_id INTEGER NOT NULL,             -- 产品ID
+    kind VARCHAR(20) NOT NULL,               -- thumbnail/icon
+    url TEXT NOT NULL,                       -- 图片URL，关联image_assets
+    PRIMARY KEY (product_id, kind)
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_assets_sha256 ON image_assets(sha256);
+
+-- 产品重新爬取的观测记录：每次检查(列表比对tag_time或按计划重新爬取)后更新，用于估计产品的变更频率
+CREATE TABLE IF NOT EXISTS product_crawl_state (
+    product_id INTEGER PRIMARY KEY,          -- 产品ID
+    first_checked_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),  -- 首次检查时间
+    last_checked_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),   -- 最近一次检查时间
+    last_changed_at TIMESTAMP WITHOUT TIME ZONE,                          -- 最近一次发现变化的时间
+    checks INTEGER NOT NULL DEFAULT 0,       -- 首次检查之后的检查次数(即观测区间数)
+    changes INTEGER NOT NULL DEFAULT 0       -- 其中发现变化的次数
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_crawl_state_last_checked ON product_crawl_state(last_checked_at);
+
+-- 滚动分片爬取的进度：产品按ID哈希分片，每次运行刷新最久未刷新的一片
+CREATE TABLE IF NOT EXISTS crawl_slice_progress (
+    slice_count INTEGER NOT NULL,            -- 分片总数，改变分片数即开始新一轮
+    slice_index INTEGER NOT NULL,            -- 分片序号(0 ~ slice_count-1)
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- pending/running/done/failed
+    products INTEGER,                        -- 最近一次刷新的产品数
+    started_at TIMESTAMP WITHOUT TIME ZONE,  -- 最近一次开始刷新的时间
+    finished_at TIMESTAMP WITHOUT TIME ZONE, -- 最近一次成功刷新的时间
+    PRIMARY KEY (slice_count, slice_index)
+);
+
+-- 产品ID十进制字符串的CRC32，与Python的zlib.crc32(str(product_id).encode())一致
+CREATE OR REPLACE FUNCTION crawl_slice_hash(pid INTEGER)
+RETURNS BIGINT AS $$
+DECLARE
+    crc BIGINT := 4294967295;
+    bytes BYTEA := convert_to(pid::TEXT, 'UTF8');
+BEGIN
+    FOR i IN 0 .. length(bytes) - 1 LOOP
+        crc := crc # get_byte(bytes, i);
+        FOR bit IN 1 .. 8 LOOP
+            IF crc & 1 = 1 THEN
+                crc := (crc >> 1) # 3988292384;  -- 0xEDB88320
+            ELSE
+                crc := crc >> 1;
+            END IF;
+        END LOOP;
+    END LOOP;
+    RETURN crc # 4294967295;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+-- 分片哈希：插入时计算一次，分片i对应哈希的一段连续区间，每次运行按索引只读取自己的分片
+ALTER TABLE milk_products
+    ADD COLUMN IF NOT EXISTS slice_hash BIGINT GENERATED ALWAYS AS (crawl_slice_hash(product_id)) STORED;
+CREATE INDEX IF NOT EXISTS idx_milk_products_slice_hash ON milk_products(slice_hash);
@@ -24,6 +24,11 @@ else
     fi
 fi
 
+# cron把命令中未转义的%当作换行，写入crontab的值(如请求日志路径中的strftime格式)需转义
+cron_escape() {
+    printf '%s' "${1//%/\\%}"
+}
+
 # 创建cron任务
 echo "配置定时爬虫任务..."
 CONFIG_PARAM=""
@@ -31,7 +36,7 @@ if [ -f "$CONFIG_FILE" ]; then
     CONFIG_PARAM="--config $CONFIG_FILE"
 fi
 
-echo "${CRON_SCHEDULE:-0 2 * * 0} cd /app && /usr/local/bin/python src/scheduled_crawler.py --check-updates --output ${CRAWLER_OUTPUT_DIR:-/app/data} --skip-existing --max-pages ${CRAWLER_MAX_PAGES:-0} --min-delay ${CRAWLER_MIN_DELAY:-2.0} --max-delay ${CRAWLER_MAX_DELAY:-5.0} --db-host ${DB_HOST:-postgres} --db-port ${DB_PORT:-5432} --db-name ${DB_NAME:-milk_products} --db-user ${DB_USER:-postgres} --db-password ${DB_PASSWORD:-postgres} $CONFIG_PARAM >> /app/logs/cron_crawler.log 2>&1" > /etc/cron.d/crawler-cron
+echo "${CRON_SCHEDULE:-0 2 * * 0} cd /app && NFZK_PROFILE=$(cron_escape "${NFZK_PROFILE:-}") NFZK_REQUEST_LOG=$(cron_escape "${NFZK_REQUEST_LOG:-}") NFZK_STATUS_FILE=$(cron_escape "${NFZK_STATUS_FILE:-}") /usr/local/bin/python src/scheduled_crawler.py --check-updates --output ${CRAWLER_OUTPUT_DIR:-/app/data} --skip-existing --max-pages ${CRAWLER_MAX_PAGES:-0} --min-delay ${CRAWLER_MIN_DELAY:-2.0} --max-delay ${CRAWLER_MAX_DELAY:-5.0} --db-host ${DB_HOST:-postgres} --db-port ${DB_PORT:-5432} --db-name ${DB_NAME:-milk_products} --db-user ${DB_USER:-postgres} --db-password ${DB_PASSWORD:-postgres} --slices ${CRAWL_SLICES:-0} --slice-listing-pages ${CRAWL_SLICE_LISTING_PAGES:-2} --stop-after-unchanged ${CRAWL_STOP_AFTER_UNCHANGED:-0} $CONFIG_PARAM >> /app/logs/cron_crawler.log 2>&1" > /etc/cron.d/crawler-cron
 chmod 0644 /etc/cron.d/crawler-cron
 crontab /etc/cron.d/crawler-cron
 
@@ -41,7 +46,14 @@ crontab -l
 echo "================================"
 
 echo "当前使用的配置："
+echo "- 运行方式: ${CRAWLER_MODE:-cron}"
 echo "- 定时计划: ${CRON_SCHEDULE:-0 2 * * 0}"
+echo "- 滚动分片: ${CRAWL_SLICES:-0}"
+echo "- 分片模式列表页数: ${CRAWL_SLICE_LISTING_PAGES:-2}"
+echo "- 列表提前结束: ${CRAWL_STOP_AFTER_UNCHANGED:-0}"
+echo "- 性能分析: ${NFZK_PROFILE:-不分析}"
+echo "- 请求日志: ${NFZK_REQUEST_LOG:-logs/requests_%Y%m%d.jsonl}"
+echo "- 运行状态: ${NFZK_STATUS_FILE:-logs/run_status.json}"
 echo "- 输出目录: ${CRAWLER_OUTPUT_DIR:-/app/data}"
 echo "- 最大页数: ${CRAWLER_MAX_PAGES:-0}"
 echo "- 延迟范围: ${CRAWLER_MIN_DELAY:-2.0}秒 ~ ${CRAWLER_MAX_DELAY:-5.0}秒"
@@ -55,8 +67,13 @@ echo "容器已完成初始化，可通过以下命令手动执行爬虫:"
 echo "/usr/local/bin/python src/scheduled_crawler.py --check-updates --output /app/data --db-host postgres $CONFIG_PARAM"
 echo ""
 
-# 如果传入了命令，则执行该命令，否则启动cron服务
-if [ $# -eq 0 ]; then
+# 如果传入了命令，则执行该命令；CRAWLER_MODE=daemon时启动常驻爬虫进程，否则启动cron服务
+if [ $# -eq 0 ] && [ "${CRAWLER_MODE:-cron}" = "daemon" ]; then
+    echo "启动常驻爬虫进程..."
+    crontab -r || true
+    cd /app
+    exec /usr/local/bin/python src/scheduled_crawler.py --daemon --schedule "${CRON_SCHEDULE:-0 2 * * 0}" --check-updates --output ${CRAWLER_OUTPUT_DIR:-/app/data} --skip-existing --max-pages ${CRAWLER_MAX_PAGES:-0} --min-delay ${CRAWLER_MIN_DELAY:-2.0} --max-delay ${CRAWLER_MAX_DELAY:-5.0} --db-host ${DB_HOST:-postgres} --db-port ${DB_PORT:-5432} --db-name ${DB_NAME:-milk_products} --db-user ${DB_USER:-postgres} --db-password ${DB_PASSWORD:-postgres} --slices ${CRAWL_SLICES:-0} --slice-listing-pages ${CRAWL_SLICE_LISTING_PAGES:-2} --stop-after-unchanged ${CRAWL_STOP_AFTER_UNCHANGED:-0} $CONFIG_PARAM
+elif [ $# -eq 0 ]; then
     echo "启动cron服务..."
     cron -f
 else
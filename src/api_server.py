@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import decimal
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import extras, pool
+from aiohttp import web
+
+from db_import import CHANGES_CHANNEL
+
+# 列表接口返回的字段，详情接口返回product_full的全部字段
+LIST_COLUMNS = "product_id, name, thumbnail, price, brand, series, origin, stage, stage_number, reference_price_value"
+
+# 列表过滤参数：(查询参数, SQL条件, 类型转换)
+LIST_FILTERS = [
+    ('brand', "brand = %s", str),
+    ('stage', "stage_number = %s", int),
+    ('origin', "origin = %s", str),
+    ('min_price', "price >= %s", decimal.Decimal),
+    ('max_price', "price <= %s", decimal.Decimal),
+    ('nutrient', "nutrient_names @> ARRAY[%s]::text[]", str),
+]
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+
+# 监听连接断开后重连的等待时间(秒)，每次失败加倍直到上限
+LISTEN_RETRY_DELAY = 1.0
+LISTEN_RETRY_MAX_DELAY = 60.0
+
+
+def json_default(value):
+    """JSON序列化数据库中的Decimal和时间类型"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def etag_matches(if_none_match, etag):
+    """
+    If-None-Match是否匹配ETag：逗号分隔的列表逐个完整比较，按弱比较忽略W/前缀，*匹配任何存在的资源
+    参数:
+        if_none_match: If-None-Match请求头
+        etag: 当前响应的强ETag(带引号)
+    """
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """进程内响应缓存：按最近最少使用淘汰，条目超过TTL后失效"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        """
+        初始化响应缓存
+        参数:
+            max_entries: 最多缓存的响应数
+            ttl: 条目有效期(秒)，导入器提交新批次时会提前整体清空
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # 每次清空加一，查询期间缓存被清空时不写入旧结果
+        self.generation = 0
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回None"""
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value, generation):
+        """写入缓存，超出容量时淘汰最久未使用的条目；generation为开始查询时的缓存代数"""
+        if generation != self.generation:
+            return
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        self.entries.clear()
+        self.generation += 1
+
+
+class ProductApiServer:
+    """产品只读API：基于product_full宽表提供产品查询、过滤列表和营养成分查询"""
+
+    def __init__(self, host="localhost", port=5432, dbname="milk_products",
+                 user="postgres", password="postgres", pool_size=10,
+                 cache_entries=1024, cache_ttl=300):
+        """
+        初始化API服务
+        参数:
+            host: 数据库主机
+            port: 数据库端口
+            dbname: 数据库名称
+            user: 数据库用户
+            password: 数据库密码
+            pool_size: 数据库连接池大小，同时也是执行查询的线程数
+            cache_entries: 响应缓存最多条目数，为0时不缓存
+            cache_ttl: 响应缓存有效期(秒)
+        """
+        self.logger = logging.getLogger("ProductApiServer")
+        self.db_params = dict(host=host, port=port, dbname=dbname, user=user, password=password)
+        self.pool_size = pool_size
+        self.cache = ResponseCache(cache_entries, cache_ttl) if cache_entries > 0 else None
+        self.pool = None
+        self.executor = None
+        self.listen_conn = None
+        self.listen_fd = None
+        self.reconnect_task = None
+
+    def create_app(self):
+        """创建aiohttp应用"""
+        app = web.Application()
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/products', self.handle_list)
+        app.router.add_get('/products/{product_id:\\d+}', self.handle_product)
+        app.router.add_get('/products/{product_id:\\d+}/nutrients', self.handle_product_nutrients)
+        app.router.add_get('/nutrients/{name}/products', self.handle_nutrient_products)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+    async def on_startup(self, app):
+        """创建连接池并监听导入器的变更通知"""
+        self.pool = pool.ThreadedConnectionPool(1, self.pool_size, **self.db_params)
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="db")
+
+        if self.cache is not None:
+            self.start_listener(psycopg2.connect(**self.db_params))
+
+        self.logger.info(f"API服务已启动，连接池大小 {self.pool_size}")
+
+    async def on_cleanup(self, app):
+        """关闭连接池和监听连接"""
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+        self.stop_listener()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.pool is not None:
+            self.pool.closeall()
+
+    def start_listener(self, conn):
+        """在新连接上监听变更通知，并在事件循环中等待通知到达"""
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANGES_CHANNEL}")
+        self.listen_conn = conn
+        # 连接关闭后fileno()不可用，保存描述符以便移除读回调
+        self.listen_fd = conn.fileno()
+        asyncio.get_running_loop().add_reader(self.listen_fd, self.on_notify)
+
+    def stop_listener(self):
+        """移除读回调并关闭监听连接"""
+        if self.listen_conn is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.listen_fd)
+        try:
+            self.listen_conn.close()
+        except psycopg2.Error:
+            pass
+        self.listen_conn = None
+
+    def on_notify(self):
+        """导入批次结束后清空响应缓存；监听连接断开时转入后台重连"""
+        try:
+            self.listen_conn.poll()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            self.logger.error(f"变更通知的监听连接已断开: {e}")
+            self.stop_listener()
+            # 断开期间可能错过通知，清空缓存，重连前的响应最多缓存TTL秒
+            self.cache.clear()
+            self.reconnect_task = asyncio.get_running_loop().create_task(self.reconnect_listener())
+            return
+        if self.listen_conn.notifies:
+            run_ids = [n.payload for n in self.listen_conn.notifies]
+            self.listen_conn.notifies.clear()
+            self.cache.clear()
+            self.logger.info(f"收到导入批次 {', '.join(run_ids)} 的变更通知，已清空响应缓存")
+
+    async def reconnect_listener(self):
+        """按指数退避重新建立监听连接，成功后清空断开期间可能过期的缓存"""
+        delay = LISTEN_RETRY_DELAY
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                conn = await loop.run_in_executor(self.executor, lambda: psycopg2.connect(**self.db_params))
+                self.start_listener(conn)
+            except psycopg2.Error as e:
+                delay = min(delay * 2, LISTEN_RETRY_MAX_DELAY)
+                self.logger.warning(f"重新连接变更通知失败: {e}，{delay:.0f} 秒后重试")
+                continue
+            self.cache.clear()
+            self.reconnect_task = None
+            self.logger.info("已重新监听变更通知")
+            return
+
+    def _query(self, sql, params):
+        """在工作线程中借用连接执行只读查询"""
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+                cur.execute(sql, params)
+                return [dict(row) for row in cur.fetchall()]
+        finally:
+            conn.rollback()
+            self.pool.putconn(conn)
+
+    async def query(self, sql, params=()):
+        """异步执行只读查询"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._query, sql, params)
+
+    async def respond(self, request, build):
+        """
+        以缓存和ETag包装响应
+        参数:
+            request: aiohttp请求
+            build: 生成响应数据的协程函数，返回None表示404
+        """
+        key = request.path_qs
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is None:
+            generation = self.cache.generation if self.cache is not None else 0
+            payload = await build()
+            if payload is None:
+                raise web.HTTPNotFound(text=json.dumps({'error': '未找到'}, ensure_ascii=False),
+                                       content_type='application/json')
+            body = json.dumps(payload, ensure_ascii=False, default=json_default).encode('utf-8')
+            cached = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+            if self.cache is not None:
+                self.cache.put(key, cached, generation)
+            cache_state = 'MISS'
+        else:
+            cache_state = 'HIT'
+
+        etag, body = cached
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Cache': cache_state}
+        if etag_matches(request.headers.get('If-None-Match', ''), etag):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type='application/json', charset='utf-8', headers=headers)
+
+    @staticmethod
+    def parse_limit(request):
+        """解析分页参数：limit和after(上一页最后一个产品ID)"""
+        try:
+            limit = min(max(int(request.query.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+            after = int(request.query.get('after', 0))
+        except ValueError:
+            raise web.HTTPBadRequest(text="limit和after必须是整数")
+        return limit, after
+
+    @staticmethod
+    def page(items, limit):
+        """组装分页结果，多取的一行用于判断是否还有下一页"""
+        has_more = len(items) > limit
+        items = items[:limit]
+        return {
+            'items': items,
+            'next_after': items[-1]['product_id'] if has_more else None,
+        }
+
+    async def handle_health(self, request):
+        """健康检查"""
+        await self.query("SELECT 1")
+        stats = {'status': 'ok'}
+        if self.cache is not None:
+            stats.update(cache_entries=len(self.cache.entries), cache_hits=self.cache.hits,
+                         cache_misses=self.cache.misses)
+        return web.json_response(stats)
+
+    async def handle_product(self, request):
+        """GET /products/{product_id}：单个产品的完整信息"""
+        product_id = int(request.match_info['product_id'])
+
+        async def build():
+            rows = await self.query("SELECT * FROM product_full WHERE product_id = %s", (product_id,))
+            return rows[0] if rows else None
+
+        return await self.respond(request, build)
+
+    async def handle_product_nutrients(self, request):
+        """GET /products/{product_id}/nutrients：单个产品的营养成分"""
+        product_id = int(request.match_info['product_id'])
+
+        async def build():
+            rows = await self.query("SELECT product_id, name, nutrients FROM product_full WHERE product_id = %s",
+                                    (product_id,))
+            return rows[0] if rows else None
+
+        return await self.respond(request, build)
+
+    async def handle_list(self, request):
+        """GET /products?brand=&stage=&origin=&min_price=&max_price=&nutrient=&limit=&after=：按条件过滤的产品列表"""
+        limit, after = self.parse_limit(request)
+        conditions = ["product_id > %s"]
+        params = [after]
+        for name, condition, convert in LIST_FILTERS:
+            if name in request.query:
+                try:
+                    params.append(convert(request.query[name]))
+                except (ValueError, decimal.InvalidOperation):
+                    raise web.HTTPBadRequest(text=f"参数 {name} 的格式不正确")
+                conditions.append(condition)
+        params.append(limit + 1)
+
+        async def build():
+            rows = await self.query(
+                f"SELECT {LIST_COLUMNS} FROM product_full WHERE {' AND '.join(conditions)} "
+                f"ORDER BY product_id LIMIT %s",
+                params
+            )
+            return self.page(rows, limit)
+
+        return await self.respond(request, build)
+
+    async def handle_nutrient_products(self, request):
+        """GET /nutrients/{name}/products?limit=&after=：含有某营养成分的产品及其含量"""
+        name = request.match_info['name']
+        limit, after = self.parse_limit(request)
+
+        async def build():
+            rows = await self.query(
+                """
+                SELECT product_id, name, brand, stage, nutrients -> %s AS nutrient
+                FROM product_full
+                WHERE nutrient_names @> ARRAY[%s]::text[] AND product_id > %s
+                ORDER BY product_id
+                LIMIT %s
+                """,
+                (name, name, after, limit + 1)
+            )
+            return self.page(rows, limit)
+
+        return await self.respond(request, build)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="奶粉产品只读API服务")
+    parser.add_argument("--listen", type=str, default="0.0.0.0", help="监听地址，默认为0.0.0.0")
+    parser.add_argument("--listen-port", type=int, default=8080, help="监听端口，默认为8080")
+    parser.add_argument("--pool-size", type=int, default=10, help="数据库连接池大小，默认为10")
+    parser.add_argument("--cache-entries", type=int, default=1024, help="响应缓存条目数，为0时关闭缓存，默认为1024")
+    parser.add_argument("--cache-ttl", type=int, default=300, help="响应缓存有效期(秒)，默认为300")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    server = ProductApiServer(
+        host=args.host,
+        port=args.port,
+        dbname=args.dbname,
+        user=args.user,
+        password=args.password,
+        pool_size=args.pool_size,
+        cache_entries=args.cache_entries,
+        cache_ttl=args.cache_ttl
+    )
+    web.run_app(server.create_app(), host=args.listen, port=args.listen_port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import logging
+import select
+import psycopg2
+from psycopg2 import extras
+
+from db_import import CHANGES_CHANNEL
+
+
+class ChangeFeed:
+    """产品变更订阅：按游标读取已结束批次的变更，并通过LISTEN等待新批次"""
+
+    def __init__(self, host="localhost", port=5432, dbname="milk_products",
+                 user="postgres", password="postgres", conn=None):
+        """
+        初始化变更订阅
+        参数:
+            host: 数据库主机
+            port: 数据库端口
+            dbname: 数据库名称
+            user: 数据库用户
+            password: 数据库密码
+            conn: 已有的数据库连接，提供时不再新建连接
+        """
+        self.logger = logging.getLogger("ChangeFeed")
+        self.own_conn = conn is None
+        self.conn = conn or psycopg2.connect(
+            host=host,
+            port=port,
+            dbname=dbname,
+            user=user,
+            password=password
+        )
+        self.listening = False
+
+    def close(self):
+        """关闭数据库连接(仅关闭自行创建的连接)"""
+        if self.own_conn and self.conn:
+            self.conn.close()
+
+    def changes_since(self, cursor=0, limit=1000):
+        """
+        读取游标之后的变更，只返回已结束批次的记录
+        参数:
+            cursor: 上次处理到的变更ID，从头读取时为0
+            limit: 最多返回的记录数
+        返回:
+            变更字典列表，每项包含id、run_id、product_id、op、changed_fields、changed_at
+        """
+        try:
+            with self.conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+                cur.execute(
+                    """
+                    SELECT c.id, c.run_id, c.product_id, c.op, c.changed_fields, c.changed_at
+                    FROM product_changes c
+                    JOIN import_runs r ON r.id = c.run_id
+                    WHERE c.id > %s AND r.finished_at IS NOT NULL
+                    ORDER BY c.id
+                    LIMIT %s
+                    """,
+                    (cursor, limit)
+                )
+                return [dict(row) for row in cur.fetchall()]
+        finally:
+            self.conn.rollback()
+
+    def stream(self, cursor=0, batch_size=1000):
+        """
+        逐条产出游标之后的全部变更
+        参数:
+            cursor: 上次处理到的变更ID
+            batch_size: 每次查询的记录数
+        """
+        while True:
+            rows = self.changes_since(cursor, batch_size)
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                return
+            cursor = rows[-1]['id']
+
+    def wait(self, timeout=None):
+        """
+        等待导入器的变更通知
+        参数:
+            timeout: 最长等待秒数，None表示一直等待
+        返回:
+            收到通知的批次ID列表，超时返回空列表
+        """
+        if not self.listening:
+            self.conn.autocommit = True
+            with self.conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANGES_CHANNEL}")
+            self.listening = True
+
+        if not self.conn.notifies:
+            if select.select([self.conn], [], [], timeout) == ([], [], []):
+                return []
+            self.conn.poll()
+
+        run_ids = [int(n.payload) for n in self.conn.notifies if n.payload.isdigit()]
+        self.conn.notifies.clear()
+        return run_ids
+
+    def follow(self, cursor=0, batch_size=1000, timeout=None):
+        """
+        持续产出变更：先追上游标之后的历史变更，再在每次收到通知后读取新变更
+        参数:
+            cursor: 起始变更ID
+            batch_size: 每次查询的记录数
+            timeout: 每次等待通知的最长秒数，超时后也会重新查询一次
+        """
+        # 先开始监听再读取历史，避免两者之间提交的批次被漏掉
+        self.wait(timeout=0)
+        while True:
+            for row in self.stream(cursor, batch_size):
+                cursor = row['id']
+                yield row
+            self.wait(timeout)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="产品变更订阅：输出游标之后新增、更新和删除的产品")
+    parser.add_argument("--since", type=int, default=0, help="起始游标(上次处理到的变更ID)，默认为0即从头读取")
+    parser.add_argument("--follow", action="store_true", help="输出历史变更后继续等待新的导入批次")
+    parser.add_argument("--json", action="store_true", help="以JSON行格式输出")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    feed = ChangeFeed(
+        host=args.host,
+        port=args.port,
+        dbname=args.dbname,
+        user=args.user,
+        password=args.password
+    )
+
+    changes = feed.follow(args.since) if args.follow else feed.stream(args.since)
+    cursor = args.since
+    try:
+        for row in changes:
+            cursor = row['id']
+            if args.json:
+                print(json.dumps(row, ensure_ascii=False, default=str), flush=True)
+            else:
+                fields = ','.join(row['changed_fields'])
+                print(f"{row['id']}\t批次{row['run_id']}\t{row['op']}\t{row['product_id']}\t{fields}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        feed.close()
+        print(f"# 游标: {cursor}")
+
+
+if __name__ == "__main__":
+    main()
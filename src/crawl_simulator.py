@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import json
+import heapq
+import random
+import argparse
+import statistics
+from collections import defaultdict, deque
+
+from request_log import read_records
+
+# 各类请求的爬取循环与爬虫中一致的默认设置：
+#   delay_range: 相邻两个项目之间的随机延迟(秒)，列表爬虫为page_delay*(1+random())即(1, 2)
+#   extra_every: 每隔多少个项目额外等待1~3秒
+#   retries: 每个项目的最多尝试次数(爬虫的retry_count)
+#   retry_delay: 第n次失败后等待retry_delay*n*(1+random())秒再重试
+KIND_DEFAULTS = {
+    'listing': {'delay_range': (1.0, 2.0), 'extra_every': 5, 'retries': 5, 'retry_delay': 3.0},
+    'detail': {'delay_range': (1.0, 3.0), 'extra_every': 10, 'retries': 3, 'retry_delay': 2.0},
+    'more_detail': {'delay_range': (1.0, 3.0), 'extra_every': 10, 'retries': 3, 'retry_delay': 3.0},
+}
+
+# 延迟可由爬虫和定时任务的--min-delay/--max-delay设置的阶段；列表爬虫的页间延迟(page_delay)不能通过命令行设置，结果仅供参考
+TUNABLE_KINDS = ('detail', 'more_detail')
+
+# 计算请求速率的滑动窗口(秒)，速率以每分钟请求数表示
+RATE_WINDOW = 60.0
+# 按速率分组统计失败率时每组的宽度(次/分)和可信所需的最少样本数
+RATE_BUCKET = 10
+MIN_BUCKET_SAMPLES = 30
+
+# 网站确认项目不存在，爬虫不再重试
+TERMINAL_STATUSES = (404,)
+TERMINAL_OUTCOMES = ('not_found', 'unknown_error')
+
+
+class CrawlSettings:
+    """一组候选设置"""
+
+    def __init__(self, min_delay, max_delay, retries, concurrency=1):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.retries = retries
+        self.concurrency = concurrency
+
+    def as_dict(self):
+        return {'min_delay': self.min_delay, 'max_delay': self.max_delay,
+                'retries': self.retries, 'concurrency': self.concurrency}
+
+    def __eq__(self, other):
+        return isinstance(other, CrawlSettings) and self.as_dict() == other.as_dict()
+
+    def __hash__(self):
+        return hash(tuple(self.as_dict().values()))
+
+
+class RequestModel:
+    """由请求日志得到的一类请求的模型：成功/失败的延迟分布、失败率与请求速率的关系、重试时的失败率"""
+
+    def __init__(self, kind, records):
+        """
+        初始化
+        参数:
+            kind: 请求类型(listing/detail/more_detail)
+            records: 该类型的请求记录
+        """
+        self.kind = kind
+        self.ok_seconds = []
+        self.fail_seconds = []
+        # {速率分组: [失败数, 请求数]}
+        self.buckets = defaultdict(lambda: [0, 0])
+        first_fail, first_total, retry_fail, retry_total = 0, 0, 0, 0
+
+        runs = defaultdict(list)
+        for record in records:
+            runs[record.get('run', '')].append(record)
+        self.observed = None
+        self.max_rate = 0
+        for run_id, items in runs.items():
+            # 记录时间为请求结束时间，减去耗时得到开始时间
+            items.sort(key=lambda r: r['ts'] - r['ms'] / 1000)
+            window = deque()
+            for record in items:
+                start = record['ts'] - record['ms'] / 1000
+                while window and window[0] <= start - RATE_WINDOW:
+                    window.popleft()
+                rate = len(window)
+                window.append(start)
+                self.max_rate = max(self.max_rate, rate)
+
+                seconds = record['ms'] / 1000
+                failed = self.is_failure(record)
+                (self.fail_seconds if failed else self.ok_seconds).append(seconds)
+                bucket = self.buckets[int(rate // RATE_BUCKET)]
+                bucket[0] += failed
+                bucket[1] += 1
+                if record.get('attempt', 0) > 0:
+                    retry_fail += failed
+                    retry_total += 1
+                else:
+                    first_fail += failed
+                    first_total += 1
+
+            # 请求最多的一次运行作为校准模拟的观测值
+            if self.observed is None or len(items) > self.observed['requests']:
+                first_start = items[0]['ts'] - items[0]['ms'] / 1000
+                self.observed = {
+                    'run': run_id,
+                    'requests': len(items),
+                    'items': len({r.get('id') for r in items}),
+                    'wall_seconds': round(max(r['ts'] for r in items) - first_start, 1),
+                    'failed_requests': sum(1 for r in items if self.is_failure(r)),
+                }
+
+        total = first_total + retry_total
+        self.requests = total
+        self.fail_rate = (first_fail + retry_fail) / total if total else 0.0
+        # 重试时的失败率相对于整体失败率的倍数：失败常常成串出现(如网站短暂不可用)，重试更可能再次失败
+        first_rate = first_fail / first_total if first_total else 0.0
+        retry_rate = retry_fail / retry_total if retry_total >= MIN_BUCKET_SAMPLES else None
+        self.retry_lift = retry_rate / first_rate if retry_rate is not None and first_rate > 0 else 1.0
+        self.first_rate = first_rate
+
+        # 各速率分组的失败率：样本不足的分组沿用低速率方向最近的可信分组，没有则用首次尝试的整体失败率
+        self.rate_probability = []
+        probability = first_rate
+        for index in range(int(self.max_rate // RATE_BUCKET) + 1):
+            fails, total = self.buckets.get(index, (0, 0))
+            if total >= MIN_BUCKET_SAMPLES:
+                probability = fails / total
+            self.rate_probability.append(probability)
+
+    @staticmethod
+    def is_failure(record):
+        return (record['outcome'] != 'ok' and record['status'] not in TERMINAL_STATUSES
+                and record['outcome'] not in TERMINAL_OUTCOMES)
+
+    def failure_probability(self, rate, attempt):
+        """
+        按当前请求速率和尝试次数得到失败概率
+        参数:
+            rate: 最近RATE_WINDOW秒内的请求数
+            attempt: 第几次尝试(从0开始)
+        返回:
+            (失败概率, 速率是否超出日志中观测到的范围)
+        """
+        extrapolated = rate > self.max_rate
+        probability = self.rate_probability[int(min(rate, self.max_rate) // RATE_BUCKET)]
+        if attempt > 0:
+            probability *= self.retry_lift
+        return min(probability, 1.0), extrapolated
+
+    def sample_seconds(self, rng, failed):
+        values = self.fail_seconds if failed and self.fail_seconds else self.ok_seconds or self.fail_seconds
+        return rng.choice(values) if values else 0.0
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'failure_rate': round(self.fail_rate, 4),
+            'retry_failure_lift': round(self.retry_lift, 2),
+            'max_observed_rate_per_minute': self.max_rate,
+            'ok_p50_ms': round(statistics.median(self.ok_seconds) * 1000, 1) if self.ok_seconds else None,
+            'observed': self.observed,
+        }
+
+
+def simulate(model, settings, items, seed=0, extra_every=10, retry_delay=2.0):
+    """
+    在虚拟时间中重放爬取循环：concurrency个爬虫各自依次处理项目，项目之间按设置随机延迟，失败后按爬虫的退避公式重试
+    参数:
+        model: 请求模型
+        settings: 候选设置
+        items: 项目数(产品数或页数)
+        seed: 随机种子
+        extra_every: 每隔多少个项目额外等待1~3秒
+        retry_delay: 重试等待的基数(秒)
+    返回:
+        模拟结果字典
+    """
+    rng = random.Random(seed)
+    # 事件: (开始时间, 爬虫序号, 该爬虫处理的第几个项目, 第几次尝试)
+    events = []
+    next_item = 0
+    for worker in range(min(settings.concurrency, items)):
+        heapq.heappush(events, (0.0, worker, 0, 0))
+        next_item += 1
+
+    window = deque()
+    requests = failed_requests = retried = failed_items = extrapolated = 0
+    peak_rate = 0
+    wall = 0.0
+    while events:
+        start, worker, index, attempt = heapq.heappop(events)
+        while window and window[0] <= start - RATE_WINDOW:
+            window.popleft()
+        rate = len(window)
+        window.append(start)
+        peak_rate = max(peak_rate, rate + 1)
+
+        probability, beyond = model.failure_probability(rate, attempt)
+        failed = rng.random() < probability
+        end = start + model.sample_seconds(rng, failed)
+        wall = max(wall, end)
+        requests += 1
+        retried += attempt > 0
+        failed_requests += failed
+        extrapolated += beyond
+
+        if failed and attempt < settings.retries - 1:
+            wait = retry_delay * (attempt + 1) * (1 + rng.random())
+            heapq.heappush(events, (end + wait, worker, index, attempt + 1))
+            continue
+        failed_items += failed
+        if next_item < items:
+            next_item += 1
+            delay = rng.uniform(settings.min_delay, settings.max_delay)
+            if (index + 1) % extra_every == 0:
+                delay += rng.uniform(1, 3)
+            heapq.heappush(events, (end + delay, worker, index + 1, 0))
+
+    return {
+        'wall_seconds': wall,
+        'requests': requests,
+        'retried_requests': retried,
+        'failed_requests': failed_requests,
+        'failed_items': failed_items,
+        'peak_rate_per_minute': peak_rate,
+        'extrapolated_requests': extrapolated,
+    }
+
+
+def evaluate(model, settings, items, runs=5, seed=0, extra_every=10, retry_delay=2.0):
+    """
+    以不同随机种子模拟多次并汇总：耗时取中位数，其他取平均
+    返回:
+        汇总结果字典
+    """
+    results = [simulate(model, settings, items, seed + i, extra_every, retry_delay) for i in range(runs)]
+    requests = statistics.mean(r['requests'] for r in results)
+    failed_requests = statistics.mean(r['failed_requests'] for r in results)
+    return {
+        **settings.as_dict(),
+        'items': items,
+        'wall_seconds': round(statistics.median(r['wall_seconds'] for r in results), 1),
+        'requests': round(requests, 1),
+        'retried_requests': round(statistics.mean(r['retried_requests'] for r in results), 1),
+        'failed_requests': round(failed_requests, 1),
+        'error_rate': round(failed_requests / requests, 4) if requests else 0.0,
+        'failed_items': round(statistics.mean(r['failed_items'] for r in results), 1),
+        'failed_item_ratio': round(statistics.mean(r['failed_items'] for r in results) / items, 4) if items else 0.0,
+        'peak_rate_per_minute': max(r['peak_rate_per_minute'] for r in results),
+        'extrapolated_ratio': round(statistics.mean(r['extrapolated_requests'] for r in results) / requests, 4)
+        if requests else 0.0,
+    }
+
+
+def candidate_grid(min_delays, max_delays, retries, concurrencies):
+    """
+    候选设置的组合，跳过最小延迟大于最大延迟的组合
+    爬虫和定时任务只能设置延迟(--min-delay/--max-delay)，推荐时retries和concurrency只传当前设置；
+    其他尝试次数和并发数只作为参考模拟
+    """
+    return [CrawlSettings(low, high, retry, workers)
+            for low in min_delays for high in max_delays if low <= high
+            for retry in retries for workers in concurrencies]
+
+
+def recommend(results, baseline, max_error_rate=None, max_failed_items=None):
+    """
+    推荐设置：失败请求率和失败产品比例不高于基线(或给定上限)、且峰值速率不超出日志中观测范围的候选中耗时最短的一个
+    参数:
+        results: 各候选的模拟结果
+        baseline: 当前设置的模拟结果
+        max_error_rate: 允许的失败请求率，默认为基线的1.1倍
+        max_failed_items: 允许的失败产品比例，默认为基线
+    返回:
+        推荐的模拟结果，没有满足条件的候选时返回None
+    """
+    if max_error_rate is None:
+        max_error_rate = baseline['error_rate'] * 1.1 + 0.001
+    if max_failed_items is None:
+        max_failed_items = baseline['failed_item_ratio'] + 0.001
+    feasible = [r for r in results
+                if r['extrapolated_ratio'] == 0
+                and r['error_rate'] <= max_error_rate
+                and r['failed_item_ratio'] <= max_failed_items]
+    if not feasible:
+        return None
+    return min(feasible, key=lambda r: (r['wall_seconds'], r['requests']))
+
+
+def format_duration(seconds):
+    hours, rest = divmod(int(round(seconds)), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+
+def format_row(result, note=""):
+    return (f"{result['min_delay']:>6.2f} {result['max_delay']:>6.2f} {result['retries']:>4} {result['concurrency']:>4} "
+            f"{format_duration(result['wall_seconds']):>10} {result['requests']:>9.0f} {result['failed_requests']:>8.1f} "
+            f"{result['error_rate']:>7.2%} {result['failed_items']:>8.1f} {result['peak_rate_per_minute']:>8}  {note}")
+
+
+def parse_list(value, cast=float):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="由请求日志在虚拟时间中重放爬取循环，预测不同延迟设置下的耗时、请求数和失败，并推荐设置")
+    parser.add_argument("files", nargs="*", help="请求日志文件，支持通配符，默认为logs/requests_*.jsonl")
+    parser.add_argument("--kind", type=str, choices=sorted(KIND_DEFAULTS), default="detail",
+                        help="模拟的爬取阶段，默认为detail；listing的页间延迟不能设置，结果仅供参考")
+    parser.add_argument("--items", type=int, help="项目数(产品数或页数)，默认为日志中请求最多的一次运行的项目数")
+    parser.add_argument("--baseline-delay", type=str, help="当前的最小、最大延迟，如2,5，默认为该阶段爬虫的默认值")
+    parser.add_argument("--baseline-retries", type=int, help="当前的最多尝试次数，默认为该阶段爬虫的默认值")
+    parser.add_argument("--min-delays", type=str, default="0.5,1,2", help="候选最小延迟(秒)，逗号分隔")
+    parser.add_argument("--max-delays", type=str, default="1,2,3,5", help="候选最大延迟(秒)，逗号分隔")
+    parser.add_argument("--retries", type=str,
+                        help="另外模拟的最多尝试次数，逗号分隔；爬虫和定时任务不能设置，结果仅供参考，不参与推荐")
+    parser.add_argument("--concurrency", type=str,
+                        help="另外模拟的并发数(同时运行的爬虫进程数)，逗号分隔；爬虫和定时任务不能设置，结果仅供参考，不参与推荐")
+    parser.add_argument("--runs", type=int, default=5, help="每组设置以不同随机种子模拟的次数，默认为5")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，默认为0")
+    parser.add_argument("--max-error-rate", type=float, help="推荐时允许的失败请求率，默认为基线的1.1倍")
+    parser.add_argument("--max-failed-items", type=float, help="推荐时允许的失败产品比例，默认为基线")
+    parser.add_argument("--top", type=int, default=10, help="列出耗时最短的候选数，默认为10")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+
+    args = parser.parse_args()
+
+    patterns = args.files or [os.path.join("logs", "requests_*.jsonl")]
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    if not paths:
+        print("没有找到请求日志文件")
+        return 1
+    records = [record for record in read_records(paths)
+               if record.get('kind') == args.kind and 'ms' in record]
+    if not records:
+        print(f"请求日志中没有{args.kind}请求")
+        return 1
+
+    defaults = KIND_DEFAULTS[args.kind]
+    model = RequestModel(args.kind, records)
+    items = args.items or model.observed['items']
+    low, high = parse_list(args.baseline_delay) if args.baseline_delay else defaults['delay_range']
+    current = CrawlSettings(low, high, args.baseline_retries or defaults['retries'], 1)
+    options = {'runs': args.runs, 'seed': args.seed,
+               'extra_every': defaults['extra_every'], 'retry_delay': defaults['retry_delay']}
+
+    # 先按日志中观测到的运行模拟当前设置，对比观测耗时以检验模型
+    calibration = evaluate(model, current, model.observed['items'], **options)
+    baseline = evaluate(model, current, items, **options)
+    # 只在延迟上搜索推荐设置，尝试次数和并发数保持当前值
+    candidates = candidate_grid(parse_list(args.min_delays), parse_list(args.max_delays),
+                                [current.retries], [current.concurrency])
+    results = [evaluate(model, settings, items, **options) for settings in candidates if settings != current]
+    results.sort(key=lambda r: (r['wall_seconds'], r['requests']))
+    best = recommend(results, baseline, args.max_error_rate, args.max_failed_items)
+
+    # 按推荐(没有时为当前)的延迟模拟其他尝试次数和并发数，仅供参考
+    what_if = []
+    if args.retries or args.concurrency:
+        chosen = best or baseline
+        retries = parse_list(args.retries, int) if args.retries else [current.retries]
+        concurrencies = parse_list(args.concurrency, int) if args.concurrency else [current.concurrency]
+        what_if = [evaluate(model, settings, items, **options)
+                   for settings in candidate_grid([chosen['min_delay']], [chosen['max_delay']], retries, concurrencies)
+                   if settings.retries != current.retries or settings.concurrency != current.concurrency]
+        what_if.sort(key=lambda r: (r['wall_seconds'], r['requests']))
+
+    tunable = args.kind in TUNABLE_KINDS
+    if args.json:
+        print(json.dumps({'kind': args.kind, 'model': model.summary(), 'calibration': calibration,
+                          'baseline': baseline, 'candidates': results, 'best': best,
+                          'recommended': best if tunable else None, 'what_if': what_if},
+                         ensure_ascii=False, indent=2))
+        return 0
+
+    summary = model.summary()
+    observed = summary['observed']
+    print(f"{args.kind}: 日志中 {summary['requests']} 次请求，失败率 {summary['failure_rate']:.2%}，"
+          f"重试失败率为整体的 {summary['retry_failure_lift']} 倍，成功请求p50 {summary['ok_p50_ms']} ms，"
+          f"观测到的最高速率 {summary['max_observed_rate_per_minute']} 次/分")
+    print(f"校准: 运行 {observed['run']} 共 {observed['items']} 个项目，观测耗时 {format_duration(observed['wall_seconds'])}，"
+          f"按当前设置模拟 {format_duration(calibration['wall_seconds'])}；两者相差较大时请确认--baseline-delay与该次运行一致")
+    print()
+    print(f"{items} 个项目的模拟结果(耗时取{args.runs}次模拟的中位数):")
+    header = (f"{'最小延迟':>4} {'最大延迟':>4} {'尝试':>2} {'并发':>2} {'耗时':>8} {'请求数':>6} {'失败请求':>4} "
+              f"{'失败率':>4} {'失败项目':>4} {'峰值次/分':>4}")
+    print(header)
+    print(format_row(baseline, "当前设置"))
+    for result in results[:args.top]:
+        notes = []
+        if result['extrapolated_ratio'] > 0:
+            notes.append("超出观测速率")
+        if result is best:
+            notes.append("推荐" if tunable else "最优")
+        print(format_row(result, "，".join(notes)))
+    if best is not None and best not in results[:args.top]:
+        print(format_row(best, "推荐" if tunable else "最优"))
+    print()
+    if what_if:
+        print("其他尝试次数和并发数(爬虫和定时任务不能设置，仅供参考):")
+        print(header)
+        for result in what_if[:args.top]:
+            print(format_row(result, "超出观测速率" if result['extrapolated_ratio'] > 0 else ""))
+        print()
+
+    if best is None or best['wall_seconds'] >= baseline['wall_seconds']:
+        print("没有比当前设置更快且失败不增加、速率不超出日志观测范围的候选")
+        return 0
+    if not tunable:
+        print(f"最优延迟 {best['min_delay']}~{best['max_delay']} 秒；预计耗时 {format_duration(best['wall_seconds'])}"
+              f"(当前 {format_duration(baseline['wall_seconds'])})")
+        print(f"{args.kind}爬虫的页间延迟不能通过命令行或定时任务设置，以上结果仅供参考")
+        return 0
+    print(f"推荐: --min-delay {best['min_delay']} --max-delay {best['max_delay']}；预计耗时 {format_duration(best['wall_seconds'])}"
+          f"(当前 {format_duration(baseline['wall_seconds'])}，缩短 {1 - best['wall_seconds'] / baseline['wall_seconds']:.0%})，"
+          f"请求 {best['requests']:.0f} 次，失败率 {best['error_rate']:.2%}")
+    print("超出日志中观测速率的设置无法预测失败率，不会被推荐；需要评估时请先以较小规模实际运行收集请求日志")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import zlib
+import argparse
+import logging
+import psycopg2
+
+# 分片处于running超过该时长(小时)视为刷新进程已中途退出，可被重新领取
+STALE_HOURS = 6
+
+
+# CRC32的取值范围为[0, 2^32)
+HASH_SPACE = 1 << 32
+
+
+def slice_of(product_id, slice_count):
+    """
+    产品所属的分片：把产品ID的CRC32按取值范围等分为slice_count段，与进程和Python版本无关，新增产品不会改变已有产品的分片
+    与数据库中milk_products.slice_hash(crawl_slice_hash函数)一致
+    参数:
+        product_id: 产品ID
+        slice_count: 分片总数
+    返回:
+        分片序号(0 ~ slice_count-1)
+    """
+    return zlib.crc32(str(product_id).encode('utf-8')) * slice_count // HASH_SPACE
+
+
+def slice_bounds(slice_index, slice_count):
+    """
+    分片对应的CRC32区间
+    返回:
+        (下界, 上界)，slice_of为slice_index的哈希满足 下界 <= 哈希 < 上界
+    """
+    return (-(-slice_index * HASH_SPACE // slice_count),
+            -(-(slice_index + 1) * HASH_SPACE // slice_count))
+
+
+class SliceTracker:
+    """滚动分片爬取的进度：每次运行领取最久未刷新的分片，分片数不变时所有分片轮流刷新"""
+
+    def __init__(self, conn, slice_count, logger=None):
+        """
+        初始化分片进度
+        参数:
+            conn: 数据库连接
+            slice_count: 分片总数，改变分片数相当于开始新一轮，与旧的进度互不影响
+            logger: 日志对象
+        """
+        if slice_count < 1:
+            raise ValueError("分片数必须大于0")
+        self.conn = conn
+        self.slice_count = slice_count
+        self.logger = logger or logging.getLogger("SliceTracker")
+
+    def claim(self, stale_hours=STALE_HOURS):
+        """
+        领取下一个要刷新的分片：从未完成过的优先，其次是完成时间最早的；
+        跳过其他进程正在刷新的分片(运行时间超过stale_hours的视为已中途退出，可重新领取)
+        参数:
+            stale_hours: running状态超过多少小时后可被重新领取
+        返回:
+            分片序号，所有分片都在其他进程中刷新时返回None
+        """
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO crawl_slice_progress (slice_count, slice_index)
+                    SELECT %s, i FROM generate_series(0, %s - 1) AS i
+                    ON CONFLICT DO NOTHING
+                    """,
+                    (self.slice_count, self.slice_count)
+                )
+                cur.execute(
+                    """
+                    SELECT slice_index FROM crawl_slice_progress
+                    WHERE slice_count = %s
+                      AND (status <> 'running' OR started_at < NOW() - make_interval(hours => %s))
+                    ORDER BY finished_at NULLS FIRST, slice_index
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    (self.slice_count, stale_hours)
+                )
+                row = cur.fetchone()
+                if row is None:
+                    return None
+                cur.execute(
+                    """
+                    UPDATE crawl_slice_progress SET status = 'running', started_at = NOW()
+                    WHERE slice_count = %s AND slice_index = %s
+                    """,
+                    (self.slice_count, row[0])
+                )
+        return row[0]
+
+    def products_in_slice(self, slice_index):
+        """返回数据库中属于该分片的产品ID(升序)，按slice_hash的索引只读取该分片"""
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT product_id FROM milk_products
+                WHERE slice_hash >= %s AND slice_hash < %s
+                ORDER BY product_id
+                """,
+                slice_bounds(slice_index, self.slice_count)
+            )
+            product_ids = [row[0] for row in cur.fetchall()]
+        self.conn.rollback()
+        return product_ids
+
+    def finish(self, slice_index, products, success):
+        """
+        记录分片刷新结果；失败的分片不更新完成时间，下次运行会再次领取
+        参数:
+            slice_index: 分片序号
+            products: 本次刷新的产品数
+            success: 是否成功
+        """
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE crawl_slice_progress SET
+                        status = %s,
+                        products = %s,
+                        finished_at = CASE WHEN %s THEN NOW() ELSE finished_at END
+                    WHERE slice_count = %s AND slice_index = %s
+                    """,
+                    ('done' if success else 'failed', products, success, self.slice_count, slice_index)
+                )
+
+    def progress(self):
+        """
+        当前一轮的进度
+        返回:
+            (已完成过的分片数, 分片总数, 最早的完成时间)
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT count(finished_at), min(finished_at) FILTER (WHERE finished_at IS NOT NULL)
+                FROM crawl_slice_progress WHERE slice_count = %s
+                """,
+                (self.slice_count,)
+            )
+            done, oldest = cur.fetchone()
+        self.conn.rollback()
+        return done, self.slice_count, oldest
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="查看滚动分片爬取的进度")
+    parser.add_argument("--slices", type=int, required=True, help="分片总数")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT slice_index, status, products, started_at, finished_at
+                FROM crawl_slice_progress WHERE slice_count = %s ORDER BY slice_index
+                """,
+                (args.slices,)
+            )
+            rows = cur.fetchall()
+        done, total, oldest = SliceTracker(conn, args.slices).progress()
+    finally:
+        conn.close()
+
+    print(f"已刷新过 {done}/{total} 个分片，最久未刷新的分片完成于 {oldest or '从未'}")
+    for slice_index, status, products, started_at, finished_at in rows:
+        print(f"{slice_index}\t{status}\t{products if products is not None else '-'}\t"
+              f"{started_at or '-'}\t{finished_at or '-'}")
+
+
+if __name__ == "__main__":
+    main()
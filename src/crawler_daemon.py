@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import signal
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from psycopg2 import pool
+
+import metrics
+import run_status
+from cron_schedule import CronSchedule
+from scheduled_crawler import ScheduledCrawler
+
+DEFAULT_SCHEDULE = "0 2 * * 0"
+DEFAULT_CONTROL_PORT = 8765
+
+
+def create_session(pool_size=10):
+    """创建常驻进程共用的requests会话，连接在多次运行之间保持"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        max_retries=3,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        pool_block=False
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class CrawlerDaemon:
+    """常驻爬虫进程：按cron表达式定时运行ScheduledCrawler，跨运行保持HTTP会话、授权token和数据库连接池"""
+
+    def __init__(self, schedule=DEFAULT_SCHEDULE, crawler_options=None, control_host="127.0.0.1",
+                 control_port=DEFAULT_CONTROL_PORT, db_pool_size=2, run_on_start=False):
+        """
+        初始化常驻爬虫
+        参数:
+            schedule: 五字段cron表达式
+            crawler_options: 传给ScheduledCrawler的参数字典
+            control_host: 控制接口监听地址
+            control_port: 控制接口端口，为0时不启动控制接口
+            db_pool_size: 数据库连接池大小(定时检查和导入各占一个连接)
+            run_on_start: 启动后是否立即运行一次
+        """
+        self.logger = logging.getLogger("CrawlerDaemon")
+        self.schedule = CronSchedule(schedule)
+        self.crawler_options = dict(crawler_options or {})
+        self.control_host = control_host
+        self.control_port = control_port
+        self.db_pool_size = db_pool_size
+        self.run_on_start = run_on_start
+
+        self.session = create_session()
+        self.auth_token = None
+        self.db_pool = None
+        self.control_server = None
+
+        # 同一时间只允许一次运行，定时触发和手动触发都需先拿到该锁
+        self.run_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.trigger_requested = False
+
+        self.status = {
+            'state': 'idle',
+            'schedule': schedule,
+            'next_run': None,
+            'runs': 0,
+            'last_started': None,
+            'last_finished': None,
+            'last_success': None,
+            'last_reason': None,
+        }
+
+    def open_db_pool(self):
+        """创建数据库连接池，连接启动时建立并在多次运行之间保持"""
+        # psycopg2连接池只保留minconn个空闲连接，多出的归还时会被关闭
+        self.db_pool = pool.ThreadedConnectionPool(
+            self.db_pool_size, self.db_pool_size,
+            host=self.crawler_options.get('db_host', 'localhost'),
+            port=self.crawler_options.get('db_port', 5432),
+            dbname=self.crawler_options.get('db_name', 'milk_products'),
+            user=self.crawler_options.get('db_user', 'postgres'),
+            password=self.crawler_options.get('db_password', 'postgres')
+        )
+
+    def run_once(self, reason="schedule"):
+        """
+        执行一次爬虫任务，已有任务在运行时直接跳过
+        参数:
+            reason: 触发原因(schedule/trigger/startup)
+        返回:
+            任务是否成功，被跳过时返回None
+        """
+        if not self.run_lock.acquire(blocking=False):
+            self.logger.warning(f"上一次爬虫任务仍在运行，跳过本次{reason}触发")
+            return None
+
+        success = False
+        try:
+            self.status.update(state='running', last_started=datetime.now().isoformat(), last_reason=reason)
+            self.logger.info(f"开始执行爬虫任务(触发原因: {reason})")
+
+            crawler = ScheduledCrawler(
+                session=self.session,
+                auth_token=self.auth_token,
+                db_pool=self.db_pool,
+                **self.crawler_options
+            )
+            try:
+                success = crawler.run()
+            finally:
+                # 保留本次运行得到(或刷新)的token，下次运行无需重新登录
+                self.auth_token = crawler.auth_token or self.auth_token
+
+            self.logger.info(f"爬虫任务{'成功' if success else '失败'}")
+            return success
+        except Exception as e:
+            self.logger.error(f"执行爬虫任务时出错: {e}")
+            return False
+        finally:
+            self.status.update(
+                state='idle',
+                runs=self.status['runs'] + 1,
+                last_finished=datetime.now().isoformat(),
+                last_success=success
+            )
+            self.run_lock.release()
+
+    def trigger(self):
+        """
+        请求立即运行一次
+        返回:
+            是否已接受请求，已有任务在运行时返回False
+        """
+        if self.run_lock.locked():
+            return False
+        self.trigger_requested = True
+        self.wakeup.set()
+        return True
+
+    def stop(self):
+        """请求退出主循环，正在运行的任务会先执行完"""
+        self.stopping = True
+        self.wakeup.set()
+
+    def serve_forever(self):
+        """主循环：等待到下一次触发时间或手动触发后运行任务"""
+        self.open_db_pool()
+        self.start_control_server()
+        self.logger.info(f"常驻爬虫已启动，定时计划: {self.schedule.expression}")
+
+        if self.run_on_start:
+            self.run_once("startup")
+
+        try:
+            while not self.stopping:
+                now = datetime.now()
+                next_run = self.schedule.next_after(now)
+                self.status['next_run'] = next_run.isoformat()
+                self.logger.info(f"下一次定时运行: {next_run.strftime('%Y-%m-%d %H:%M')}")
+
+                self.wakeup.wait((next_run - now).total_seconds())
+                self.wakeup.clear()
+                if self.stopping:
+                    break
+
+                if self.trigger_requested:
+                    self.trigger_requested = False
+                    self.run_once("trigger")
+                elif datetime.now() >= next_run:
+                    # 任务耗时超过调度间隔时，错过的时间点不补跑，从当前时间重新计算
+                    self.run_once("schedule")
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """关闭控制接口、HTTP会话和数据库连接池"""
+        if self.control_server is not None:
+            self.control_server.shutdown()
+            self.control_server.server_close()
+        self.session.close()
+        if self.db_pool is not None:
+            self.db_pool.closeall()
+        self.logger.info("常驻爬虫已退出")
+
+    def start_control_server(self):
+        """
+        在后台线程启动控制接口：POST /trigger 立即运行，GET /status 查看状态，
+        GET /progress 查看当前运行各阶段的进度，GET /metrics 输出Prometheus指标
+        """
+        if not self.control_port:
+            return
+
+        daemon = self
+
+        class ControlHandler(BaseHTTPRequestHandler):
+            def send_json(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/status':
+                    self.send_json(200, daemon.status)
+                elif self.path == '/progress':
+                    self.send_json(200, run_status.snapshot())
+                elif self.path == '/metrics':
+                    body = metrics.REGISTRY.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', metrics.CONTENT_TYPE)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_json(404, {'error': '未找到'})
+
+            def do_POST(self):
+                if self.path != '/trigger':
+                    self.send_json(404, {'error': '未找到'})
+                elif daemon.trigger():
+                    self.send_json(202, {'accepted': True})
+                else:
+                    self.send_json(409, {'accepted': False, 'error': '已有爬虫任务在运行'})
+
+            def log_message(self, format, *args):
+                daemon.logger.debug(f"控制接口: {format % args}")
+
+        self.control_server = ThreadingHTTPServer((self.control_host, self.control_port), ControlHandler)
+        threading.Thread(target=self.control_server.serve_forever, name="control", daemon=True).start()
+        self.logger.info(f"控制接口已启动: http://{self.control_host}:{self.control_port}")
+
+    def install_signal_handlers(self):
+        """收到SIGTERM/SIGINT时在当前任务结束后退出"""
+        def handle(signum, frame):
+            self.logger.info(f"收到信号 {signum}，准备退出")
+            self.stop()
+
+        signal.signal(signal.SIGTERM, handle)
+        signal.signal(signal.SIGINT, handle)
+
+
+def send_trigger(host="127.0.0.1", port=DEFAULT_CONTROL_PORT):
+    """
+    请求常驻爬虫立即运行一次
+    返回:
+        (是否被接受, 响应消息)
+    """
+    try:
+        response = requests.post(f"http://{host}:{port}/trigger", timeout=10)
+    except requests.exceptions.ConnectionError:
+        return False, f"无法连接常驻爬虫控制接口 {host}:{port}"
+    if response.status_code == 202:
+        return True, "已触发爬虫任务"
+    return False, response.json().get('error', f"状态码 {response.status_code}")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+# 五个字段的取值范围：分 时 日 月 周(0和7都表示周日)
+FIELD_RANGES = [
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7),
+]
+
+
+def parse_field(text, low, high):
+    """
+    解析cron表达式的单个字段
+    参数:
+        text: 字段文本，支持*、*/n、a-b、a-b/n以及逗号分隔的列表
+        low: 字段最小值
+        high: 字段最大值
+    返回:
+        字段允许的取值集合
+    """
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"步长必须为正数: {text}")
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = int(part)
+            # 带步长的单个值(如5/15)表示从该值开始到最大值
+            end = high if step > 1 else start
+
+        if start < low or end > high or start > end:
+            raise ValueError(f"取值超出范围 {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """五字段cron表达式(分 时 日 月 周)，计算下一次触发时间"""
+
+    def __init__(self, expression):
+        """
+        解析cron表达式
+        参数:
+            expression: 如"0 2 * * *"表示每天2点，"*/30 * * * 1-5"表示工作日每半小时
+        """
+        fields = expression.split()
+        if len(fields) != len(FIELD_RANGES):
+            raise ValueError(f"cron表达式需要5个字段: {expression}")
+
+        self.expression = expression
+        parsed = {name: parse_field(text, low, high)
+                  for text, (name, low, high) in zip(fields, FIELD_RANGES)}
+        self.minutes = parsed['minute']
+        self.hours = parsed['hour']
+        self.days = parsed['day']
+        self.months = parsed['month']
+        # 周日统一为0，与datetime.isoweekday() % 7一致
+        self.weekdays = {d % 7 for d in parsed['weekday']}
+
+        # 与Vixie cron相同：日和周都有限制时满足其一即可，只有一个有限制时只看该字段；
+        # 以*开头的字段(包括*/2)视为不限制，此时两个字段同时满足才触发
+        self.day_restricted = not fields[2].startswith('*')
+        self.weekday_restricted = not fields[4].startswith('*')
+
+    def matches_day(self, dt):
+        """
+        判断日期是否满足日、月、周字段(可用python -m doctest src/cron_schedule.py检查)
+
+        日为*/2时视为不限制，与周字段同时满足才触发(奇数日且为周一)：
+        >>> schedule = CronSchedule("0 0 */2 * 1")
+        >>> [schedule.matches_day(datetime(2026, 10, d)) for d in (19, 21, 26)]
+        [True, False, False]
+
+        日和周都有限制时满足其一即可(1日、15日或周一)：
+        >>> schedule = CronSchedule("0 0 1,15 * 1")
+        >>> [schedule.matches_day(datetime(2026, 10, d)) for d in (15, 19, 20)]
+        [True, True, False]
+
+        >>> CronSchedule("0 0 */2 * 1").next_after(datetime(2026, 10, 19, 12, 0))
+        datetime.datetime(2026, 11, 9, 0, 0)
+        """
+        if dt.month not in self.months:
+            return False
+        day_ok = dt.day in self.days
+        weekday_ok = dt.isoweekday() % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, dt):
+        """
+        计算严格晚于给定时间的下一次触发时间
+        参数:
+            dt: 起始时间
+        返回:
+            下一次触发时间(秒和微秒为0)
+        """
+        candidate = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # 最坏情况(如2月29日)也会在数年内命中
+        limit = candidate + timedelta(days=366 * 8)
+        while candidate < limit:
+            if not self.matches_day(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"cron表达式没有可触发的时间: {self.expression}")
+
+
+def main():
+    """打印cron表达式接下来的几次触发时间"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查看cron表达式接下来的触发时间")
+    parser.add_argument("expression", type=str, help="五字段cron表达式，如\"0 2 * * *\"")
+    parser.add_argument("--count", "-n", type=int, default=5, help="显示的次数，默认为5")
+    args = parser.parse_args()
+
+    schedule = CronSchedule(args.expression)
+    moment = datetime.now()
+    for _ in range(args.count):
+        moment = schedule.next_after(moment)
+        print(moment.strftime('%Y-%m-%d %H:%M'))
+
+
+if __name__ == "__main__":
+    main()
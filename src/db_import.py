@@ -2,20 +2,108 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import json
+import time
+import random
 import argparse
 import logging
 import psycopg2
-from psycopg2 import extras
+from psycopg2 import errors, extras
 from datetime import datetime
 import sys
-from tqdm import tqdm
+
+from ingredient_index import IngredientIndexer
+import metrics
+import tracing
+import profiling
+import run_status
+import request_log
+
+# 数据表字段与JSON键的对应关系(顺序即INSERT/COPY的列顺序)
+PRODUCT_FIELDS = [
+    ('product_id', 'id'), ('name', 'name'), ('thumbnail', 'thumbnail'), ('thumbnail_alt', 'thumbnail_alt'),
+    ('click_count', 'click_count'), ('price', 'price'), ('tag', 'tag'), ('tag_time', 'tag_time'), ('icon', 'icon')
+]
+DETAIL_FIELDS = [
+    ('product_id', 'id'), ('brand', '品牌'), ('series', '系列'), ('origin', '产地'), ('milk_source', '奶源'),
+    ('age_range', '适用年龄'), ('manufacturer', '厂家'), ('operator', '运营商'), ('specification', '规格'),
+    ('stage', '段位'), ('reference_price', '参考价'), ('category', '类别'), ('version', '版本'),
+    ('formula_registration', '配方注册号'), ('formula_evaluation', '配方评价'), ('ingredients', '配料表')
+]
+NUTRIENT_COLUMNS = ['product_id', 'nutrient_name', 'content', 'unit', 'description']
+EXTRA_DETAIL_COLUMNS = ['product_id', 'key', 'value']
+
+# 额外详情接口确认产品没有额外详情时，额外详情表中记录的状态键和值，补齐缺失数据时据此跳过该产品
+EXTRA_STATUS_KEY = '额外详情状态'
+NO_EXTRA_DATA = '无数据'
+
+# 整表重载涉及的表：(表名, 数据列, 业务主键)，按外键依赖顺序排列
+RELOAD_TABLES = [
+    ('milk_products', [c for c, _ in PRODUCT_FIELDS], ['product_id']),
+    ('milk_product_details', [c for c, _ in DETAIL_FIELDS], ['product_id']),
+    ('milk_product_nutrients', NUTRIENT_COLUMNS, ['product_id', 'nutrient_name']),
+    ('milk_product_extra_details', EXTRA_DETAIL_COLUMNS, ['product_id', 'key']),
+]
+
+# upsert模式每条INSERT ... ON CONFLICT语句的行数：语句级变更触发器按语句执行，逐行upsert时每行都要合并一次变更
+UPSERT_BATCH_SIZE = 1000
+
+# 换表获取锁超时后重试前的等待基数(秒)，第n次超时后等待SWAP_RETRY_DELAY*n*(1+random())秒
+SWAP_RETRY_DELAY = 2.0
+
+# 影子表名后缀，影子表上的索引和约束名称同样带此后缀，换表后再改回原名
+SHADOW_SUFFIX = "_shadow"
+
+IMPORT_MODES = ("upsert", "reload")
+
+# 变更通知频道，负载为批次ID
+CHANGES_CHANNEL = "product_changes"
+
+# 导入器之间互斥的会话级咨询锁，保证批次按顺序提交，变更ID可作为消费者游标
+IMPORT_LOCK_KEY = 7420611
+# 等待其他导入释放导入锁的最长时间和检查间隔(秒)，超时后放弃本次导入，避免一个卡住的导入让之后的导入全部无限等待
+IMPORT_LOCK_WAIT = 1800
+IMPORT_LOCK_POLL = 10
+
+def copy_value(value):
+    """把单个值编码为COPY文本格式的字段"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+class CopyRowStream:
+    """把行元组流式编码为COPY文本格式，供copy_expert按块读取，避免在内存中拼出整张表"""
+    
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+    
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += '\t'.join(copy_value(v) for v in row) + '\n'
+        
+        if size < 0:
+            chunk, self.buffer = self.buffer, ''
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+    
+    readline = read
+
+def shadow_name(name):
+    """影子对象名称，超长时截断以保证不超过PostgreSQL的63字节标识符限制"""
+    return name[:63 - len(SHADOW_SUFFIX)] + SHADOW_SUFFIX
 
 class DatabaseImporter:
     """奶粉智库数据导入器：将爬取的JSON数据导入到PostgreSQL数据库"""
     
     def __init__(self, host="localhost", port=5432, dbname="milk_products", 
-                 user="postgres", password="postgres", json_file=None):
+                 user="postgres", password="postgres", json_file=None, mode="upsert", conn=None):
         """
         初始化数据库导入器
         参数:
@@ -25,19 +113,34 @@ class DatabaseImporter:
             user: 数据库用户
             password: 数据库密码
             json_file: 要导入的JSON文件路径
+            mode: 导入模式，upsert为分批增量更新，reload为影子表整表重载后原子换表
+            conn: 已有的数据库连接(如常驻进程连接池中的连接)，提供时不再新建连接，导入结束后也不关闭
         """
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"不支持的导入模式: {mode}")
+        
         self.host = host
         self.port = port
         self.dbname = dbname
         self.user = user
         self.password = password
         self.json_file = json_file
+        self.mode = mode
+        self.run_id = None
+        # 最近一次结束的批次ID，供调用方在导入后查询本批次的变更
+        self.last_run_id = None
         
         # 设置日志
         self.setup_logger()
         
         # 连接数据库
-        self.connect_db()
+        self.own_conn = conn is None
+        if self.own_conn:
+            self.connect_db()
+        else:
+            self.conn = conn
+            self.conn.autocommit = False
+            self.cur = self.conn.cursor()
     
     def setup_logger(self):
         """设置日志"""
@@ -82,10 +185,11 @@ class DatabaseImporter:
         if hasattr(self, 'cur') and self.cur:
             self.cur.close()
         
-        if hasattr(self, 'conn') and self.conn:
+        if hasattr(self, 'conn') and self.conn and self.own_conn:
             self.conn.close()
             self.logger.info("数据库连接已关闭")
     
+    @profiling.profiled()
     def load_json_data(self, json_file=None):
         """加载要导入的JSON数据"""
         file_path = json_file or self.json_file
@@ -104,6 +208,112 @@ class DatabaseImporter:
             self.logger.error(f"加载JSON数据时出错: {e}")
             return None
     
+    def build_product_row(self, item):
+        """由一条JSON记录构造产品基本信息表的一行，缺少产品ID时返回None"""
+        if 'id' not in item:
+            return None
+        return tuple(item.get(key) for _, key in PRODUCT_FIELDS)
+    
+    def build_detail_row(self, item):
+        """由一条JSON记录构造产品详情表的一行，缺少产品ID时返回None"""
+        if 'id' not in item:
+            return None
+        return tuple(item.get(key) for _, key in DETAIL_FIELDS)
+    
+    def build_nutrient_rows(self, item):
+        """由一条JSON记录构造营养成分表的多行"""
+        if 'id' not in item or '营养成分' not in item or not isinstance(item['营养成分'], dict):
+            return []
+        
+        product_id = item.get('id')
+        rows = []
+        for nutrient_name, nutrient_data in item.get('营养成分', {}).items():
+            if not isinstance(nutrient_data, dict):
+                continue
+            rows.append((
+                product_id,
+                nutrient_name,
+                nutrient_data.get('含量'),
+                nutrient_data.get('单位'),
+                nutrient_data.get('描述')
+            ))
+        return rows
+    
+    def build_extra_detail_rows(self, item):
+        """由一条JSON记录构造额外详情表的多行，复杂类型的值转换为JSON字符串"""
+        if 'id' not in item:
+            return []
+        
+        product_id = item.get('id')
+        rows = []
+        if item.get(EXTRA_STATUS_KEY) == NO_EXTRA_DATA:
+            rows.append((product_id, EXTRA_STATUS_KEY, NO_EXTRA_DATA))
+        for key in [k for k in item.keys() if k.startswith('详情_')]:
+            value = item.get(key)
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value, ensure_ascii=False)
+            rows.append((product_id, key, value))
+        return rows
+    
+    def upsert_rows(self, cur, table, rows):
+        """
+        批量upsert：同一批中的行由一条INSERT ... ON CONFLICT完成，语句级变更触发器每批只执行一次
+        参数:
+            cur: 游标
+            table: 表名(RELOAD_TABLES中的表)
+            rows: 行元组列表，列顺序与RELOAD_TABLES中的数据列一致
+        返回:
+            写入的行数
+        """
+        if not rows:
+            return 0
+        columns, keys = next((c, k) for t, c, k in RELOAD_TABLES if t == table)
+        # 一条语句不能两次更新同一行，同一批中主键重复时保留最后一行(与逐行upsert的结果相同)
+        key_positions = [columns.index(key) for key in keys]
+        unique = {tuple(row[i] for i in key_positions): row for row in rows}
+        updates = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in keys)
+        sql = f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        VALUES %s
+        ON CONFLICT ({", ".join(keys)})
+        DO UPDATE SET
+            {updates},
+            updated_at = NOW()
+        """
+        extras.execute_values(cur, sql, list(unique.values()), page_size=UPSERT_BATCH_SIZE)
+        return len(unique)
+    
+    def import_rows(self, data, table, build_rows, stage, desc):
+        """
+        逐个产品构造行并按UPSERT_BATCH_SIZE分批upsert，在一个事务内完成
+        参数:
+            data: 产品数据列表
+            table: 表名
+            build_rows: 由一条JSON记录构造行列表的函数
+            stage: 运行状态中的阶段名称
+            desc: 进度条描述
+        返回:
+            (写入的行数, 有数据的产品数)
+        """
+        row_count = 0
+        product_count = 0
+        pending = []
+        with self.conn:
+            with self.conn.cursor() as cur:
+                for item in run_status.track(data, stage, unit="产品", desc=desc):
+                    rows = build_rows(item)
+                    if not rows:
+                        continue
+                    pending.extend(rows)
+                    product_count += 1
+                    if len(pending) >= UPSERT_BATCH_SIZE:
+                        row_count += self.upsert_rows(cur, table, pending)
+                        pending = []
+                row_count += self.upsert_rows(cur, table, pending)
+        return row_count, product_count
+    
+    @tracing.traced('db')
+    @profiling.profiled()
     def import_products(self, data):
         """导入奶粉产品基本信息"""
         if not data:
@@ -111,57 +321,19 @@ class DatabaseImporter:
             return 0
         
         self.logger.info("开始导入奶粉产品基本信息...")
-        inserted_count = 0
         
         try:
-            with self.conn:
-                with self.conn.cursor() as cur:
-                    for item in tqdm(data, desc="导入产品基本信息", unit="产品"):
-                        # 确保产品ID存在
-                        if 'id' not in item:
-                            continue
-                        
-                        # 准备SQL语句和参数
-                        sql = """
-                        INSERT INTO milk_products 
-                        (product_id, name, thumbnail, thumbnail_alt, click_count, price, tag, tag_time, icon)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (product_id) 
-                        DO UPDATE SET 
-                            name = EXCLUDED.name,
-                            thumbnail = EXCLUDED.thumbnail,
-                            thumbnail_alt = EXCLUDED.thumbnail_alt,
-                            click_count = EXCLUDED.click_count,
-                            price = EXCLUDED.price,
-                            tag = EXCLUDED.tag,
-                            tag_time = EXCLUDED.tag_time,
-                            icon = EXCLUDED.icon,
-                            updated_at = NOW()
-                        RETURNING id
-                        """
-                        
-                        params = (
-                            item.get('id'),
-                            item.get('name'),
-                            item.get('thumbnail'),
-                            item.get('thumbnail_alt'),
-                            item.get('click_count'),
-                            item.get('price'),
-                            item.get('tag'),
-                            item.get('tag_time'),
-                            item.get('icon')
-                        )
-                        
-                        # 执行SQL
-                        cur.execute(sql, params)
-                        inserted_count += 1
-            
+            inserted_count, _ = self.import_rows(
+                data, 'milk_products', lambda item: [r for r in [self.build_product_row(item)] if r],
+                "import_products", "导入产品基本信息")
             self.logger.info(f"成功导入或更新了 {inserted_count} 条产品基本信息")
             return inserted_count
         except Exception as e:
             self.logger.error(f"导入产品基本信息时出错: {e}")
             return 0
     
+    @tracing.traced('db')
+    @profiling.profiled()
     def import_product_details(self, data):
         """导入奶粉产品详情信息"""
         if not data:
@@ -169,73 +341,19 @@ class DatabaseImporter:
             return 0
         
         self.logger.info("开始导入奶粉产品详情信息...")
-        inserted_count = 0
         
         try:
-            with self.conn:
-                with self.conn.cursor() as cur:
-                    for item in tqdm(data, desc="导入产品详情", unit="产品"):
-                        # 确保产品ID存在
-                        if 'id' not in item:
-                            continue
-                        
-                        # 准备SQL语句和参数
-                        sql = """
-                        INSERT INTO milk_product_details 
-                        (product_id, brand, series, origin, milk_source, age_range, 
-                        manufacturer, operator, specification, stage, reference_price, 
-                        category, version, formula_registration, formula_evaluation, ingredients)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (product_id) 
-                        DO UPDATE SET 
-                            brand = EXCLUDED.brand,
-                            series = EXCLUDED.series,
-                            origin = EXCLUDED.origin,
-                            milk_source = EXCLUDED.milk_source,
-                            age_range = EXCLUDED.age_range,
-                            manufacturer = EXCLUDED.manufacturer,
-                            operator = EXCLUDED.operator,
-                            specification = EXCLUDED.specification,
-                            stage = EXCLUDED.stage,
-                            reference_price = EXCLUDED.reference_price,
-                            category = EXCLUDED.category,
-                            version = EXCLUDED.version,
-                            formula_registration = EXCLUDED.formula_registration,
-                            formula_evaluation = EXCLUDED.formula_evaluation,
-                            ingredients = EXCLUDED.ingredients,
-                            updated_at = NOW()
-                        RETURNING id
-                        """
-                        
-                        params = (
-                            item.get('id'),
-                            item.get('品牌'),
-                            item.get('系列'),
-                            item.get('产地'),
-                            item.get('奶源'),
-                            item.get('适用年龄'),
-                            item.get('厂家'),
-                            item.get('运营商'),
-                            item.get('规格'),
-                            item.get('段位'),
-                            item.get('参考价'),
-                            item.get('类别'),
-                            item.get('版本'),
-                            item.get('配方注册号'),
-                            item.get('配方评价'),
-                            item.get('配料表')
-                        )
-                        
-                        # 执行SQL
-                        cur.execute(sql, params)
-                        inserted_count += 1
-            
+            inserted_count, _ = self.import_rows(
+                data, 'milk_product_details', lambda item: [r for r in [self.build_detail_row(item)] if r],
+                "import_details", "导入产品详情")
             self.logger.info(f"成功导入或更新了 {inserted_count} 条产品详情信息")
             return inserted_count
         except Exception as e:
             self.logger.error(f"导入产品详情信息时出错: {e}")
             return 0
     
+    @tracing.traced('db')
+    @profiling.profiled()
     def import_nutrients(self, data):
         """导入奶粉产品营养成分信息"""
         if not data:
@@ -243,59 +361,18 @@ class DatabaseImporter:
             return 0
         
         self.logger.info("开始导入奶粉产品营养成分信息...")
-        inserted_count = 0
-        total_inserted = 0
         
         try:
-            with self.conn:
-                with self.conn.cursor() as cur:
-                    for item in tqdm(data, desc="导入营养成分", unit="产品"):
-                        # 确保产品ID和营养成分存在
-                        if 'id' not in item or '营养成分' not in item or not isinstance(item['营养成分'], dict):
-                            continue
-                        
-                        product_id = item.get('id')
-                        nutrients = item.get('营养成分', {})
-                        
-                        # 遍历每个营养成分
-                        for nutrient_name, nutrient_data in nutrients.items():
-                            if not isinstance(nutrient_data, dict):
-                                continue
-                                
-                            # 准备SQL语句和参数
-                            sql = """
-                            INSERT INTO milk_product_nutrients
-                            (product_id, nutrient_name, content, unit, description)
-                            VALUES (%s, %s, %s, %s, %s)
-                            ON CONFLICT (product_id, nutrient_name) 
-                            DO UPDATE SET 
-                                content = EXCLUDED.content,
-                                unit = EXCLUDED.unit,
-                                description = EXCLUDED.description,
-                                updated_at = NOW()
-                            RETURNING id
-                            """
-                            
-                            params = (
-                                product_id,
-                                nutrient_name,
-                                nutrient_data.get('含量'),
-                                nutrient_data.get('单位'),
-                                nutrient_data.get('描述')
-                            )
-                            
-                            # 执行SQL
-                            cur.execute(sql, params)
-                            inserted_count += 1
-                        
-                        total_inserted += 1
-            
+            inserted_count, total_inserted = self.import_rows(
+                data, 'milk_product_nutrients', self.build_nutrient_rows, "import_nutrients", "导入营养成分")
             self.logger.info(f"成功导入或更新了 {inserted_count} 条营养成分信息，涉及 {total_inserted} 个产品")
             return inserted_count
         except Exception as e:
             self.logger.error(f"导入营养成分信息时出错: {e}")
             return 0
     
+    @tracing.traced('db')
+    @profiling.profiled()
     def import_extra_details(self, data):
         """导入奶粉产品额外详情信息"""
         if not data:
@@ -303,58 +380,401 @@ class DatabaseImporter:
             return 0
         
         self.logger.info("开始导入奶粉产品额外详情信息...")
-        inserted_count = 0
-        total_products = 0
         
         try:
-            with self.conn:
-                with self.conn.cursor() as cur:
-                    for item in tqdm(data, desc="导入额外详情", unit="产品"):
-                        # 确保产品ID存在
-                        if 'id' not in item:
-                            continue
-                        
-                        product_id = item.get('id')
-                        has_extra_details = False
-                        
-                        # 检查是否有详情类别字段
-                        extra_detail_keys = [k for k in item.keys() if k.startswith('详情_')]
-                        
-                        if extra_detail_keys:
-                            for key in extra_detail_keys:
-                                # 准备SQL语句和参数
-                                sql = """
-                                INSERT INTO milk_product_extra_details
-                                (product_id, key, value)
-                                VALUES (%s, %s, %s)
-                                ON CONFLICT (product_id, key) 
-                                DO UPDATE SET 
-                                    value = EXCLUDED.value,
-                                    updated_at = NOW()
-                                RETURNING id
-                                """
-                                
-                                # 如果值是复杂类型，转换为JSON字符串
-                                value = item.get(key)
-                                if isinstance(value, (dict, list)):
-                                    value = json.dumps(value, ensure_ascii=False)
-                                
-                                params = (product_id, key, value)
-                                
-                                # 执行SQL
-                                cur.execute(sql, params)
-                                inserted_count += 1
-                                has_extra_details = True
-                        
-                        if has_extra_details:
-                            total_products += 1
-            
+            inserted_count, total_products = self.import_rows(
+                data, 'milk_product_extra_details', self.build_extra_detail_rows,
+                "import_extra_details", "导入额外详情")
             self.logger.info(f"成功导入或更新了 {inserted_count} 条额外详情信息，涉及 {total_products} 个产品")
             return inserted_count
         except Exception as e:
             self.logger.error(f"导入额外详情信息时出错: {e}")
             return 0
     
+    @tracing.traced('db')
+    @profiling.profiled()
+    def import_ingredient_index(self, data):
+        """为配料表发生变化的产品增量维护配料倒排索引"""
+        if not data:
+            return 0
+        
+        self.logger.info("开始更新配料倒排索引...")
+        
+        try:
+            indexer = IngredientIndexer(self.conn, logger=self.logger)
+            rebuilt_count, _ = indexer.sync(data)
+            return rebuilt_count
+        except Exception as e:
+            self.logger.error(f"更新配料倒排索引时出错: {e}")
+            return 0
+    
+    @tracing.traced('db')
+    @profiling.profiled()
+    def refresh_product_full(self, data=None):
+        """
+        刷新产品宽表product_full
+        参数:
+            data: 本次导入的产品数据，只刷新其中的产品；为None时全量刷新
+        返回:
+            刷新的产品数
+        """
+        product_ids = None
+        if data is not None:
+            product_ids = []
+            for item in data:
+                try:
+                    product_ids.append(int(item.get('id')))
+                except (TypeError, ValueError):
+                    continue
+        
+        self.logger.info("开始刷新产品宽表...")
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT refresh_product_full(%s::integer[])", (product_ids,))
+                count = cur.fetchone()[0]
+        
+        self.logger.info(f"产品宽表刷新了 {count} 个产品")
+        return count
+    
+    def build_reload_rows(self, data):
+        """
+        为整表重载构造各表的行，同一业务主键以最后出现的记录为准(与逐行upsert的覆盖语义一致)
+        返回:
+            {表名: 行列表} 字典
+        """
+        products, details, nutrients, extra_details = {}, {}, {}, {}
+        
+        for item in data:
+            row = self.build_product_row(item)
+            if row is None:
+                continue
+            product_key = str(row[0])
+            products[product_key] = row
+            details[product_key] = self.build_detail_row(item)
+            for nutrient_row in self.build_nutrient_rows(item):
+                nutrients[(product_key, nutrient_row[1])] = nutrient_row
+            for extra_row in self.build_extra_detail_rows(item):
+                extra_details[(product_key, extra_row[1])] = extra_row
+        
+        return {
+            'milk_products': list(products.values()),
+            'milk_product_details': list(details.values()),
+            'milk_product_nutrients': list(nutrients.values()),
+            'milk_product_extra_details': list(extra_details.values()),
+        }
+    
+    def load_shadow_table(self, cur, table, columns, keys, rows):
+        """
+        创建不记日志、无索引无触发器的影子表，并用COPY装入数据
+        已有记录沿用线上表的id和created_at，新记录从原序列取号
+        """
+        shadow = table + SHADOW_SUFFIX
+        stage = table + "_stage"
+        column_list = ', '.join(columns)
+        
+        cur.execute(f"DROP TABLE IF EXISTS {shadow}")
+        # 生成列(如milk_products.slice_hash)需随表结构一起复制，装载时自动计算
+        cur.execute(f"CREATE UNLOGGED TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED)")
+        cur.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA")
+        cur.copy_expert(f"COPY {stage} ({column_list}) FROM STDIN", CopyRowStream(rows))
+        
+        join_condition = ' AND '.join(f"l.{key} = s.{key}" for key in keys)
+        # 内容未变的行保留原updated_at，变更记录据此跳过未变化的行
+        unchanged = (f"ROW({', '.join(f'l.{c}' for c in columns)}) IS NOT DISTINCT FROM "
+                     f"ROW({', '.join(f's.{c}' for c in columns)})")
+        cur.execute(f"""
+            INSERT INTO {shadow} (id, {column_list}, created_at, updated_at)
+            SELECT COALESCE(l.id, nextval(pg_get_serial_sequence('{table}', 'id'))),
+                   {', '.join(f's.{c}' for c in columns)},
+                   COALESCE(l.created_at, NOW()),
+                   CASE WHEN l.id IS NOT NULL AND {unchanged} THEN l.updated_at ELSE NOW() END
+            FROM {stage} s
+            LEFT JOIN {table} l ON {join_condition}
+        """)
+        self.logger.info(f"影子表 {shadow} 已装入 {cur.rowcount} 行")
+    
+    def finalize_shadow_table(self, cur, table):
+        """
+        照线上表的定义为影子表补建主键、唯一约束、索引、外键和触发器，并转为记日志表
+        返回:
+            换表后需要改回原名的 (类型, 影子名称, 原名称) 列表
+        """
+        shadow = table + SHADOW_SUFFIX
+        renames = []
+        
+        cur.execute("""
+            SELECT conname, contype, pg_get_constraintdef(oid), confrelid::regclass::text
+            FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')
+            ORDER BY conname
+        """, (table,))
+        constraints = cur.fetchall()
+        
+        cur.execute("""
+            SELECT c.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+            ORDER BY c.relname
+        """, (table,))
+        indexes = cur.fetchall()
+        
+        cur.execute("""
+            SELECT pg_get_triggerdef(oid)
+            FROM pg_trigger
+            WHERE tgrelid = %s::regclass AND NOT tgisinternal
+            ORDER BY tgname
+        """, (table,))
+        triggers = [row[0] for row in cur.fetchall()]
+        
+        # 主键和唯一约束(连同其索引)在装载完成后一次性构建
+        for name, contype, definition, _ in constraints:
+            if contype != 'f':
+                cur.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow_name(name)} {definition}")
+                renames.append(('constraint', shadow_name(name), name))
+        
+        for name, definition in indexes:
+            definition = re.sub(r'^(CREATE (?:UNIQUE )?INDEX )(\S+)( ON (?:ONLY )?)(\S+)',
+                                lambda m: f"{m.group(1)}{shadow_name(name)}{m.group(3)}{shadow}",
+                                definition, count=1)
+            cur.execute(definition)
+            renames.append(('index', shadow_name(name), name))
+        
+        cur.execute(f"ALTER TABLE {shadow} SET LOGGED")
+        
+        # 外键指向被引用表的影子表(按依赖顺序处理，被引用表此时已是记日志表)
+        for name, contype, definition, referenced in constraints:
+            if contype == 'f':
+                if referenced in {t for t, _, _ in RELOAD_TABLES}:
+                    definition = definition.replace(f"REFERENCES {referenced}(",
+                                                    f"REFERENCES {referenced}{SHADOW_SUFFIX}(", 1)
+                cur.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow_name(name)} {definition}")
+                renames.append(('constraint', shadow_name(name), name))
+        
+        for definition in triggers:
+            cur.execute(re.sub(r' ON (\S+) ', f" ON {shadow} ", definition, count=1))
+        
+        return renames
+    
+    def record_shadow_changes(self, cur):
+        """比较影子表与线上表，把新增、更新和删除的产品记入本批次的变更记录"""
+        for table, _, keys in RELOAD_TABLES:
+            shadow = table + SHADOW_SUFFIX
+            join_condition = ' AND '.join(f"l.{key} = s.{key}" for key in keys)
+            pairs_sql = f"""
+                SELECT CASE WHEN l.id IS NULL THEN NULL ELSE to_jsonb(l) END,
+                       CASE WHEN s.id IS NULL THEN NULL ELSE to_jsonb(s) END
+                FROM {table} l
+                FULL JOIN {shadow} s ON {join_condition}
+                WHERE l.id IS NULL OR s.id IS NULL OR l.updated_at IS DISTINCT FROM s.updated_at
+            """
+            cur.execute("SELECT record_product_changes(%s, %s, %s)", (self.run_id, table, pairs_sql))
+    
+    def swap_shadow_tables(self, cur, renames):
+        """在一个短事务内用影子表替换线上表：加锁、移交序列、删旧表、改名"""
+        tables = [t for t, _, _ in RELOAD_TABLES]
+        
+        cur.execute("SET LOCAL lock_timeout = '10s'")
+        cur.execute(f"LOCK TABLE {', '.join(tables)} IN ACCESS EXCLUSIVE MODE")
+        
+        for table in tables:
+            cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+            sequence = cur.fetchone()[0]
+            if sequence:
+                cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}{SHADOW_SUFFIX}.id")
+        
+        for table in reversed(tables):
+            cur.execute(f"DROP TABLE {table}")
+        
+        for table in tables:
+            cur.execute(f"ALTER TABLE {table}{SHADOW_SUFFIX} RENAME TO {table}")
+            for kind, current, original in renames[table]:
+                if kind == 'constraint':
+                    cur.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {current} TO {original}")
+                else:
+                    cur.execute(f"ALTER INDEX {current} RENAME TO {original}")
+    
+    def drop_shadow_tables(self):
+        """清理残留的影子表"""
+        try:
+            self.conn.rollback()
+            with self.conn:
+                with self.conn.cursor() as cur:
+                    for table, _, _ in reversed(RELOAD_TABLES):
+                        cur.execute(f"DROP TABLE IF EXISTS {table}{SHADOW_SUFFIX}")
+        except Exception as e:
+            self.logger.error(f"清理影子表时出错: {e}")
+    
+    @tracing.traced('db')
+    @profiling.profiled()
+    def reload_data(self, data, swap_attempts=3):
+        """
+        整表重载：把完整数据集装入影子表，再在一个短事务内与线上表原子互换
+        读者要么看到旧的完整数据，要么看到新的完整数据；数据集中没有的产品会被删除
+        参数:
+            data: 完整数据集
+            swap_attempts: 换表时获取锁超时的最大尝试次数
+        返回:
+            {表名: 行数} 字典，失败时返回None
+        """
+        rows_by_table = self.build_reload_rows(data)
+        self.logger.info("开始整表重载: " + ", ".join(f"{t} {len(r)} 行" for t, r in rows_by_table.items()))
+        
+        start = time.time()
+        try:
+            # 装载阶段：只读线上表，不持有行锁
+            renames = {}
+            with self.conn:
+                with self.conn.cursor() as cur:
+                    for table, columns, keys in RELOAD_TABLES:
+                        with metrics.db_write(table) as write:
+                            self.load_shadow_table(cur, table, columns, keys, rows_by_table[table])
+                            write.rows = len(rows_by_table[table])
+                    for table, _, _ in RELOAD_TABLES:
+                        renames[table] = self.finalize_shadow_table(cur, table)
+                    if self.run_id is not None:
+                        self.record_shadow_changes(cur)
+            self.logger.info(f"影子表装载完成，耗时 {time.time() - start:.1f} 秒")
+            
+            # 换表阶段：只做元数据操作，持有排他锁的时间很短
+            for attempt in range(swap_attempts):
+                try:
+                    swap_start = time.time()
+                    with self.conn:
+                        with self.conn.cursor() as cur:
+                            self.swap_shadow_tables(cur, renames)
+                    self.logger.info(f"换表完成，排他锁持有 {(time.time() - swap_start) * 1000:.0f} ms")
+                    break
+                except errors.LockNotAvailable:
+                    self.logger.warning(f"换表获取锁超时 (第 {attempt + 1}/{swap_attempts} 次尝试)")
+                    if attempt == swap_attempts - 1:
+                        raise
+                    # 等待占用线上表的长查询结束，避免紧接着再次排队阻塞读者
+                    delay = SWAP_RETRY_DELAY * (attempt + 1) * (1 + random.random())
+                    self.logger.info(f"等待 {delay:.2f} 秒后重试换表...")
+                    tracing.sleep(delay)
+        except Exception as e:
+            self.logger.error(f"整表重载时出错，线上表保持不变: {e}")
+            self.drop_shadow_tables()
+            self.discard_run_changes()
+            return None
+        
+        # 换表已提交：更新统计信息失败只影响查询计划，不影响本次重载的结果
+        try:
+            with self.conn.cursor() as cur:
+                for table, _, _ in RELOAD_TABLES:
+                    cur.execute(f"ANALYZE {table}")
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            self.logger.warning(f"换表后更新统计信息失败，可稍后手动执行ANALYZE: {e}")
+        
+        return {table: len(rows) for table, rows in rows_by_table.items()}
+    
+    def acquire_import_lock(self, wait=IMPORT_LOCK_WAIT, poll=IMPORT_LOCK_POLL):
+        """
+        获取导入锁，被其他导入持有时每隔poll秒重试，超过wait秒仍未获得时抛出RuntimeError
+        参数:
+            wait: 最长等待时间(秒)
+            poll: 重试间隔(秒)
+        """
+        deadline = time.time() + wait
+        while True:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (IMPORT_LOCK_KEY,))
+                if cur.fetchone()[0]:
+                    return
+                cur.execute("""
+                    SELECT l.pid, a.application_name, a.state, NOW() - a.xact_start
+                    FROM pg_locks l LEFT JOIN pg_stat_activity a ON a.pid = l.pid
+                    WHERE l.locktype = 'advisory' AND l.granted
+                      AND ((l.classid::BIGINT << 32) | l.objid::BIGINT) = %s
+                """, (IMPORT_LOCK_KEY,))
+                holder = cur.fetchone()
+            self.conn.commit()
+            holder_text = (f"进程 {holder[0]} ({holder[1] or '未知程序'}，状态 {holder[2]}，事务已进行 {holder[3]})"
+                           if holder else "其他会话")
+            if time.time() + poll > deadline:
+                raise RuntimeError(f"导入锁被{holder_text}持有，等待 {wait} 秒后仍未释放，放弃本次导入")
+            self.logger.warning(f"导入锁被{holder_text}持有，{poll} 秒后重试")
+            tracing.sleep(poll)
+    
+    def start_run(self, source_file=None):
+        """
+        开始一个导入批次：获取导入锁、登记批次，并为会话设置nfzk.run_id供变更触发器使用
+        返回:
+            批次ID
+        """
+        self.acquire_import_lock()
+        with self.conn.cursor() as cur:
+            # 持有导入锁时仍处于running的批次必然来自中途退出的进程
+            cur.execute("""
+                UPDATE import_runs SET status = 'failed', finished_at = NOW()
+                WHERE status = 'running'
+            """)
+            cur.execute(
+                "INSERT INTO import_runs (mode, source_file) VALUES (%s, %s) RETURNING id",
+                (self.mode, source_file)
+            )
+            self.run_id = cur.fetchone()[0]
+            cur.execute("SELECT set_config('nfzk.run_id', %s, false)", (str(self.run_id),))
+        self.conn.commit()
+        
+        self.logger.info(f"导入批次 {self.run_id} 开始")
+        return self.run_id
+    
+    @tracing.traced('db')
+    def finish_run(self, success):
+        """结束导入批次：统计变更、更新批次状态并通知变更消费者，随后释放导入锁"""
+        if self.run_id is None:
+            return
+        
+        try:
+            self.conn.rollback()
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE import_runs r SET
+                        status = %s,
+                        finished_at = NOW(),
+                        inserted = c.inserted,
+                        updated = c.updated,
+                        deleted = c.deleted
+                    FROM (
+                        SELECT count(*) FILTER (WHERE op = 'I') AS inserted,
+                               count(*) FILTER (WHERE op = 'U') AS updated,
+                               count(*) FILTER (WHERE op = 'D') AS deleted
+                        FROM product_changes WHERE run_id = %s
+                    ) c
+                    WHERE r.id = %s
+                    RETURNING c.inserted, c.updated, c.deleted
+                """, ('success' if success else 'failed', self.run_id, self.run_id))
+                inserted, updated, deleted = cur.fetchone()
+                # NOTIFY在事务提交时才送达，消费者收到时批次状态已可见
+                cur.execute("SELECT pg_notify(%s, %s)", (CHANGES_CHANNEL, str(self.run_id)))
+                cur.execute("SELECT set_config('nfzk.run_id', '', false)")
+                cur.execute("SELECT pg_advisory_unlock(%s)", (IMPORT_LOCK_KEY,))
+            self.conn.commit()
+            self.logger.info(f"导入批次 {self.run_id} 结束: 新增 {inserted}，更新 {updated}，删除 {deleted} 个产品")
+        except Exception as e:
+            self.logger.error(f"结束导入批次时出错: {e}")
+        finally:
+            self.last_run_id = self.run_id
+            self.run_id = None
+    
+    def discard_run_changes(self):
+        """丢弃本批次已记录但未实际生效的变更(整表重载失败时)"""
+        if self.run_id is None:
+            return
+        try:
+            self.conn.rollback()
+            with self.conn:
+                with self.conn.cursor() as cur:
+                    cur.execute("DELETE FROM product_changes WHERE run_id = %s", (self.run_id,))
+        except Exception as e:
+            self.logger.error(f"丢弃批次变更记录时出错: {e}")
+    
+    @tracing.traced('db')
     def import_data(self, json_file=None):
         """执行完整的数据导入过程"""
         # 加载JSON数据
@@ -365,32 +785,82 @@ class DatabaseImporter:
             self.logger.error("没有数据可以导入!")
             return False
         
+        success = False
         try:
+            self.start_run(file_path)
+            
+            if self.mode == "reload":
+                success = self.import_data_reload(data)
+                if success:
+                    request_log.record_stored(len(data), sink='db')
+                return success
+            
             # 导入产品基本信息
-            products_count = self.import_products(data)
+            with metrics.db_write('milk_products') as write:
+                products_count = write.rows = self.import_products(data)
             
             # 导入产品详情信息
-            details_count = self.import_product_details(data)
+            with metrics.db_write('milk_product_details') as write:
+                details_count = write.rows = self.import_product_details(data)
+            
+            # 增量维护配料倒排索引
+            with metrics.db_write('product_ingredients') as write:
+                ingredient_count = write.rows = self.import_ingredient_index(data)
             
             # 导入营养成分信息
-            nutrients_count = self.import_nutrients(data)
+            with metrics.db_write('milk_product_nutrients') as write:
+                nutrients_count = write.rows = self.import_nutrients(data)
             
             # 导入额外详情信息
-            extra_details_count = self.import_extra_details(data)
+            with metrics.db_write('milk_product_extra_details') as write:
+                extra_details_count = write.rows = self.import_extra_details(data)
+            
+            # 刷新本次涉及产品的宽表行
+            with metrics.db_write('product_full') as write:
+                full_count = write.rows = self.refresh_product_full(data)
             
             self.logger.info(f"数据导入完成，共导入或更新了:")
             self.logger.info(f"- {products_count} 条产品基本信息")
             self.logger.info(f"- {details_count} 条产品详情信息")
+            self.logger.info(f"- {ingredient_count} 个产品的配料索引")
             self.logger.info(f"- {nutrients_count} 条营养成分信息")
             self.logger.info(f"- {extra_details_count} 条额外详情信息")
+            self.logger.info(f"- {full_count} 个产品的宽表行")
             
+            request_log.record_stored(products_count, sink='db')
+            success = True
             return True
         except Exception as e:
             self.logger.error(f"导入数据时出错: {e}")
             return False
         finally:
+            # 记录批次结果并通知变更消费者
+            self.finish_run(success)
+            
             # 关闭数据库连接
             self.close_db()
+    
+    def import_data_reload(self, data):
+        """以整表重载模式导入，随后维护依赖产品表的派生数据"""
+        counts = self.reload_data(data)
+        if counts is None:
+            return False
+        
+        # 清理已消失产品的配料索引，再增量维护配料表有变化的产品
+        IngredientIndexer(self.conn, logger=self.logger).prune_missing_products()
+        ingredient_count = self.import_ingredient_index(data)
+        
+        # 整表重载可能删除产品，宽表需全量刷新
+        full_count = self.refresh_product_full()
+        
+        self.logger.info(f"整表重载完成，线上表现有:")
+        self.logger.info(f"- {counts['milk_products']} 条产品基本信息")
+        self.logger.info(f"- {counts['milk_product_details']} 条产品详情信息")
+        self.logger.info(f"- {ingredient_count} 个产品的配料索引被重建")
+        self.logger.info(f"- {counts['milk_product_nutrients']} 条营养成分信息")
+        self.logger.info(f"- {counts['milk_product_extra_details']} 条额外详情信息")
+        self.logger.info(f"- {full_count} 个产品的宽表行")
+        return True
 
 def main():
     """主函数"""
@@ -402,6 +872,9 @@ def main():
     parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
     parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
     parser.add_argument("--file", type=str, required=True, help="要导入的JSON文件路径")
+    parser.add_argument("--mode", type=str, default="upsert", choices=IMPORT_MODES,
+                        help="导入模式：upsert为分批增量更新(默认)，reload为影子表整表重载后原子换表")
+    profiling.add_argument(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
@@ -410,24 +883,26 @@ def main():
     print("奶粉智库数据导入器启动")
     print("=" * 50)
     
-    # 初始化数据库导入器
-    importer = DatabaseImporter(
-        host=args.host,
-        port=args.port,
-        dbname=args.dbname,
-        user=args.user,
-        password=args.password,
-        json_file=args.file
-    )
-    
-    # 执行数据导入
-    success = importer.import_data()
-    
-    if success:
-        print("数据导入成功!")
-    else:
-        print("数据导入失败!")
-        sys.exit(1)
+    with profiling.session('db_import', args.profile), run_status.run('db_import'):
+        # 初始化数据库导入器
+        importer = DatabaseImporter(
+            host=args.host,
+            port=args.port,
+            dbname=args.dbname,
+            user=args.user,
+            password=args.password,
+            json_file=args.file,
+            mode=args.mode
+        )
+    
+        # 执行数据导入
+        success = importer.import_data()
+    
+        if success:
+            print("数据导入成功!")
+        else:
+            print("数据导入失败!")
+            sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# 失败的抓取阶段：详情页、额外详情接口
+STAGES = ('detail', 'more_detail')
+
+# 重试间隔：首次失败后1小时，此后每次翻倍，最长7天
+BASE_DELAY = timedelta(hours=1)
+MAX_DELAY = timedelta(days=7)
+
+# 累计失败这么多次后放弃重试，记录保留以便人工排查
+MAX_ATTEMPTS = 8
+
+
+def backoff_delay(attempts, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+    """第attempts次失败后到下一次重试的间隔"""
+    return min(base_delay * (2 ** max(attempts - 1, 0)), max_delay)
+
+
+class DeadLetterStore:
+    """失败抓取的持久化记录：跨运行保存(产品ID, 阶段, 错误, 尝试次数)，按退避时间安排重试"""
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        """
+        初始化失败记录
+        参数:
+            path: JSON文件路径，不存在时视为空
+            max_attempts: 累计失败多少次后放弃重试
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = {self.key(e['product_id'], e['stage']): e for e in json.load(f)}
+
+    @staticmethod
+    def key(product_id, stage):
+        return f"{stage}:{product_id}"
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record_failure(self, product_id, stage, error):
+        """
+        记录一次失败，并按已失败次数推迟下一次重试
+        参数:
+            product_id: 产品ID
+            stage: 失败的阶段(detail/more_detail)
+            error: 失败原因
+        """
+        if stage not in STAGES:
+            raise ValueError(f"未知的抓取阶段: {stage}")
+        product_id = str(product_id)
+        now = datetime.now()
+        entry = self.entries.setdefault(self.key(product_id, stage), {
+            'product_id': product_id,
+            'stage': stage,
+            'attempts': 0,
+            'first_failed_at': now.isoformat(),
+        })
+        entry['attempts'] += 1
+        entry['error'] = str(error)
+        entry['last_failed_at'] = now.isoformat()
+        if entry['attempts'] >= self.max_attempts:
+            entry['abandoned'] = True
+            entry['next_attempt_at'] = None
+        else:
+            entry['next_attempt_at'] = (now + backoff_delay(entry['attempts'])).isoformat()
+
+    def resolve(self, product_id, stage):
+        """抓取成功后移除记录，返回是否存在该记录"""
+        return self.entries.pop(self.key(str(product_id), stage), None) is not None
+
+    def due(self, now=None, limit=None):
+        """
+        返回已到重试时间的记录，最早失败的排在前面
+        参数:
+            now: 当前时间，默认为现在
+            limit: 最多返回的记录数
+        """
+        now = (now or datetime.now()).isoformat()
+        entries = [e for e in self.entries.values()
+                   if not e.get('abandoned') and e['next_attempt_at'] <= now]
+        entries.sort(key=lambda e: e['first_failed_at'])
+        return entries[:limit] if limit else entries
+
+    def save(self):
+        """写入JSON文件(先写临时文件再替换，避免中途退出留下损坏的文件)"""
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.dead_letters_', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(sorted(self.entries.values(), key=lambda e: (e['stage'], e['product_id'])),
+                          f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="查看失败抓取记录")
+    parser.add_argument("--file", "-f", type=str, default="data/dead_letters.json", help="失败记录文件，默认为data/dead_letters.json")
+    parser.add_argument("--due", action="store_true", help="只显示已到重试时间的记录")
+    parser.add_argument("--retry-abandoned", action="store_true", help="把已放弃的记录重新加入重试")
+    args = parser.parse_args()
+
+    store = DeadLetterStore(args.file)
+    if args.retry_abandoned:
+        for entry in store.entries.values():
+            if entry.pop('abandoned', False):
+                entry['attempts'] = 0
+                entry['next_attempt_at'] = datetime.now().isoformat()
+        store.save()
+
+    entries = store.due() if args.due else sorted(store.entries.values(), key=lambda e: e['first_failed_at'])
+    print(f"共 {len(entries)} 条失败记录")
+    for e in entries:
+        state = '已放弃' if e.get('abandoned') else f"下次重试 {e['next_attempt_at'][:19]}"
+        print(f"{e['stage']}\t{e['product_id']}\t尝试{e['attempts']}次\t{state}\t{e['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import aiohttp
+import psycopg2
+from psycopg2 import extras
+
+import metrics
+import run_status
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow为可选依赖，缺失时只下载原图
+    Image = None
+
+# 内容类型到扩展名的映射，未知类型时使用URL中的扩展名
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/svg+xml': '.svg',
+}
+
+# 默认生成的缩放变体(最长边像素)
+DEFAULT_VARIANT_SIZES = (120, 320)
+
+
+def content_path(digest, extension):
+    """按内容摘要生成两级目录的相对路径，如 ab/cd/abcd....jpg"""
+    return os.path.join(digest[:2], digest[2:4], digest + extension)
+
+
+def make_variants(image_dir, relative_path, sizes):
+    """
+    生成缩放变体(在进程池中执行，避免缩放占用事件循环)
+    参数:
+        image_dir: 图片根目录
+        relative_path: 原图相对路径
+        sizes: 最长边像素列表
+    返回:
+        {最长边像素(字符串): 变体相对路径} 字典
+    """
+    base, _ = os.path.splitext(relative_path)
+    variants = {}
+    with Image.open(os.path.join(image_dir, relative_path)) as img:
+        img.load()
+        if img.mode in ('RGBA', 'LA') or 'transparency' in img.info:
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.split()[-1])
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        for size in sizes:
+            variant_path = f"{base}_{size}.jpg"
+            target = os.path.join(image_dir, variant_path)
+            # 内容寻址：同名变体必然由相同原图生成，已存在时无需重做
+            if not os.path.exists(target):
+                variant = img.copy()
+                variant.thumbnail((size, size))
+                tmp_path = f"{target}.{os.getpid()}.tmp"
+                variant.save(tmp_path, format='JPEG', quality=85, optimize=True)
+                os.replace(tmp_path, target)
+            variants[str(size)] = variant_path
+    return variants
+
+
+class ImageDownloader:
+    """产品图片下载：并发下载缩略图和图标，按内容寻址存储并生成缩放变体"""
+
+    def __init__(self, conn, image_dir="data/images", concurrency=8, variant_sizes=DEFAULT_VARIANT_SIZES,
+                 timeout=30, process_workers=None, logger=None):
+        """
+        初始化图片下载器
+        参数:
+            conn: 数据库连接
+            image_dir: 图片存储目录
+            concurrency: 最大并发下载数
+            variant_sizes: 缩放变体的最长边像素，为空时不生成变体
+            timeout: 单个请求超时(秒)
+            process_workers: 生成变体的进程数，默认为CPU核数
+            logger: 日志对象
+        """
+        self.conn = conn
+        self.image_dir = image_dir
+        self.concurrency = concurrency
+        self.variant_sizes = tuple(variant_sizes or ())
+        self.timeout = timeout
+        self.process_workers = process_workers
+        self.logger = logger or logging.getLogger("ImageDownloader")
+
+        if self.variant_sizes and Image is None:
+            self.logger.warning("未安装Pillow，只下载原图，不生成缩放变体")
+            self.variant_sizes = ()
+
+    def collect(self, product_ids=None):
+        """
+        同步product_images并返回待检查的图片
+        参数:
+            product_ids: 只处理这些产品，None表示全部产品
+        返回:
+            {URL: image_assets中已有的记录或None} 字典
+        """
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT p.product_id, v.kind, v.url
+                    FROM milk_products p
+                    CROSS JOIN LATERAL (VALUES ('thumbnail', p.thumbnail), ('icon', p.icon)) AS v(kind, url)
+                    WHERE v.url ~* '^https?://'
+                      AND (%(ids)s::integer[] IS NULL OR p.product_id = ANY(%(ids)s::integer[]))
+                    """,
+                    {'ids': product_ids}
+                )
+                links = cur.fetchall()
+
+                # 产品的图片字段被清空或改变时，关联随之更新
+                cur.execute(
+                    "DELETE FROM product_images WHERE %(ids)s::integer[] IS NULL OR product_id = ANY(%(ids)s::integer[])",
+                    {'ids': product_ids}
+                )
+                if links:
+                    extras.execute_values(
+                        cur,
+                        "INSERT INTO product_images (product_id, kind, url) VALUES %s",
+                        links,
+                        page_size=1000
+                    )
+
+                urls = sorted({url for _, _, url in links})
+                cur.execute(
+                    """
+                    SELECT url, sha256, local_path, variants, etag, last_modified, status
+                    FROM image_assets WHERE url = ANY(%s)
+                    """,
+                    (urls,)
+                )
+                columns = [d[0] for d in cur.description]
+                known = {row[0]: dict(zip(columns, row)) for row in cur.fetchall()}
+
+        self.logger.info(f"共 {len(links)} 个产品图片引用，去重后 {len(urls)} 个URL，其中 {len(known)} 个已有记录")
+        return {url: known.get(url) for url in urls}
+
+    def run(self, product_ids=None):
+        """
+        下载图片并记录本地路径
+        参数:
+            product_ids: 只处理这些产品，None表示全部产品
+        返回:
+            各结果的计数：downloaded新下载、deduplicated内容已存在、not_modified未变化、failed失败
+        """
+        targets = self.collect(product_ids)
+        if not targets:
+            return Counter()
+
+        os.makedirs(self.image_dir, exist_ok=True)
+        start = time.perf_counter()
+        with run_status.progress('images', len(targets), unit="图片", desc="下载图片") as bar:
+            results = asyncio.run(self.download_all(targets, bar))
+        self.save_results(results)
+
+        stats = Counter(result['outcome'] for result in results)
+        metrics.record_stage('images', len(results) - stats['failed'], stats['failed'], time.perf_counter() - start)
+        self.logger.info(f"图片下载完成: 新下载 {stats['downloaded']}，内容已存在 {stats['deduplicated']}，"
+                         f"未变化 {stats['not_modified']}，失败 {stats['failed']}")
+        return stats
+
+    async def download_all(self, targets, bar=None):
+        """以有限并发下载全部图片，bar为运行状态中的阶段进度"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        process_pool = ProcessPoolExecutor(max_workers=self.process_workers) if self.variant_sizes else None
+
+        try:
+            async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                return await asyncio.gather(*[
+                    self.fetch_tracked(session, semaphore, process_pool, url, known, bar, len(targets))
+                    for url, known in targets.items()
+                ])
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown(wait=True)
+
+    async def fetch_tracked(self, session, semaphore, process_pool, url, known, bar, total):
+        """下载单个图片并更新阶段进度和待下载数"""
+        result = await self.fetch(session, semaphore, process_pool, url, known)
+        if bar is not None:
+            bar.update(1)
+            if result['outcome'] == 'failed':
+                bar.error()
+            run_status.set_queue('image_downloads', total - bar.stage.done)
+        return result
+
+    async def fetch(self, session, semaphore, process_pool, url, known):
+        """下载单个图片：已有本地文件时发送条件请求，内容已存在时不重复写入"""
+        headers = {}
+        has_local = bool(known and known['status'] == 'ok' and known['local_path']
+                         and os.path.exists(os.path.join(self.image_dir, known['local_path'])))
+        if has_local:
+            if known['etag']:
+                headers['If-None-Match'] = known['etag']
+            if known['last_modified']:
+                headers['If-Modified-Since'] = known['last_modified']
+
+        status = 'error'
+        body = b''
+        start = None
+        try:
+            async with semaphore:
+                start = time.perf_counter()
+                async with session.get(url, headers=headers) as resp:
+                    status = resp.status
+                    if resp.status == 304 and has_local:
+                        return {'url': url, 'outcome': 'not_modified'}
+                    if resp.status != 200:
+                        return {'url': url, 'outcome': 'failed', 'error': f"HTTP {resp.status}"}
+                    body = await resp.read()
+                    content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                    etag = resp.headers.get('ETag')
+                    last_modified = resp.headers.get('Last-Modified')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+            return {'url': url, 'outcome': 'failed', 'error': str(e) or type(e).__name__}
+        finally:
+            if start is not None:
+                metrics.record_request('image', url, status, time.perf_counter() - start, len(body))
+
+        digest = hashlib.sha256(body).hexdigest()
+        extension = CONTENT_TYPE_EXTENSIONS.get(content_type) or os.path.splitext(url.split('?')[0])[1][:10] or '.bin'
+        relative_path = content_path(digest, extension)
+        target = os.path.join(self.image_dir, relative_path)
+
+        loop = asyncio.get_running_loop()
+        existed = os.path.exists(target)
+        if not existed:
+            await loop.run_in_executor(None, self._write_file, target, body)
+
+        variants = {}
+        if known and known['sha256'] == digest:
+            variants = known['variants'] or {}
+        if process_pool is not None and content_type != 'image/svg+xml' \
+                and set(variants) != {str(s) for s in self.variant_sizes}:
+            try:
+                variants = await loop.run_in_executor(process_pool, make_variants,
+                                                      self.image_dir, relative_path, self.variant_sizes)
+            except Exception as e:
+                self.logger.warning(f"生成缩放变体失败 {url}: {e}")
+
+        return {
+            'url': url,
+            'outcome': 'deduplicated' if existed else 'downloaded',
+            'sha256': digest,
+            'local_path': relative_path,
+            'variants': variants,
+            'content_type': content_type or None,
+            'size_bytes': len(body),
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+
+    @staticmethod
+    def _write_file(path, body):
+        """先写临时文件再改名，避免并发读到半个文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def save_results(self, results):
+        """把下载结果写入image_assets"""
+        fetched = [r for r in results if r['outcome'] in ('downloaded', 'deduplicated')]
+        not_modified = [r['url'] for r in results if r['outcome'] == 'not_modified']
+        failed = [(r['url'], r['error']) for r in results if r['outcome'] == 'failed']
+
+        with self.conn:
+            with self.conn.cursor() as cur:
+                if fetched:
+                    extras.execute_values(
+                        cur,
+                        """
+                        INSERT INTO image_assets (url, sha256, local_path, variants, content_type, size_bytes,
+                                                  etag, last_modified, status, error, fetched_at, checked_at)
+                        VALUES %s
+                        ON CONFLICT (url) DO UPDATE SET
+                            sha256 = EXCLUDED.sha256,
+                            local_path = EXCLUDED.local_path,
+                            variants = EXCLUDED.variants,
+                            content_type = EXCLUDED.content_type,
+                            size_bytes = EXCLUDED.size_bytes,
+                            etag = EXCLUDED.etag,
+                            last_modified = EXCLUDED.last_modified,
+                            status = 'ok',
+                            error = NULL,
+                            fetched_at = NOW(),
+                            checked_at = NOW()
+                        """,
+                        [(r['url'], r['sha256'], r['local_path'], extras.Json(r['variants']), r['content_type'],
+                          r['size_bytes'], r['etag'], r['last_modified']) for r in fetched],
+                        template="(%s, %s, %s, %s, %s, %s, %s, %s, 'ok', NULL, NOW(), NOW())",
+                        page_size=500
+                    )
+                if not_modified:
+                    cur.execute("UPDATE image_assets SET checked_at = NOW() WHERE url = ANY(%s)", (not_modified,))
+                if failed:
+                    # 失败时保留之前下载的文件和路径，只记录状态
+                    extras.execute_values(
+                        cur,
+                        """
+                        INSERT INTO image_assets (url, status, error, checked_at) VALUES %s
+                        ON CONFLICT (url) DO UPDATE SET
+                            status = CASE WHEN image_assets.local_path IS NULL THEN 'failed' ELSE image_assets.status END,
+                            error = EXCLUDED.error,
+                            checked_at = NOW()
+                        """,
+                        failed,
+                        template="(%s, 'failed', %s, NOW())",
+                        page_size=500
+                    )
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="下载产品缩略图和图标到本地，按内容寻址存储")
+    parser.add_argument("--image-dir", type=str, default="data/images", help="图片存储目录，默认为data/images")
+    parser.add_argument("--concurrency", type=int, default=8, help="最大并发下载数，默认为8")
+    parser.add_argument("--variant-size", type=int, action="append",
+                        help="缩放变体的最长边像素，可重复指定，默认为120和320")
+    parser.add_argument("--no-variants", action="store_true", help="不生成缩放变体")
+    parser.add_argument("--product-id", type=int, action="append", help="只处理指定产品，可重复指定")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+    downloader = ImageDownloader(
+        conn,
+        image_dir=args.image_dir,
+        concurrency=args.concurrency,
+        variant_sizes=() if args.no_variants else (args.variant_size or DEFAULT_VARIANT_SIZES)
+    )
+
+    try:
+        stats = downloader.run(product_ids=args.product_id)
+    finally:
+        conn.close()
+
+    if stats['failed']:
+        print(f"有 {stats['failed']} 个图片下载失败，详见image_assets.error")
+
+
+if __name__ == "__main__":
+    main()
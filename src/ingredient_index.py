@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import hashlib
+import logging
+import re
+import unicodedata
+import psycopg2
+from psycopg2 import extras
+
+# 切分规则的版本，计入配料表指纹；修改切分规则时加1，使原文未变的产品也重新索引
+TOKENIZER_VERSION = 2
+
+# 顶层分隔符(NFKC规范化后全角的，；会变成半角)
+SEPARATORS = {'、', ',', ';'}
+
+# 顶层句末标点：配料表到此结束，之后是"本产品含有乳成分"之类的说明文字
+TERMINATORS = {'。'}
+
+# 括号对：括号内若是配料列表则展开为子配料，否则视为名称的一部分(如"低聚半乳糖(GOS)")
+BRACKETS = {'(': ')', '【': '】', '[': ']', '{': '}'}
+
+# 配料表开头常见的标题前缀
+PREFIX_PATTERN = re.compile(r'^(配料表|配料)\s*[:：]\s*')
+
+# 名称首尾需要去掉的标点
+STRIP_CHARS = ' \t\r\n.。:：*'
+
+
+def normalize_name(name):
+    """
+    规范化配料名称：全角转半角、去除首尾标点、拉丁字母小写
+    参数:
+        name: 原始配料名称
+    返回:
+        规范化后的名称
+    """
+    name = unicodedata.normalize('NFKC', name or '')
+    name = re.sub(r'\s+', '', name)
+    return name.strip(STRIP_CHARS).lower()
+
+
+def _split_top_level(text):
+    """按顶层分隔符切分文本，括号内的分隔符以及数字之间的逗号(如"1,3-二油酸")不切分，遇到顶层句号即结束"""
+    parts = []
+    depth = 0
+    closing = []
+    current = []
+    for i, ch in enumerate(text):
+        if ch in BRACKETS:
+            closing.append(BRACKETS[ch])
+            depth += 1
+        elif closing and ch == closing[-1]:
+            closing.pop()
+            depth -= 1
+        elif depth == 0 and ch in TERMINATORS:
+            break
+        elif depth == 0 and ch in SEPARATORS:
+            if ch == ',' and 0 < i < len(text) - 1 and text[i - 1].isdigit() and text[i + 1].isdigit():
+                current.append(ch)
+                continue
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append(''.join(current))
+    return [p for p in parts if p.strip(STRIP_CHARS)]
+
+
+def _expand(item, names):
+    """展开单个配料项：复合配料"基粉【A、B】"产生"基粉"、"A"、"B"三项"""
+    item = item.strip(STRIP_CHARS)
+    start = _matching_open(item)
+    if start > 0:
+        children = _split_top_level(item[start + 1:-1])
+        if len(children) > 1:
+            names.append(item[:start])
+            for child in children:
+                _expand(child, names)
+            return
+    names.append(item)
+
+
+def _matching_open(item):
+    """返回与末尾右括号配对的左括号位置，末尾不是右括号时返回-1"""
+    if not item or item[-1] not in BRACKETS.values():
+        return -1
+    depth = 0
+    for i in range(len(item) - 1, -1, -1):
+        ch = item[i]
+        if ch in BRACKETS.values():
+            depth += 1
+        elif ch in BRACKETS:
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def tokenize_ingredients(text):
+    """
+    将配料表文本切分为有序的规范化配料名称列表
+    参数:
+        text: 配料表原文(详情页的配料表或接口的mixture字段)
+    返回:
+        去重后按出现顺序排列的配料名称列表
+    """
+    if not text:
+        return []
+
+    text = unicodedata.normalize('NFKC', str(text)).strip()
+    text = PREFIX_PATTERN.sub('', text)
+
+    raw_names = []
+    for item in _split_top_level(text):
+        _expand(item, raw_names)
+
+    names = []
+    seen = set()
+    for raw in raw_names:
+        name = normalize_name(raw)
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name[:255])
+    return names
+
+
+def source_hash(text):
+    """计算配料表原文的指纹，包含切分规则版本，规则变化后所有产品都会重新索引"""
+    return hashlib.md5(f"{TOKENIZER_VERSION}:{text or ''}".encode('utf-8')).hexdigest()
+
+
+class IngredientIndexer:
+    """配料倒排索引：维护ingredients字典表和product_ingredients关联表"""
+
+    def __init__(self, conn, logger=None):
+        """
+        初始化配料索引
+        参数:
+            conn: 数据库连接
+            logger: 日志对象
+        """
+        self.conn = conn
+        self.logger = logger or logging.getLogger("IngredientIndexer")
+
+    def sync(self, data):
+        """
+        为配料表文本发生变化的产品重建配料关联
+        参数:
+            data: 产品数据列表，使用其中的id和配料表字段
+        返回:
+            (重建索引的产品数, 跳过的未变化产品数)
+        """
+        sources = {}
+        for item in data:
+            if '配料表' not in item:
+                continue
+            try:
+                product_id = int(item.get('id'))
+            except (TypeError, ValueError):
+                continue
+            text = item.get('配料表') or ''
+            if not isinstance(text, str):
+                text = str(text)
+            sources[product_id] = text
+
+        if not sources:
+            return 0, 0
+
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "SELECT product_id, source_hash FROM product_ingredient_sources WHERE product_id = ANY(%s)",
+                    (list(sources.keys()),)
+                )
+                existing = dict(cur.fetchall())
+
+                changed = {pid: text for pid, text in sources.items()
+                           if existing.get(pid) != source_hash(text)}
+                if not changed:
+                    self.logger.info(f"配料索引: {len(sources)} 个产品配料表均未变化，无需重建")
+                    return 0, len(sources)
+
+                tokens = {pid: tokenize_ingredients(text) for pid, text in changed.items()}
+                ingredient_ids = self._ensure_ingredients(cur, {n for names in tokens.values() for n in names})
+
+                changed_ids = list(changed.keys())
+                cur.execute("DELETE FROM product_ingredients WHERE product_id = ANY(%s)", (changed_ids,))
+
+                links = [(pid, ingredient_ids[name], position)
+                         for pid, names in tokens.items()
+                         for position, name in enumerate(names, start=1)]
+                if links:
+                    extras.execute_values(
+                        cur,
+                        "INSERT INTO product_ingredients (product_id, ingredient_id, position) VALUES %s",
+                        links,
+                        page_size=1000
+                    )
+
+                extras.execute_values(
+                    cur,
+                    """
+                    INSERT INTO product_ingredient_sources (product_id, source_hash)
+                    VALUES %s
+                    ON CONFLICT (product_id)
+                    DO UPDATE SET source_hash = EXCLUDED.source_hash, indexed_at = NOW()
+                    """,
+                    [(pid, source_hash(text)) for pid, text in changed.items()],
+                    page_size=1000
+                )
+
+        self.logger.info(f"配料索引: 重建 {len(changed)} 个产品，{len(sources) - len(changed)} 个产品配料表未变化")
+        return len(changed), len(sources) - len(changed)
+
+    def prune_missing_products(self):
+        """
+        删除已不在产品表中的产品的配料关联(整表重载后调用)
+        返回:
+            被清理的产品数
+        """
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM product_ingredient_sources s
+                    WHERE NOT EXISTS (SELECT 1 FROM milk_products p WHERE p.product_id = s.product_id)
+                    RETURNING product_id
+                """)
+                removed = [row[0] for row in cur.fetchall()]
+                if removed:
+                    cur.execute("DELETE FROM product_ingredients WHERE product_id = ANY(%s)", (removed,))
+        
+        if removed:
+            self.logger.info(f"配料索引: 清理了 {len(removed)} 个已消失产品的配料关联")
+        return len(removed)
+
+    def _ensure_ingredients(self, cur, names):
+        """确保配料名称都在字典表中，返回名称到ID的映射"""
+        if not names:
+            return {}
+        names = sorted(names)
+        cur.execute(
+            "INSERT INTO ingredients (name) SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING",
+            (names,)
+        )
+        cur.execute("SELECT name, id FROM ingredients WHERE name = ANY(%s)", (names,))
+        return dict(cur.fetchall())
+
+    def find_products(self, include=None, exclude=None):
+        """
+        按配料查找产品：包含include中的全部配料且不包含exclude中的任一配料
+        参数:
+            include: 必须包含的配料名称列表
+            exclude: 必须排除的配料名称列表
+        返回:
+            产品ID列表(升序)
+        """
+        include = [normalize_name(n) for n in (include or []) if normalize_name(n)]
+        exclude = [normalize_name(n) for n in (exclude or []) if normalize_name(n)]
+
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT name, id FROM ingredients WHERE name = ANY(%s)", (include + exclude,))
+            ids = dict(cur.fetchall())
+
+            missing = [n for n in include if n not in ids]
+            if missing:
+                self.logger.info(f"配料字典中不存在: {', '.join(missing)}")
+                self.conn.rollback()
+                return []
+
+            parts = []
+            params = []
+            if include:
+                for name in include:
+                    parts.append("SELECT product_id FROM product_ingredients WHERE ingredient_id = %s")
+                    params.append(ids[name])
+                sql = " INTERSECT ".join(parts)
+            else:
+                sql = "SELECT product_id FROM product_ingredient_sources"
+
+            for name in exclude:
+                if name in ids:
+                    sql = f"({sql}) EXCEPT SELECT product_id FROM product_ingredients WHERE ingredient_id = %s"
+                    params.append(ids[name])
+
+            cur.execute(f"SELECT product_id FROM ({sql}) AS matched ORDER BY product_id", params)
+            product_ids = [row[0] for row in cur.fetchall()]
+        self.conn.rollback()
+        return product_ids
+
+    def suggest(self, keyword, limit=20):
+        """
+        在配料字典中查找包含关键词的配料名称
+        参数:
+            keyword: 关键词
+            limit: 最大返回数
+        返回:
+            (配料名称, 使用该配料的产品数) 列表
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT i.name, count(pi.product_id) AS products
+                FROM ingredients i
+                LEFT JOIN product_ingredients pi ON pi.ingredient_id = i.id
+                WHERE i.name LIKE %s
+                GROUP BY i.name
+                ORDER BY products DESC, i.name
+                LIMIT %s
+                """,
+                (f"%{normalize_name(keyword)}%", limit)
+            )
+            rows = cur.fetchall()
+        self.conn.rollback()
+        return rows
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按配料查询产品：包含全部--with配料且不包含任一--without配料")
+    parser.add_argument("--with", dest="include", action="append", default=[], help="必须包含的配料，可重复指定")
+    parser.add_argument("--without", dest="exclude", action="append", default=[], help="必须排除的配料，可重复指定")
+    parser.add_argument("--suggest", type=str, help="在配料字典中查找包含该关键词的配料名称")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    if not args.suggest and not args.include and not args.exclude:
+        parser.error("至少需要指定 --with、--without 或 --suggest 之一")
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+    indexer = IngredientIndexer(conn)
+
+    try:
+        if args.suggest:
+            for name, products in indexer.suggest(args.suggest):
+                print(f"{name}\t{products}")
+            return
+
+        product_ids = indexer.find_products(include=args.include, exclude=args.exclude)
+        print(f"共找到 {len(product_ids)} 个产品")
+        for product_id in product_ids:
+            print(product_id)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import random
+import hashlib
+import logging
+import signal
+import threading
+from datetime import datetime
+
+from psycopg2 import pool
+
+import metrics
+import tracing
+
+from naifenzhiku_crawler import NaifenzhikuCrawler
+from recrawl_planner import VOLATILE_FIELDS
+from scheduled_crawler import ScheduledCrawler
+from crawler_daemon import create_session
+
+DEFAULT_WATCH_PAGES = 2
+DEFAULT_WATCH_INTERVAL = 600
+
+# 计算页面摘要时忽略的字段：点击数及其在原始接口中的各种字段名(process_product_data会原样保留)
+DIGEST_IGNORED_FIELDS = set(VOLATILE_FIELDS) | {'clicks', 'm_click', 'views'}
+
+
+def page_digest(products):
+    """
+    一页产品列表的摘要：忽略点击数等每次请求都会变化的字段，内容相同的页面摘要相同
+    参数:
+        products: process_product_data处理后的产品列表
+    返回:
+        SHA-256十六进制摘要
+    """
+    stable = [{k: v for k, v in product.items() if k not in DIGEST_IGNORED_FIELDS} for product in products]
+    payload = json.dumps(stable, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ListingWatcher:
+    """列表头部监视：每隔几分钟请求列表前几页，页面有变化时立即爬取新产品和tag_time变化的产品并导入"""
+
+    def __init__(self, crawler_options=None, pages=DEFAULT_WATCH_PAGES, interval=DEFAULT_WATCH_INTERVAL):
+        """
+        初始化监视器
+        参数:
+            crawler_options: 传给ScheduledCrawler的参数字典
+            pages: 每次轮询的列表页数
+            interval: 轮询间隔(秒)
+        """
+        self.logger = logging.getLogger("ListingWatcher")
+        self.crawler_options = dict(crawler_options or {}, check_updates=True)
+        self.pages = pages
+        self.interval = interval
+
+        self.session = create_session()
+        self.auth_token = None
+        self.db_pool = None
+
+        # 每页上次成功处理后的摘要，摘要不变的页面不再与数据库比对
+        self.page_hashes = {}
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.polls = 0
+        self.requests = 0
+
+    def open_db_pool(self):
+        """创建数据库连接池(比对和导入各占一个连接)，连接在多次轮询之间保持"""
+        self.db_pool = pool.ThreadedConnectionPool(
+            2, 2,
+            host=self.crawler_options.get('db_host', 'localhost'),
+            port=self.crawler_options.get('db_port', 5432),
+            dbname=self.crawler_options.get('db_name', 'milk_products'),
+            user=self.crawler_options.get('db_user', 'postgres'),
+            password=self.crawler_options.get('db_password', 'postgres')
+        )
+
+    def fetch_head(self):
+        """
+        请求列表前几页
+        返回:
+            (内容有变化的页面中的产品列表, {页码: 摘要})
+        """
+        crawler = NaifenzhikuCrawler(session=self.session, sort_param=self.crawler_options.get('listing_sort'))
+        crawler.output_dir = self.crawler_options.get('output_dir', 'data')
+
+        changed_products = []
+        digests = {}
+        for page in range(1, self.pages + 1):
+            if page > 1:
+                time.sleep(crawler.page_delay * (1 + random.random()))
+            page_data = crawler.fetch_page(page)
+            self.requests += 1
+            if not page_data:
+                self.logger.warning(f"获取列表第{page}页失败，下次轮询重试")
+                continue
+
+            products = crawler.process_product_data(page_data, page)
+            digests[page] = page_digest(products)
+            if digests[page] != self.page_hashes.get(page):
+                changed_products.extend(products)
+        return changed_products, digests
+
+    @tracing.traced()
+    def poll_once(self):
+        """
+        轮询一次：页面内容有变化时在数据库中比对tag_time，只爬取新产品和有变化的产品
+        返回:
+            是否成功；失败时不记录页面摘要，下次轮询会重新处理这些页面
+        """
+        self.polls += 1
+        changed_products, digests = self.fetch_head()
+        if not changed_products:
+            self.logger.info(f"列表前{self.pages}页内容未变化")
+            self.page_hashes.update(digests)
+            return True
+
+        crawler = ScheduledCrawler(
+            session=self.session,
+            auth_token=self.auth_token,
+            db_pool=self.db_pool,
+            **self.crawler_options
+        )
+        try:
+            new_products, updated_products, _, _ = crawler.classify_products(changed_products)
+            products_to_update = new_products + updated_products
+            self.logger.info(f"列表头部: 新产品 {len(new_products)} 个，tag_time变化 {len(updated_products)} 个")
+
+            success = True
+            if products_to_update:
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                products_file = f"{crawler.output_dir}/naifenzhiku_products_to_update_{timestamp}.json"
+                with open(products_file, 'w', encoding='utf-8') as f:
+                    json.dump(products_to_update, f, ensure_ascii=False, indent=2)
+
+                result_file = crawler.process_products(products_file)
+                success = bool(result_file) and crawler.import_to_database(result_file)
+            self.auth_token = crawler.auth_token
+        finally:
+            crawler.close_db()
+
+        if success:
+            self.page_hashes.update(digests)
+        return success
+
+    def stop(self):
+        """请求退出轮询循环，正在进行的轮询会先执行完"""
+        self.stopping = True
+        self.wakeup.set()
+
+    def serve_forever(self):
+        """主循环：每隔interval秒轮询一次列表头部"""
+        self.open_db_pool()
+        self.logger.info(f"列表头部监视已启动: 每{self.interval}秒请求前{self.pages}页")
+        try:
+            while not self.stopping:
+                start = time.perf_counter()
+                success = False
+                try:
+                    success = self.poll_once()
+                except Exception as e:
+                    self.logger.error(f"轮询列表头部时出错: {e}")
+                metrics.record_run('watch', success, time.perf_counter() - start)
+                if self.crawler_options.get('metrics_file'):
+                    try:
+                        metrics.write_textfile(self.crawler_options['metrics_file'])
+                    except OSError as e:
+                        self.logger.error(f"写入指标文件时出错: {e}")
+                self.logger.info(f"已轮询 {self.polls} 次，共请求列表 {self.requests} 次")
+                self.wakeup.wait(self.interval)
+                self.wakeup.clear()
+        finally:
+            self.session.close()
+            self.db_pool.closeall()
+            self.logger.info("列表头部监视已退出")
+
+    def install_signal_handlers(self):
+        """收到SIGTERM/SIGINT时在当前轮询结束后退出"""
+        def handle(signum, frame):
+            self.logger.info(f"收到信号 {signum}，准备退出")
+            self.stop()
+
+        signal.signal(signal.SIGTERM, handle)
+        signal.signal(signal.SIGINT, handle)
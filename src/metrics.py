@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import tracing
+import request_log
+
+# 延迟直方图的桶边界(秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PARSE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    """转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """指标基类：按标签值组合分别保存样本，线程安全"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 的标签应为 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """返回 [(指标名后缀, 标签值, 附加标签, 值)]"""
+        with self.lock:
+            return [('', key, None, value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """只增不减的计数"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """可任意设置的当前值"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """按桶累计的观测值分布，同时记录总和与次数"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录with块的耗时(秒)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    result.append(('_bucket', key, [('le', format_value(bound))], count))
+                result.append(('_sum', key, None, total))
+                result.append(('_count', key, None, counts[-1]))
+        return result
+
+
+class Registry:
+    """指标注册表：同名指标只注册一次，各模块共用同一组指标名"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"指标 {metric.name} 已以不同的类型或标签注册")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """以Prometheus文本格式输出全部指标"""
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'nfzk_http_requests_total', "HTTP请求数，status为状态码或异常类型", ('crawler', 'host', 'status'))
+HTTP_DURATION = REGISTRY.histogram(
+    'nfzk_http_request_duration_seconds', "HTTP请求耗时(秒)", ('crawler', 'host'))
+HTTP_RESPONSE_BYTES = REGISTRY.counter(
+    'nfzk_http_response_bytes_total', "HTTP响应体字节数", ('crawler', 'host'))
+HTTP_RETRIES = REGISTRY.counter(
+    'nfzk_http_retries_total', "HTTP请求重试次数", ('crawler',))
+PARSE_DURATION = REGISTRY.histogram(
+    'nfzk_parse_duration_seconds', "解析单个响应的耗时(秒)", ('parser',), PARSE_BUCKETS)
+STAGE_ITEMS = REGISTRY.counter(
+    'nfzk_stage_items_total', "各阶段处理的项目数", ('stage', 'result'))
+STAGE_DURATION = REGISTRY.gauge(
+    'nfzk_stage_duration_seconds', "各阶段最近一次的耗时(秒)", ('stage',))
+STAGE_THROUGHPUT = REGISTRY.gauge(
+    'nfzk_stage_items_per_second', "各阶段最近一次每秒处理的项目数", ('stage',))
+DB_ROWS = REGISTRY.counter(
+    'nfzk_db_rows_total', "写入数据库的行数", ('table',))
+DB_WRITE_DURATION = REGISTRY.counter(
+    'nfzk_db_write_seconds_total', "写入数据库的累计耗时(秒)", ('table',))
+DB_THROUGHPUT = REGISTRY.gauge(
+    'nfzk_db_rows_per_second', "最近一次写入每秒的行数", ('table',))
+RUNS = REGISTRY.counter(
+    'nfzk_runs_total', "定时任务运行次数", ('mode', 'result'))
+RUN_DURATION = REGISTRY.gauge(
+    'nfzk_run_duration_seconds', "最近一次运行的耗时(秒)", ('mode',))
+RUN_LAST_SUCCESS = REGISTRY.gauge(
+    'nfzk_run_last_success_timestamp_seconds', "最近一次成功运行结束的Unix时间", ('mode',))
+
+
+def host_of(url):
+    return urlsplit(url).hostname or 'unknown'
+
+
+def record_request(crawler, url, status, seconds, nbytes=0, target=None, attempt=0, outcome=None):
+    """记录一次HTTP请求的结果、耗时和响应大小，并写入请求日志；outcome为调用方判断的明确结果"""
+    host = host_of(url)
+    HTTP_REQUESTS.inc(crawler=crawler, host=host, status=status)
+    HTTP_DURATION.observe(seconds, crawler=crawler, host=host)
+    if nbytes:
+        HTTP_RESPONSE_BYTES.inc(nbytes, crawler=crawler, host=host)
+    request_log.record(crawler, url, status, seconds, nbytes, target=target, attempt=attempt, outcome=outcome)
+
+
+def http_request(client, method, url, crawler, attempt=0, target=None, classify=None, **kwargs):
+    """
+    发送HTTP请求并记录指标，异常原样抛出
+    参数:
+        client: requests模块或Session
+        method: get/post
+        url: 请求URL
+        crawler: 发起请求的爬虫名称(listing/detail/more_detail/login)
+        attempt: 当前是第几次尝试(从0开始)，大于0时记一次重试
+        target: 请求的产品ID或页码，记入请求日志
+        classify: 可选，接收响应并返回请求结果(如login_required/parse_error)的函数，
+                  返回None时按状态码判断；用于HTTP 200但内容表明失败的接口
+        kwargs: 传给requests的其他参数
+    返回:
+        requests.Response
+    """
+    if attempt > 0:
+        HTTP_RETRIES.inc(crawler=crawler)
+    start = time.perf_counter()
+    try:
+        with tracing.span(f"HTTP {method.upper()}", 'http', sample=True, crawler=crawler, host=host_of(url)):
+            response = getattr(client, method)(url, **kwargs)
+    except Exception as e:
+        record_request(crawler, url, type(e).__name__, time.perf_counter() - start, target=target, attempt=attempt)
+        raise
+    seconds = time.perf_counter() - start
+    record_request(crawler, url, response.status_code, seconds, len(response.content),
+                   target=target, attempt=attempt, outcome=classify(response) if classify else None)
+    return response
+
+
+def record_stage(stage, succeeded, failed, seconds):
+    """记录一个阶段处理的项目数和吞吐量"""
+    STAGE_ITEMS.inc(succeeded, stage=stage, result='ok')
+    if failed:
+        STAGE_ITEMS.inc(failed, stage=stage, result='failed')
+    STAGE_DURATION.set(seconds, stage=stage)
+    if seconds > 0:
+        STAGE_THROUGHPUT.set((succeeded + failed) / seconds, stage=stage)
+
+
+@contextmanager
+def db_write(table):
+    """
+    记录with块内写入某张表的行数和耗时，块内把写入的行数赋给返回对象的rows
+    例: with db_write('milk_products') as w: w.rows = import_products(data)
+    """
+    class Write:
+        rows = 0
+
+    write = Write()
+    start = time.perf_counter()
+    yield write
+    seconds = time.perf_counter() - start
+    DB_ROWS.inc(write.rows, table=table)
+    DB_WRITE_DURATION.inc(seconds, table=table)
+    if seconds > 0:
+        DB_THROUGHPUT.set(write.rows / seconds, table=table)
+
+
+def record_run(mode, success, seconds):
+    """记录一次定时任务运行"""
+    RUNS.inc(mode=mode, result='success' if success else 'failure')
+    RUN_DURATION.set(seconds, mode=mode)
+    if success:
+        RUN_LAST_SUCCESS.set(time.time(), mode=mode)
+
+
+def write_textfile(path, registry=REGISTRY):
+    """写入node_exporter textfile收集器使用的.prom文件(先写临时文件再替换，避免被读到一半)"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics_', suffix='.prom.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(registry.render())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -6,24 +6,46 @@ import json
 import time
 import math
 import pandas as pd
-from tqdm import tqdm
 import os
 from datetime import datetime
 import random
 import glob
 import argparse
 
+import metrics
+import tracing
+import profiling
+import run_status
+import request_log
+from site_urls import API_BASE
+
 class NaifenzhikuCrawler:
     """奶粉之库数据爬虫"""
     
-    def __init__(self, resume_from_page=0):
+    def __init__(self, resume_from_page=0, session=None, sort_param=None,
+                 stop_after_unchanged=0, page_unchanged=None):
         """
         初始化爬虫
         参数:
             resume_from_page: 从哪一页开始爬取，0表示从头开始
+            session: 复用的requests会话(保持连接)，不提供时每次请求新建会话
+            sort_param: 附加在列表URL上的排序参数(如"order=tag_time")，使列表按更新时间倒序
+            stop_after_unchanged: 列表按更新时间倒序时，连续这么多页都没有变化就提前结束，0表示不提前结束
+            page_unchanged: 判断一页产品是否都与已入库数据相同的函数，参数为该页产品列表
         """
+        self.session = session
+        
+        # 提前结束相关：只有确认列表按tag_time倒序时，后面的页面才不可能再有变化
+        self.sort_param = sort_param
+        self.stop_after_unchanged = stop_after_unchanged
+        self.page_unchanged = page_unchanged
+        self.listing_sorted = None   # None表示尚未判断
+        self.last_tag_time = None
+        self.unchanged_pages = 0
+        self.stopped_early = False
+        
         # 基本URL和请求头
-        self.base_url = "https://data.naifenzhiku.com/index/powder/index?page={}"
+        self.base_url = API_BASE + "/index/powder/index?page={}"
         
         # 请求头信息
         self.headers = {
@@ -88,6 +110,7 @@ class NaifenzhikuCrawler:
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs("logs", exist_ok=True)
 
+    @tracing.traced('fetch', sample=True)
     def fetch_page(self, page):
         """
         获取指定页的数据
@@ -97,6 +120,8 @@ class NaifenzhikuCrawler:
             JSON格式的响应数据或None(如果请求失败)
         """
         url = self.base_url.format(page)
+        if self.sort_param:
+            url = f"{url}&{self.sort_param}"
         
         max_retries = self.retry_count
         retry_delay = self.retry_delay
@@ -122,21 +147,23 @@ class NaifenzhikuCrawler:
                 curl_command = self.generate_curl_command(url, self.headers)
                 
                 # 设置超时参数，避免请求卡住
-                session = requests.Session()
-                
-                # 设置TCP保持活动状态
-                adapter = requests.adapters.HTTPAdapter(
-                    max_retries=3,  # 连接级别的重试
-                    pool_connections=10,
-                    pool_maxsize=10,
-                    pool_block=False
-                )
-                session.mount('http://', adapter)
-                session.mount('https://', adapter)
+                session = self.session
+                if session is None:
+                    session = requests.Session()
+                    
+                    # 设置TCP保持活动状态
+                    adapter = requests.adapters.HTTPAdapter(
+                        max_retries=3,  # 连接级别的重试
+                        pool_connections=10,
+                        pool_maxsize=10,
+                        pool_block=False
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
                 
                 # 使用session发起请求
-                response = session.get(
-                    url, 
+                response = metrics.http_request(
+                    session, 'get', url, 'listing', attempt=attempt, target=page,
                     headers=self.headers, 
                     timeout=(self.connect_timeout, self.read_timeout),
                     stream=False  # 关闭流式传输，避免管道断开
@@ -153,7 +180,7 @@ class NaifenzhikuCrawler:
                         if attempt < max_retries - 1:
                             delay = retry_delay * (1 + random.random()) * (1 + attempt*0.5)  # 随尝试次数增加延迟
                             print(f"等待 {delay:.2f} 秒后重试...")
-                            time.sleep(delay)
+                            tracing.sleep(delay)
                             continue
                         return None
                         
@@ -203,7 +230,7 @@ class NaifenzhikuCrawler:
                                 # 否则继续重试
                                 delay = retry_delay * (1 + random.random()) * (1 + attempt*0.5)
                                 print(f"等待 {delay:.2f} 秒后重试...")
-                                time.sleep(delay)
+                                tracing.sleep(delay)
                                 continue
                         else:
                             print(f"警告: 响应不是有效的JSON对象")
@@ -211,7 +238,7 @@ class NaifenzhikuCrawler:
                             if attempt < max_retries - 1:
                                 delay = retry_delay * (1 + random.random()) * (1 + attempt*0.5)
                                 print(f"等待 {delay:.2f} 秒后重试...")
-                                time.sleep(delay)
+                                tracing.sleep(delay)
                                 continue
                             return None
                             
@@ -222,7 +249,7 @@ class NaifenzhikuCrawler:
                         if attempt < max_retries - 1:
                             delay = retry_delay * (1 + random.random()) * (1 + attempt*0.5)
                             print(f"等待 {delay:.2f} 秒后重试...")
-                            time.sleep(delay)
+                            tracing.sleep(delay)
                             continue
                         return None
                 else:
@@ -234,7 +261,7 @@ class NaifenzhikuCrawler:
                 if attempt < max_retries - 1:
                     delay = retry_delay * (1 + attempt) * (1 + random.random())  # 随着尝试次数增加延迟
                     print(f"等待 {delay:.2f} 秒后重试...")
-                    time.sleep(delay)
+                    tracing.sleep(delay)
             
             except requests.exceptions.Timeout:
                 print(f"请求超时")
@@ -242,7 +269,7 @@ class NaifenzhikuCrawler:
                 if attempt < max_retries - 1:
                     delay = retry_delay * (1 + attempt) * (1 + random.random())
                     print(f"等待 {delay:.2f} 秒后重试...")
-                    time.sleep(delay)
+                    tracing.sleep(delay)
             
             except requests.exceptions.ConnectionError as e:
                 print(f"连接错误: {e}")
@@ -252,7 +279,7 @@ class NaifenzhikuCrawler:
                 if attempt < max_retries - 1:
                     delay = retry_delay * (2 + attempt*2) * (1 + random.random())
                     print(f"连接错误，等待 {delay:.2f} 秒后重试...")
-                    time.sleep(delay)
+                    tracing.sleep(delay)
                     
                 # 如果是最后一次尝试，尝试手动处理curl请求
                 elif curl_command:
@@ -285,7 +312,7 @@ class NaifenzhikuCrawler:
                 if attempt < max_retries - 1:
                     delay = retry_delay * (1 + attempt) * (1 + random.random())
                     print(f"等待 {delay:.2f} 秒后重试...")
-                    time.sleep(delay)
+                    tracing.sleep(delay)
             
             except BrokenPipeError as e:
                 print(f"管道断开错误: {e}")
@@ -319,7 +346,7 @@ class NaifenzhikuCrawler:
                 if attempt < max_retries - 1:
                     delay = retry_delay * (2 + attempt) * (1 + random.random())
                     print(f"管道断开错误，等待 {delay:.2f} 秒后重试...")
-                    time.sleep(delay)
+                    tracing.sleep(delay)
             
             except Exception as e:
                 print(f"未预期的异常: {e}")
@@ -327,7 +354,7 @@ class NaifenzhikuCrawler:
                 if attempt < max_retries - 1:
                     delay = retry_delay * (1 + attempt) * (1 + random.random())
                     print(f"等待 {delay:.2f} 秒后重试...")
-                    time.sleep(delay)
+                    tracing.sleep(delay)
         
         # 所有重试都失败了，最后尝试直接通过curl获取数据
         if curl_command:
@@ -455,6 +482,7 @@ class NaifenzhikuCrawler:
             # 使用默认值
             return 122, 3642, 30  # 根据用户提供的信息估算
 
+    @tracing.traced('parse', sample=True)
     def process_product_data(self, page_data, current_page):
         """
         处理产品数据，提取所需字段
@@ -692,6 +720,8 @@ class NaifenzhikuCrawler:
         # 如果匹配了两个或更多关键字段，可能是产品
         return matched_fields >= 2
 
+    @tracing.traced()
+    @profiling.profiled()
     def crawl_pages(self, start_page=1, max_pages=0):
         """
         爬取指定数量的页面
@@ -724,7 +754,7 @@ class NaifenzhikuCrawler:
                 else:
                     total_pages = 200
                     
-            pbar = tqdm(total=total_pages, desc="爬取进度", unit="页")
+            pbar = run_status.progress("listing", total_pages, unit="页", desc="爬取进度")
             
             # 如果从中间页开始，更新进度条
             if start_page > 1:
@@ -745,7 +775,8 @@ class NaifenzhikuCrawler:
                     if current_page % 5 == 0:
                         delay += random.uniform(1, 3)
                     print(f"等待{delay:.2f}秒后继续...")
-                    time.sleep(delay)
+                    run_status.set_throttle(delay, stage="listing", page_delay=self.page_delay)
+                    tracing.sleep(delay)
                 
                 # 获取当前页的数据
                 page_data = self.fetch_page(current_page)
@@ -753,13 +784,17 @@ class NaifenzhikuCrawler:
                 if page_data:
                     try:
                         # 处理当前页的产品数据
-                        products = self.process_product_data(page_data, current_page)
+                        with metrics.PARSE_DURATION.time(parser='listing'):
+                            products = self.process_product_data(page_data, current_page)
                         
                         if products and len(products) > 0:
                             empty_page_count = 0
                             self.all_products.extend(products)
                             print(f"第{current_page}页: 获取到{len(products)}个产品")
                             
+                            if self.check_early_stop(products):
+                                break
+                            
                             # 每爬取10页保存一次数据
                             if current_page % 10 == 0:
                                 self.save_products_data(is_final=False)
@@ -774,10 +809,12 @@ class NaifenzhikuCrawler:
                 else:
                     empty_page_count += 1
                     print(f"第{current_page}页: 获取数据失败 (连续空页计数: {empty_page_count}/{max_empty_pages})")
+                    if pbar:
+                        pbar.error()
                     if empty_page_count >= 2:
                         extra_delay = random.uniform(5, 10)
                         print(f"连续获取失败，额外等待{extra_delay:.2f}秒...")
-                        time.sleep(extra_delay)
+                        tracing.sleep(extra_delay)
                 
                 # 更新进度条
                 if pbar:
@@ -831,6 +868,8 @@ class NaifenzhikuCrawler:
             
             return self.all_products
 
+    @tracing.traced()
+    @profiling.profiled()
     def crawl_all_products(self):
         """
         爬取所有产品数据
@@ -866,7 +905,7 @@ class NaifenzhikuCrawler:
             if total_pages <= 0:
                 total_pages = 200  # 假设最大页数，后面会根据实际情况调整
                 
-            pbar = tqdm(total=total_pages, desc="爬取进度", unit="页")
+            pbar = run_status.progress("listing", total_pages, unit="页", desc="爬取进度")
             
             # 如果从中间页开始，更新进度条
             if start_page > 1:
@@ -890,7 +929,8 @@ class NaifenzhikuCrawler:
                     if current_page % 5 == 0:
                         delay += random.uniform(1, 3)
                     print(f"等待{delay:.2f}秒后继续...")
-                    time.sleep(delay)
+                    run_status.set_throttle(delay, stage="listing", page_delay=self.page_delay)
+                    tracing.sleep(delay)
                 
                 # 获取当前页的数据
                 page_data = self.fetch_page(current_page)
@@ -898,13 +938,17 @@ class NaifenzhikuCrawler:
                 if page_data:
                     try:
                         # 处理当前页的产品数据
-                        products = self.process_product_data(page_data, current_page)
+                        with metrics.PARSE_DURATION.time(parser='listing'):
+                            products = self.process_product_data(page_data, current_page)
                         
                         if products and len(products) > 0:
                             empty_page_count = 0  # 重置空页面计数
                             self.all_products.extend(products)
                             print(f"第{current_page}页: 获取到{len(products)}个产品")
                             
+                            if self.check_early_stop(products):
+                                break
+                            
                             # 每爬取10页保存一次数据
                             if current_page % 10 == 0:
                                 self.save_products_data(is_final=False)
@@ -920,11 +964,13 @@ class NaifenzhikuCrawler:
                 else:
                     empty_page_count += 1
                     print(f"第{current_page}页: 获取数据失败 (连续空页计数: {empty_page_count}/{max_empty_pages})")
+                    if pbar:
+                        pbar.error()
                     # 如果连续多次获取数据失败，可能是被封禁，增加等待时间
                     if empty_page_count >= 2:
                         extra_delay = random.uniform(5, 10)
                         print(f"连续获取失败，额外等待{extra_delay:.2f}秒...")
-                        time.sleep(extra_delay)
+                        tracing.sleep(extra_delay)
                 
                 # 更新进度条
                 if pbar:
@@ -976,6 +1022,46 @@ class NaifenzhikuCrawler:
             
             return self.all_products
             
+    def check_early_stop(self, products):
+        """
+        检查列表是否按更新时间倒序，并判断是否可以提前结束爬取
+        参数:
+            products: 当前页的产品列表
+        返回:
+            是否应停止爬取后续页面
+        """
+        tag_times = []
+        for product in products:
+            try:
+                tag_times.append(int(product.get('tag_time')))
+            except (TypeError, ValueError):
+                continue
+        
+        # 跨页检查：已爬取的全部产品的tag_time都应不增
+        if self.listing_sorted is not False and tag_times:
+            sequence = ([self.last_tag_time] if self.last_tag_time is not None else []) + tag_times
+            if any(earlier < later for earlier, later in zip(sequence, sequence[1:])):
+                self.listing_sorted = False
+                if self.stop_after_unchanged:
+                    print("产品列表未按更新时间倒序排列，无法提前结束，将爬取全部页面")
+            else:
+                self.listing_sorted = True
+            self.last_tag_time = tag_times[-1]
+        
+        if not self.listing_sorted or not self.stop_after_unchanged or self.page_unchanged is None:
+            return False
+        
+        if self.page_unchanged(products):
+            self.unchanged_pages += 1
+        else:
+            self.unchanged_pages = 0
+        
+        if self.unchanged_pages >= self.stop_after_unchanged:
+            self.stopped_early = True
+            print(f"连续{self.unchanged_pages}页产品均未变化，列表按更新时间倒序，后续页面不会有变化，提前结束爬取")
+            return True
+        return False
+    
     def cleanup_temp_files(self):
         """
         清理临时文件，仅保留最终数据文件
@@ -1031,6 +1117,7 @@ class NaifenzhikuCrawler:
         except Exception as e:
             print(f"删除logs目录失败: {e}")
             
+    @tracing.traced('save')
     def save_products_data(self, is_final=False):
         """
         保存产品数据到文件
@@ -1058,6 +1145,7 @@ class NaifenzhikuCrawler:
         print(f"已保存产品数据到 {filename}")
         return filename
         
+    @tracing.traced('save')
     def save_to_csv(self, csv_filename):
         """
         将产品数据保存为CSV格式
@@ -1188,6 +1276,8 @@ def main():
     parser.add_argument("--clean", action="store_true", help="爬取完成后清理临时文件")
     parser.add_argument("--keep-temp", action="store_true", help="保留中间临时文件")
     parser.add_argument("--pages", type=int, default=0, help="指定爬取的页数，0表示爬取所有页")
+    parser.add_argument("--sort-param", type=str, help="附加在列表URL上的排序参数，如order=tag_time")
+    profiling.add_argument(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
@@ -1196,40 +1286,43 @@ def main():
     print("奶粉之库产品数据爬虫启动")
     print("=" * 50)
     
-    # 初始化爬虫并开始爬取
-    crawler = NaifenzhikuCrawler(resume_from_page=args.resume)
+    with profiling.session('naifenzhiku_crawler', args.profile), run_status.run('naifenzhiku_crawler'):
+        # 初始化爬虫并开始爬取
+        crawler = NaifenzhikuCrawler(resume_from_page=args.resume, sort_param=args.sort_param)
     
-    print(f"配置信息：")
-    print(f"- 重试次数: {crawler.retry_count}")
-    print(f"- 重试延迟: {crawler.retry_delay}秒")
-    print(f"- 页面延迟: {crawler.page_delay}秒")
-    print(f"- 连接超时: {crawler.connect_timeout}秒")
-    print(f"- 读取超时: {crawler.read_timeout}秒")
-    print(f"- 清理临时文件: {'否' if args.keep_temp else '是'}")
-    if args.pages > 0:
-        print(f"- 爬取页数: {args.pages}页")
+        print(f"配置信息：")
+        print(f"- 重试次数: {crawler.retry_count}")
+        print(f"- 重试延迟: {crawler.retry_delay}秒")
+        print(f"- 页面延迟: {crawler.page_delay}秒")
+        print(f"- 连接超时: {crawler.connect_timeout}秒")
+        print(f"- 读取超时: {crawler.read_timeout}秒")
+        print(f"- 清理临时文件: {'否' if args.keep_temp else '是'}")
+        if args.pages > 0:
+            print(f"- 爬取页数: {args.pages}页")
     
-    # 开始爬取
-    if args.resume > 0:
-        print(f"从第{args.resume}页继续爬取")
-    else:
-        print("从第1页开始爬取")
+        # 开始爬取
+        if args.resume > 0:
+            print(f"从第{args.resume}页继续爬取")
+        else:
+            print("从第1页开始爬取")
     
-    # 根据是否指定页数调用不同的方法
-    if args.pages > 0:
-        crawler.crawl_pages(start_page=args.resume or 1, max_pages=args.pages)
-    else:    
-        crawler.crawl_all_products()
+        # 根据是否指定页数调用不同的方法
+        if args.pages > 0:
+            crawler.crawl_pages(start_page=args.resume or 1, max_pages=args.pages)
+        else:    
+            crawler.crawl_all_products()
     
-    if crawler.all_products:
-        crawler.save_products_data(is_final=True)
-        print(f"爬取完成！共获取 {len(crawler.all_products)} 条产品记录")
+        if crawler.all_products:
+            crawler.save_products_data(is_final=True)
+            request_log.record_stored(len(crawler.all_products))
+            print(f"爬取完成！共获取 {len(crawler.all_products)} 条产品记录")
         
-        # 根据参数决定是否清理临时文件
-        if args.clean or not args.keep_temp:
-            crawler.cleanup_temp_files()
-    else:
-        print("爬取完成，但没有获取到任何产品数据")
+            # 根据参数决定是否清理临时文件
+            if args.clean or not args.keep_temp:
+                crawler.cleanup_temp_files()
+        else:
+            print("爬取完成，但没有获取到任何产品数据")
+        request_log.finish_run()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
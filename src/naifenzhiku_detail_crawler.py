@@ -9,28 +9,52 @@ import random
 import pandas as pd
 from bs4 import BeautifulSoup
 from datetime import datetime
-from tqdm import tqdm
 import argparse
 import logging
 import re
 
+import metrics
+import tracing
+import profiling
+import run_status
+import request_log
+from site_urls import WEB_BASE
+
+# 产品详情页的标题(h1.title)，HTTP 200但没有它的页面不是产品页
+TITLE_PATTERN = re.compile(r'<h1[^>]*class=["\'][^"\']*\btitle\b')
+
+
+def classify_response(response):
+    """
+    判断详情页响应的请求结果，写入请求日志
+    参数:
+        response: requests.Response
+    返回:
+        HTTP 200但页面没有产品标题(如登录页、验证页)时返回parse_error，否则返回None(按状态码判断)
+    """
+    if response.status_code == 200 and not TITLE_PATTERN.search(response.text):
+        return 'parse_error'
+    return None
+
 class NaifenzhikuDetailCrawler:
     """奶粉之库产品详情爬虫"""
     
-    def __init__(self, input_file=None, output_dir="data", delay_range=(1, 3)):
+    def __init__(self, input_file=None, output_dir="data", delay_range=(1, 3), session=None):
         """
         初始化爬虫
         参数:
             input_file: 包含产品ID的输入文件
             output_dir: 输出目录
             delay_range: 请求延迟范围(最小秒数, 最大秒数)
+            session: 复用的requests会话(保持连接)，不提供时使用一次性连接
         """
         self.input_file = input_file
+        self.session = session
         self.output_dir = output_dir
         self.delay_range = delay_range
         
         # 详情页URL模板
-        self.detail_url_template = "https://naifenzhiku.com/powder/detail-{}.html"
+        self.detail_url_template = WEB_BASE + "/powder/detail-{}.html"
         
         # 请求头信息
         self.headers = {
@@ -61,6 +85,10 @@ class NaifenzhikuDetailCrawler:
         # 存储所有产品详情数据
         self.all_product_details = []
         
+        # 本次获取失败的产品 {产品ID: 失败原因}，产品不存在(404)不计入
+        self.failed = {}
+        self.last_error = None
+        
         # 配置爬虫参数
         self.retry_count = 3
         self.retry_delay = 2
@@ -126,6 +154,7 @@ class NaifenzhikuDetailCrawler:
             self.logger.error(f"加载产品数据时出错: {e}")
             return []
     
+    @tracing.traced('fetch', sample=True)
     def fetch_detail(self, product_id):
         """
         获取产品详情
@@ -135,6 +164,7 @@ class NaifenzhikuDetailCrawler:
             产品详情字典
         """
         url = self.detail_url_template.format(product_id)
+        self.last_error = None
         
         for attempt in range(self.retry_count):
             try:
@@ -144,42 +174,52 @@ class NaifenzhikuDetailCrawler:
                 self.headers["user-agent"] = random.choice(self.user_agents)
                 
                 # 发送请求
-                response = requests.get(
-                    url, 
-                    headers=self.headers, 
+                response = metrics.http_request(
+                    self.session or requests, 'get', url, 'detail', attempt=attempt, target=product_id,
+                    classify=classify_response, headers=self.headers, 
                     timeout=(10, 30)
                 )
                 
                 # 检查响应状态
                 if response.status_code == 200:
                     self.logger.info(f"成功获取产品 {product_id} 的详情")
-                    return self.parse_detail_page(response.text, product_id)
+                    with metrics.PARSE_DURATION.time(parser='detail'):
+                        detail = self.parse_detail_page(response.text, product_id)
+                    if detail is None:
+                        self.last_error = "解析详情页失败"
+                    return detail
                 else:
-                    self.logger.warning(f"请求失败，状态码: {response.status_code}")
-                    
-                    # 如果状态码是404，说明产品不存在，直接返回空
+                    # 如果状态码是404，说明产品不存在，直接返回空(不计为失败，不会被记录重试)
                     if response.status_code == 404:
                         self.logger.warning(f"产品 {product_id} 不存在")
+                        self.last_error = None
                         return None
+                    
+                    self.logger.warning(f"请求失败，状态码: {response.status_code}")
+                    self.last_error = f"状态码 {response.status_code}"
             
             except requests.exceptions.Timeout:
                 self.logger.warning(f"请求超时")
+                self.last_error = "请求超时"
             
             except requests.exceptions.ConnectionError as e:
                 self.logger.warning(f"连接错误: {e}")
+                self.last_error = f"连接错误: {e}"
             
             except Exception as e:
                 self.logger.warning(f"请求异常: {e}")
+                self.last_error = f"请求异常: {e}"
             
             # 如果不是最后一次尝试，等待后重试
             if attempt < self.retry_count - 1:
                 delay = self.retry_delay * (attempt + 1) * (1 + random.random())
                 self.logger.info(f"等待 {delay:.2f} 秒后重试...")
-                time.sleep(delay)
+                tracing.sleep(delay)
         
         self.logger.error(f"获取产品 {product_id} 的详情失败，已达到最大重试次数")
         return None
     
+    @tracing.traced('parse', sample=True)
     def parse_detail_page(self, html_content, product_id):
         """
         解析详情页面
@@ -263,6 +303,8 @@ class NaifenzhikuDetailCrawler:
             self.logger.info(f"已保存错误页面到 {error_file}")
             return None
     
+    @tracing.traced()
+    @profiling.profiled()
     def crawl_all_details(self):
         """
         爬取所有产品的详情
@@ -280,14 +322,15 @@ class NaifenzhikuDetailCrawler:
         self.all_product_details = []
         
         try:
-            with tqdm(total=len(product_ids), desc="爬取进度", unit="产品") as pbar:
+            with run_status.progress("detail", len(product_ids), unit="产品", desc="爬取进度") as pbar:
                 for i, product_id in enumerate(product_ids):
                     # 添加随机延迟
                     if i > 0:
                         delay = random.uniform(*self.delay_range)
                         if i % 10 == 0:  # 每10个请求增加额外延迟
                             delay += random.uniform(1, 3)
-                        time.sleep(delay)
+                        run_status.set_throttle(delay, stage="detail", delay_range=list(self.delay_range))
+                        tracing.sleep(delay)
                     
                     # 获取产品详情
                     product_detail = self.fetch_detail(product_id)
@@ -298,6 +341,9 @@ class NaifenzhikuDetailCrawler:
                         # 每爬取10个产品保存一次
                         if (i + 1) % 10 == 0 or (i + 1) == len(product_ids):
                             self.save_details(is_final=(i + 1) == len(product_ids))
+                    elif self.last_error:
+                        self.failed[product_id] = self.last_error
+                        pbar.error()
                     
                     # 更新进度条
                     pbar.update(1)
@@ -316,6 +362,7 @@ class NaifenzhikuDetailCrawler:
             self.save_details(is_final=False)
             return self.all_product_details
     
+    @tracing.traced('save')
     def save_details(self, is_final=False):
         """
         保存产品详情到文件
@@ -358,6 +405,7 @@ def main():
     parser.add_argument("--output", "-o", type=str, default="data", help="输出目录，默认为'data'")
     parser.add_argument("--min-delay", type=float, default=1.0, help="最小请求延迟(秒)，默认为1.0秒")
     parser.add_argument("--max-delay", type=float, default=3.0, help="最大请求延迟(秒)，默认为3.0秒")
+    profiling.add_argument(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
@@ -366,20 +414,23 @@ def main():
     print("奶粉之库产品详情爬虫启动")
     print("=" * 50)
     
-    # 初始化爬虫
-    crawler = NaifenzhikuDetailCrawler(
-        input_file=args.input,
-        output_dir=args.output,
-        delay_range=(args.min_delay, args.max_delay)
-    )
+    with profiling.session('naifenzhiku_detail_crawler', args.profile), run_status.run('naifenzhiku_detail_crawler'):
+        # 初始化爬虫
+        crawler = NaifenzhikuDetailCrawler(
+            input_file=args.input,
+            output_dir=args.output,
+            delay_range=(args.min_delay, args.max_delay)
+        )
     
-    # 开始爬取
-    product_details = crawler.crawl_all_details()
+        # 开始爬取
+        product_details = crawler.crawl_all_details()
     
-    if product_details:
-        print(f"爬取完成！共获取 {len(product_details)} 个产品详情")
-    else:
-        print("爬取完成，但没有获取到任何产品详情")
+        if product_details:
+            request_log.record_stored(len(product_details))
+            print(f"爬取完成！共获取 {len(product_details)} 个产品详情")
+        else:
+            print("爬取完成，但没有获取到任何产品详情")
+        request_log.finish_run()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -8,12 +8,50 @@ import os
 import random
 import pandas as pd
 from datetime import datetime
-from tqdm import tqdm
 import argparse
 import logging
 import sys
 from pathlib import Path
 
+import metrics
+import tracing
+import profiling
+import run_status
+import request_log
+from site_urls import API_BASE
+
+# 表示获取失败、需要之后重试的额外详情状态("无数据"是接口的正常结果，不在其中)
+FAILED_STATUSES = ('获取失败', '处理错误', '需要登录')
+
+
+def classify_response(response):
+    """
+    判断额外详情接口响应的请求结果，写入请求日志(接口出错时也返回HTTP 200)
+    参数:
+        response: requests.Response
+    返回:
+        login_required(需要登录)、parse_error(不是有效的JSON)、not_found(产品不存在)、
+        unknown_error(接口返回未知错误)、api_error(接口返回其他错误)，
+        成功或非200响应返回None(按状态码判断)
+    """
+    if response.status_code != 200:
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return 'parse_error'
+    if not isinstance(data, dict):
+        return 'parse_error'
+    if data.get('status') == 303 and data.get('mesg') == '请先登录':
+        return 'login_required'
+    if 'id' in data or (data.get('code') == 0 and 'data' in data):
+        return None
+    # 与fetch_more_detail一致：不存在和未知错误都按无数据处理，不再重试
+    error_msg = data.get('msg', '未知错误')
+    if '不存在' in error_msg:
+        return 'not_found'
+    return 'unknown_error' if error_msg == '未知错误' else 'api_error'
+
 class NaifenzhikuMoreDetailCrawler:
     """奶粉智库产品额外详情爬虫"""
     
@@ -28,7 +66,8 @@ class NaifenzhikuMoreDetailCrawler:
         username=None,
         password=None,
         auth_token=None,
-        config_file=None
+        config_file=None,
+        session=None
     ):
         """
         初始化爬虫
@@ -43,7 +82,10 @@ class NaifenzhikuMoreDetailCrawler:
             password: 奶粉智库密码
             auth_token: 直接提供的授权token
             config_file: 配置文件路径
+            session: 复用的requests会话(保持连接)，不提供时使用一次性连接
         """
+        self.session = session
+        
         # 创建输出目录和日志目录
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         Path("logs").mkdir(parents=True, exist_ok=True)
@@ -75,8 +117,8 @@ class NaifenzhikuMoreDetailCrawler:
         self.auth_token = auth_token or ""
         
         # 接口URL
-        self.login_url = "https://data.naifenzhiku.com/index/login/login"
-        self.more_detail_url = "https://data.naifenzhiku.com/index/powder/detailMore"
+        self.login_url = API_BASE + "/index/login/login"
+        self.more_detail_url = API_BASE + "/index/powder/detailMore"
         
         # 请求头信息
         self.headers = {
@@ -120,6 +162,9 @@ class NaifenzhikuMoreDetailCrawler:
         # 存储所有产品额外详情数据
         self.all_more_details = []
         
+        # 本次获取失败的产品 {产品ID: 额外详情状态}
+        self.failed = {}
+        
         # 如果提供了auth_token
         if self.auth_token:
             self.logger.info(f"使用提供的授权token: {self.auth_token[:20]}...")
@@ -197,6 +242,7 @@ class NaifenzhikuMoreDetailCrawler:
             self.logger.error(f"加载产品数据时出错: {e}")
             return []
     
+    @tracing.traced('fetch', sample=True)
     def fetch_more_detail(self, product_id):
         """
         获取产品额外详情
@@ -227,8 +273,9 @@ class NaifenzhikuMoreDetailCrawler:
                 self.headers["dm-ip"] = random.choice(self.ip_addresses)
                 
                 # 发送请求
-                response = requests.get(
-                    self.more_detail_url, 
+                response = metrics.http_request(
+                    self.session or requests, 'get', self.more_detail_url, 'more_detail', attempt=attempt,
+                    target=product_id, classify=classify_response,
                     params=params,
                     headers=self.headers, 
                     timeout=(10, 30)
@@ -261,11 +308,13 @@ class NaifenzhikuMoreDetailCrawler:
                         # 检查是否有id字段，这表示返回的是直接的详情数据
                         if 'id' in data and str(data['id']) == str(product_id):
                             self.logger.info(f"成功获取产品 {product_id} 的额外详情")
-                            return self.process_more_detail(data, product_id)
+                            with metrics.PARSE_DURATION.time(parser='more_detail'):
+                                return self.process_more_detail(data, product_id)
                         # 检查老格式接口返回
                         elif 'code' in data and data['code'] == 0 and 'data' in data:
                             self.logger.info(f"成功获取产品 {product_id} 的额外详情(老格式)")
-                            return self.process_more_detail(data, product_id)
+                            with metrics.PARSE_DURATION.time(parser='more_detail'):
+                                return self.process_more_detail(data, product_id)
                         else:
                             error_msg = data.get('msg', '未知错误')
                             self.logger.warning(f"接口返回错误: {error_msg}")
@@ -292,12 +341,13 @@ class NaifenzhikuMoreDetailCrawler:
             if attempt < self.retry_count - 1:
                 delay = self.retry_delay * (attempt + 1) * (1 + random.random())
                 self.logger.info(f"等待 {delay:.2f} 秒后重试...")
-                time.sleep(delay)
+                tracing.sleep(delay)
         
         self.logger.error(f"获取产品 {product_id} 的额外详情失败，已达到最大重试次数")
         # 返回基本结构，避免空数据
         return {'id': product_id, '额外详情状态': '获取失败'}
     
+    @tracing.traced('parse', sample=True)
     def process_more_detail(self, data, product_id):
         """
         处理额外详情数据
@@ -413,6 +463,8 @@ class NaifenzhikuMoreDetailCrawler:
             self.logger.error(traceback.format_exc())
             return {'id': product_id, '额外详情状态': '处理错误'}
     
+    @tracing.traced()
+    @profiling.profiled()
     def crawl_all_more_details(self):
         """
         爬取所有产品的额外详情
@@ -430,20 +482,24 @@ class NaifenzhikuMoreDetailCrawler:
         self.all_more_details = []
         
         try:
-            with tqdm(total=len(product_ids), desc="爬取额外详情", unit="产品") as pbar:
+            with run_status.progress("more_detail", len(product_ids), unit="产品", desc="爬取额外详情") as pbar:
                 for i, product_id in enumerate(product_ids):
                     # 添加随机延迟
                     if i > 0:
                         delay = random.uniform(*self.delay_range)
                         if i % 10 == 0:  # 每10个请求增加额外延迟
                             delay += random.uniform(1, 3)
-                        time.sleep(delay)
+                        run_status.set_throttle(delay, stage="more_detail", delay_range=list(self.delay_range))
+                        tracing.sleep(delay)
                     
                     # 获取产品额外详情
                     more_detail = self.fetch_more_detail(product_id)
                     
                     if more_detail:
                         self.all_more_details.append(more_detail)
+                        if more_detail.get('额外详情状态') in FAILED_STATUSES:
+                            self.failed[product_id] = more_detail['额外详情状态']
+                            pbar.error()
                         
                         # 每爬取10个产品保存一次
                         if (i + 1) % 10 == 0 or (i + 1) == len(product_ids):
@@ -472,6 +528,7 @@ class NaifenzhikuMoreDetailCrawler:
             self.save_more_details(is_final=False)
             return self.all_more_details
     
+    @tracing.traced('save')
     def save_more_details(self, is_final=False):
         """
         保存产品额外详情到文件
@@ -502,6 +559,8 @@ class NaifenzhikuMoreDetailCrawler:
         
         return True
     
+    @tracing.traced('save')
+    @profiling.profiled()
     def merge_with_main_data(self, main_data_file):
         """
         将额外详情与主数据合并
@@ -528,7 +587,7 @@ class NaifenzhikuMoreDetailCrawler:
             
             # 合并数据
             merged_data = []
-            with tqdm(total=len(main_data), desc="合并数据", unit="产品") as pbar:
+            with run_status.progress("merge_more_detail", len(main_data), unit="产品", desc="合并数据") as pbar:
                 for product in main_data:
                     product_id = str(product.get('id', ''))
                     
@@ -581,6 +640,7 @@ class NaifenzhikuMoreDetailCrawler:
             self.logger.error(f"合并数据时出错: {e}")
             return None
     
+    @tracing.traced('fetch')
     def login(self):
         """登录获取授权token"""
         self.logger.info(f"尝试使用账号 {self.username} 登录奶粉智库")
@@ -598,8 +658,8 @@ class NaifenzhikuMoreDetailCrawler:
         
         try:
             # 发送登录请求
-            response = requests.post(
-                self.login_url,
+            response = metrics.http_request(
+                self.session or requests, 'post', self.login_url, 'login',
                 data=json.dumps(login_data),  # 使用json.dumps确保与curl一致
                 headers=login_headers,
                 timeout=(10, 30)
@@ -665,6 +725,7 @@ def main():
     parser.add_argument("--token", "-t", type=str, help="直接提供的授权token")
     parser.add_argument("--token-file", "-tf", type=str, help="包含授权token的文件路径")
     parser.add_argument("--config", "-c", type=str, default="config.json", help="配置文件路径，默认为'config.json'")
+    profiling.add_argument(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
@@ -694,32 +755,35 @@ def main():
     else:
         print(f"警告: 配置文件 {config_file} 不存在")
     
-    # 初始化爬虫
-    crawler = NaifenzhikuMoreDetailCrawler(
-        product_file=args.input,
-        output_dir=args.output,
-        delay_range=(args.min_delay, args.max_delay),
-        username=args.username,
-        password=args.password,
-        auth_token=auth_token,
-        config_file=config_file
-    )
+    with profiling.session('naifenzhiku_more_detail_crawler', args.profile), run_status.run('naifenzhiku_more_detail_crawler'):
+        # 初始化爬虫
+        crawler = NaifenzhikuMoreDetailCrawler(
+            product_file=args.input,
+            output_dir=args.output,
+            delay_range=(args.min_delay, args.max_delay),
+            username=args.username,
+            password=args.password,
+            auth_token=auth_token,
+            config_file=config_file
+        )
     
-    # 开始爬取
-    more_details = crawler.crawl_all_more_details()
+        # 开始爬取
+        more_details = crawler.crawl_all_more_details()
     
-    if more_details:
-        print(f"爬取完成！共获取 {len(more_details)} 个产品额外详情")
-        
-        # 如果指定了合并文件，则进行合并
-        if args.merge:
-            merged_data = crawler.merge_with_main_data(args.merge)
-            if merged_data:
-                print(f"数据合并完成！共 {len(merged_data)} 条记录")
-            else:
-                print("数据合并失败！")
-    else:
-        print("爬取完成，但没有获取到任何产品额外详情")
+        if more_details:
+            request_log.record_stored(len(more_details) - len(crawler.failed))
+            print(f"爬取完成！共获取 {len(more_details)} 个产品额外详情")
+        
+            # 如果指定了合并文件，则进行合并
+            if args.merge:
+                merged_data = crawler.merge_with_main_data(args.merge)
+                if merged_data:
+                    print(f"数据合并完成！共 {len(merged_data)} 条记录")
+                else:
+                    print("数据合并失败！")
+        else:
+            print("爬取完成，但没有获取到任何产品额外详情")
+        request_log.finish_run()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
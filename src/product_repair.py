@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import random
+import argparse
+import logging
+import decimal
+import psycopg2
+from datetime import datetime
+
+from db_import import PRODUCT_FIELDS, DETAIL_FIELDS, EXTRA_STATUS_KEY, NO_EXTRA_DATA, DatabaseImporter
+from dead_letter import DeadLetterStore
+from naifenzhiku_detail_crawler import NaifenzhikuDetailCrawler
+from naifenzhiku_more_detail_crawler import NaifenzhikuMoreDetailCrawler, FAILED_STATUSES
+
+# 流水线中额外详情接口的这些字段会覆盖详情页的同名字段，只修复详情页时不用详情页的值覆盖已入库的值
+MORE_DETAIL_KEYS = ('配料表', '营养成分', '配方评价')
+
+
+class ProductRepairer:
+    """修复单个产品的部分数据：只重新获取失败的阶段，叠加到数据库中已有的产品记录上再导入"""
+
+    def __init__(self, conn, output_dir="data", delay_range=(1, 3), session=None,
+                 auth_token=None, username=None, password=None, logger=None):
+        """
+        初始化修复器
+        参数:
+            conn: 数据库连接，用于读取产品已入库的数据
+            output_dir: 修复结果的输出目录
+            delay_range: 请求延迟范围(最小秒数, 最大秒数)
+            session: 复用的requests会话
+            auth_token: 额外详情接口的授权token
+            username: 奶粉智库账号，token失效时重新登录
+            password: 奶粉智库密码
+            logger: 日志对象
+        """
+        self.conn = conn
+        self.output_dir = output_dir
+        self.delay_range = delay_range
+        self.session = session
+        self.auth_token = auth_token
+        self.username = username
+        self.password = password
+        self.logger = logger or logging.getLogger("ProductRepairer")
+        self.detail_crawler = None
+        self.more_detail_crawler = None
+
+    def base_records(self, product_ids):
+        """
+        由数据库中的产品基本信息和详情构造与爬虫输出格式相同的记录
+        参数:
+            product_ids: 产品ID列表
+        返回:
+            {产品ID字符串: 记录}
+        """
+        product_columns = [f"p.{column}" for column, _ in PRODUCT_FIELDS]
+        detail_columns = [f"d.{column}" for column, _ in DETAIL_FIELDS[1:]]
+        keys = [key for _, key in PRODUCT_FIELDS] + [key for _, key in DETAIL_FIELDS[1:]]
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT {', '.join(product_columns + detail_columns)}
+                FROM milk_products p
+                LEFT JOIN milk_product_details d ON d.product_id = p.product_id
+                WHERE p.product_id = ANY(%s)
+                """,
+                ([int(pid) for pid in product_ids],)
+            )
+            rows = cur.fetchall()
+        self.conn.rollback()
+
+        records = {}
+        for row in rows:
+            record = {}
+            for key, value in zip(keys, row):
+                if value is not None:
+                    record[key] = str(value) if isinstance(value, decimal.Decimal) else value
+            records[str(record['id'])] = record
+        return records
+
+    def find_gaps(self, exclude=(), limit=None):
+        """
+        查找数据库中缺失的阶段：有基本信息但没有详情的产品缺详情页，没有营养成分的产品缺额外详情
+        (额外详情接口已确认无数据的产品除外，否则每次补齐都会重复请求)
+        参数:
+            exclude: 不需要返回的(产品ID字符串, 阶段)集合，如已在失败记录中等待重试的项
+            limit: 最多返回的项数
+        返回:
+            (产品ID字符串, 阶段) 列表，按产品ID排序
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT p.product_id, 'detail' AS stage
+                FROM milk_products p
+                WHERE NOT EXISTS (SELECT 1 FROM milk_product_details d WHERE d.product_id = p.product_id)
+                UNION ALL
+                SELECT p.product_id, 'more_detail'
+                FROM milk_products p
+                WHERE NOT EXISTS (SELECT 1 FROM milk_product_nutrients n WHERE n.product_id = p.product_id)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM milk_product_extra_details e
+                      WHERE e.product_id = p.product_id AND e.key = %s AND e.value = %s
+                  )
+                ORDER BY 1, 2
+            """, (EXTRA_STATUS_KEY, NO_EXTRA_DATA))
+            rows = cur.fetchall()
+        self.conn.rollback()
+
+        gaps = [(str(pid), stage) for pid, stage in rows if (str(pid), stage) not in exclude]
+        return gaps[:limit] if limit else gaps
+
+    def fetch_stage(self, product_id, stage):
+        """
+        重新获取产品某一阶段的数据
+        返回:
+            (数据, 失败原因)，成功时失败原因为None；详情页返回404(产品已不存在)时两者均为None
+        """
+        if stage == 'detail':
+            if self.detail_crawler is None:
+                self.detail_crawler = NaifenzhikuDetailCrawler(
+                    output_dir=self.output_dir, delay_range=self.delay_range, session=self.session
+                )
+            detail = self.detail_crawler.fetch_detail(product_id)
+            if detail:
+                return detail, None
+            if self.detail_crawler.last_error is None:
+                # 详情页返回404：产品已不存在，重试也不会成功，按已处理返回空数据
+                self.logger.info(f"产品 {product_id} 的详情页不存在，不再重试")
+                return None, None
+            return None, self.detail_crawler.last_error
+
+        if self.more_detail_crawler is None:
+            self.more_detail_crawler = NaifenzhikuMoreDetailCrawler(
+                output_dir=self.output_dir,
+                delay_range=self.delay_range,
+                username=self.username,
+                password=self.password,
+                auth_token=self.auth_token,
+                session=self.session,
+                logger=self.logger
+            )
+        more_detail = self.more_detail_crawler.fetch_more_detail(product_id)
+        self.auth_token = self.more_detail_crawler.auth_token or self.auth_token
+        status = more_detail.get('额外详情状态')
+        if status in FAILED_STATUSES:
+            return None, status
+        return more_detail, None
+
+    def repair(self, targets):
+        """
+        重新获取各产品失败的阶段，并与已入库数据合并
+        参数:
+            targets: (产品ID, 阶段) 列表
+        返回:
+            (合并后的记录列表, 成功的(产品ID, 阶段)列表, 失败的{(产品ID, 阶段): 原因})
+        """
+        targets = [(str(pid), stage) for pid, stage in targets]
+        base = self.base_records({pid for pid, _ in targets})
+
+        fetched = {}
+        succeeded = []
+        failed = {}
+        for i, (product_id, stage) in enumerate(targets):
+            if product_id not in base:
+                failed[(product_id, stage)] = "产品不在数据库中"
+                continue
+            if i > 0:
+                time.sleep(random.uniform(*self.delay_range))
+
+            data, error = self.fetch_stage(product_id, stage)
+            if error:
+                failed[(product_id, stage)] = error
+            else:
+                fetched.setdefault(product_id, {})[stage] = data
+                succeeded.append((product_id, stage))
+
+        records = []
+        for product_id, stages in fetched.items():
+            record = dict(base[product_id])
+            for key, value in (stages.get('detail') or {}).items():
+                if key in MORE_DETAIL_KEYS and record.get(key) and 'more_detail' not in stages:
+                    continue
+                if key != 'id':
+                    record[key] = value
+            for key, value in (stages.get('more_detail') or {}).items():
+                if key != 'id':
+                    record[key] = value
+            records.append(record)
+
+        self.logger.info(f"修复产品数据: 成功 {len(succeeded)} 项，失败 {len(failed)} 项")
+        return records, succeeded, failed
+
+    def save_records(self, records):
+        """保存修复后的记录，返回文件路径"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = f"{self.output_dir}/naifenzhiku_repaired_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        self.logger.info(f"已保存修复后的产品数据到 {path}")
+        return path
+
+    def drain(self, store, limit=None):
+        """
+        重试失败记录中已到重试时间的项目，再次失败的按退避时间推迟
+        参数:
+            store: DeadLetterStore
+            limit: 本次最多重试的记录数
+        返回:
+            (修复结果文件路径(没有成功项时为None), 成功的(产品ID, 阶段)列表)
+            成功项需在导入成功后由调用方从记录中移除
+        """
+        due = store.due(limit=limit)
+        if not due:
+            return None, []
+
+        self.logger.info(f"开始重试 {len(due)} 条之前获取失败的记录")
+        records, succeeded, failed = self.repair([(e['product_id'], e['stage']) for e in due])
+        for (product_id, stage), error in failed.items():
+            store.record_failure(product_id, stage, error)
+        store.save()
+
+        if not records:
+            return None, []
+        return self.save_records(records), succeeded
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="重试失败记录中已到重试时间的产品并导入数据库")
+    parser.add_argument("--dead-letter-file", type=str, default="data/dead_letters.json", help="失败记录文件，默认为data/dead_letters.json")
+    parser.add_argument("--output", "-o", type=str, default="data", help="输出目录，默认为'data'")
+    parser.add_argument("--limit", type=int, help="本次最多重试的记录数")
+    parser.add_argument("--min-delay", type=float, default=1.0, help="最小请求延迟(秒)，默认为1.0秒")
+    parser.add_argument("--max-delay", type=float, default=3.0, help="最大请求延迟(秒)，默认为3.0秒")
+    parser.add_argument("--token", type=str, help="额外详情接口的授权token")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    db_params = dict(host=args.host, port=args.port, dbname=args.dbname, user=args.user, password=args.password)
+    store = DeadLetterStore(args.dead_letter_file)
+    conn = psycopg2.connect(**db_params)
+    try:
+        repairer = ProductRepairer(conn, output_dir=args.output, delay_range=(args.min_delay, args.max_delay),
+                                   auth_token=args.token)
+        records_file, succeeded = repairer.drain(store, limit=args.limit)
+    finally:
+        conn.close()
+
+    if not records_file:
+        print("没有修复成功的产品")
+        return
+
+    importer = DatabaseImporter(json_file=records_file, **db_params)
+    if importer.import_data():
+        for product_id, stage in succeeded:
+            store.resolve(product_id, stage)
+        store.save()
+        print(f"已修复并导入 {len(succeeded)} 项，剩余 {len(store)} 条失败记录")
+    else:
+        print("导入修复结果失败，失败记录保留，下次运行会再次重试")
+
+
+if __name__ == "__main__":
+    main()
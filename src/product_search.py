@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import logging
+import sys
+import time
+import psycopg2
+from psycopg2 import extras
+
+# 全文检索文档表达式，需与 database/schema.sql 中 idx_milk_product_details_fts 的定义保持一致
+FTS_CONFIG = "chinese_zh"
+FTS_DOCUMENT = "to_tsvector('chinese_zh', coalesce(d.ingredients, '') || ' ' || coalesce(d.formula_evaluation, ''))"
+
+# 可检索字段及其排序权重：配料表命中比配方评价中的提及更能说明产品"含有"该成分
+SEARCH_FIELDS = {
+    'ingredients': 1.0,
+    'formula_evaluation': 0.6,
+}
+
+# 摘要中命中词两侧保留的字符数
+SNIPPET_CONTEXT = 20
+
+
+class ProductSearch:
+    """奶粉产品检索：在配料表和配方评价中查找包含关键词的产品"""
+
+    def __init__(self, host="localhost", port=5432, dbname="milk_products",
+                 user="postgres", password="postgres", conn=None):
+        """
+        初始化产品检索
+        参数:
+            host: 数据库主机
+            port: 数据库端口
+            dbname: 数据库名称
+            user: 数据库用户
+            password: 数据库密码
+            conn: 已有的数据库连接，提供时不再新建连接
+        """
+        self.logger = logging.getLogger("ProductSearch")
+        self.own_conn = conn is None
+        self.conn = conn or psycopg2.connect(
+            host=host,
+            port=port,
+            dbname=dbname,
+            user=user,
+            password=password
+        )
+        self.has_trgm, self.has_fts = self.detect_backends()
+
+    def detect_backends(self):
+        """
+        检测数据库中可用的检索能力
+        返回:
+            (是否安装pg_trgm, 是否存在中文分词配置)
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            has_trgm = cur.fetchone()[0]
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = %s)", (FTS_CONFIG,))
+            has_fts = cur.fetchone()[0]
+        self.conn.rollback()
+
+        if not has_trgm:
+            self.logger.warning("数据库未安装pg_trgm扩展，子串检索将退化为顺序扫描")
+        return has_trgm, has_fts
+
+    def close(self):
+        """关闭数据库连接(仅关闭自行创建的连接)"""
+        if self.own_conn and self.conn:
+            self.conn.close()
+
+    def search(self, keyword, fields=None, limit=20, mode="substring"):
+        """
+        检索包含关键词的产品
+        参数:
+            keyword: 关键词，如"乳铁蛋白"
+            fields: 检索字段列表，默认检索配料表和配方评价
+            limit: 返回的最大产品数
+            mode: substring(子串匹配，走三元组索引) 或 fts(中文分词全文检索)
+        返回:
+            按得分降序排列的结果列表，每项包含product_id、name、field、score、snippet
+        """
+        keyword = (keyword or '').strip()
+        if not keyword:
+            return []
+
+        fields = fields or list(SEARCH_FIELDS.keys())
+        unknown = [f for f in fields if f not in SEARCH_FIELDS]
+        if unknown:
+            raise ValueError(f"不支持的检索字段: {', '.join(unknown)}")
+
+        if mode == "fts":
+            if not self.has_fts:
+                raise ValueError(f"数据库中不存在中文分词配置 {FTS_CONFIG}，无法使用fts模式")
+            return self._search_fts(keyword, limit)
+
+        if self.has_trgm and len(keyword) < 3:
+            # 少于3个字符的关键词无法生成完整三元组，索引只能做全量扫描
+            self.logger.info(f"关键词 '{keyword}' 少于3个字符，无法有效利用三元组索引")
+        return self._search_substring(keyword, fields, limit)
+
+    def _search_substring(self, keyword, fields, limit):
+        """基于ILIKE的子串检索，得分综合命中次数与命中位置(配料表按含量降序排列，越靠前越主要)"""
+        branches = []
+        params = {'kw': keyword.lower(), 'pattern': f"%{self._escape_like(keyword)}%",
+                  'ctx': SNIPPET_CONTEXT, 'limit': limit}
+        for field in fields:
+            branches.append(f"""
+                SELECT d.product_id, '{field}' AS field, {SEARCH_FIELDS[field]}::numeric AS weight,
+                       lower(d.{field}) AS body, d.{field} AS raw
+                FROM milk_product_details d
+                WHERE d.{field} ILIKE %(pattern)s
+            """)
+
+        sql = f"""
+        WITH hits AS ({' UNION ALL '.join(branches)}),
+        scored AS (
+            SELECT product_id, field, raw,
+                   strpos(body, %(kw)s) AS pos,
+                   weight * (
+                       (length(body) - length(replace(body, %(kw)s, ''))) / length(%(kw)s)
+                       + 1.0 - strpos(body, %(kw)s)::numeric / greatest(length(body), 1)
+                   ) AS score
+            FROM hits
+        ),
+        ranked AS (
+            SELECT product_id,
+                   sum(score) AS score,
+                   (array_agg(field ORDER BY score DESC))[1] AS field,
+                   (array_agg(
+                        substr(raw, greatest(pos - %(ctx)s, 1), length(%(kw)s) + 2 * %(ctx)s)
+                        ORDER BY score DESC))[1] AS snippet
+            FROM scored
+            GROUP BY product_id
+        )
+        SELECT r.product_id, p.name, r.field, round(r.score, 4) AS score, r.snippet
+        FROM ranked r
+        LEFT JOIN milk_products p ON p.product_id = r.product_id
+        ORDER BY r.score DESC, r.product_id
+        LIMIT %(limit)s
+        """
+        return self._fetch(sql, params)
+
+    def _search_fts(self, keyword, limit):
+        """基于zhparser分词的全文检索，使用ts_rank排序、ts_headline生成摘要"""
+        sql = f"""
+        SELECT d.product_id, p.name, 'ingredients+formula_evaluation' AS field,
+               round(ts_rank({FTS_DOCUMENT}, q)::numeric, 4) AS score,
+               ts_headline(%(config)s,
+                           coalesce(d.ingredients, '') || ' ' || coalesce(d.formula_evaluation, ''),
+                           q, 'MaxWords=20, MinWords=5, StartSel=【, StopSel=】') AS snippet
+        FROM milk_product_details d
+        CROSS JOIN plainto_tsquery(%(config)s, %(kw)s) q
+        LEFT JOIN milk_products p ON p.product_id = d.product_id
+        WHERE {FTS_DOCUMENT} @@ q
+        ORDER BY score DESC, d.product_id
+        LIMIT %(limit)s
+        """
+        return self._fetch(sql, {'config': FTS_CONFIG, 'kw': keyword, 'limit': limit})
+
+    def _fetch(self, sql, params):
+        """执行查询并以字典列表返回结果"""
+        try:
+            with self.conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
+                cur.execute(sql, params)
+                rows = [dict(row) for row in cur.fetchall()]
+            for row in rows:
+                row['score'] = float(row['score'])
+            return rows
+        finally:
+            # 只读查询，结束事务避免长时间持有快照
+            self.conn.rollback()
+
+    @staticmethod
+    def _escape_like(text):
+        """转义LIKE模式中的特殊字符"""
+        return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="奶粉产品检索：在配料表和配方评价中查找关键词")
+    parser.add_argument("keyword", type=str, help="检索关键词，如'乳铁蛋白'")
+    parser.add_argument("--field", action="append", choices=list(SEARCH_FIELDS.keys()),
+                        help="检索字段，可重复指定，默认检索全部字段")
+    parser.add_argument("--mode", type=str, default="substring", choices=["substring", "fts"],
+                        help="检索模式：substring为子串匹配(默认)，fts为中文分词全文检索(需要zhparser)")
+    parser.add_argument("--limit", type=int, default=20, help="返回的最大产品数，默认为20")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    searcher = ProductSearch(
+        host=args.host,
+        port=args.port,
+        dbname=args.dbname,
+        user=args.user,
+        password=args.password
+    )
+
+    try:
+        start = time.perf_counter()
+        results = searcher.search(args.keyword, fields=args.field, limit=args.limit, mode=args.mode)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    except ValueError as e:
+        print(f"检索失败: {e}")
+        sys.exit(1)
+    finally:
+        searcher.close()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"关键词 '{args.keyword}' 共返回 {len(results)} 个产品 (耗时 {elapsed_ms:.1f} ms)")
+    for row in results:
+        print(f"[{row['product_id']}] {row['name'] or ''}  得分={row['score']}  字段={row['field']}")
+        print(f"    ...{row['snippet']}...")
+
+
+if __name__ == "__main__":
+    main()
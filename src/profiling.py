@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import pstats
+import cProfile
+import resource
+import functools
+import itertools
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# 环境变量：设置后未指定--profile的运行也会分析，cron任务无需修改命令行
+PROFILE_ENV = "NFZK_PROFILE"
+# 分析结果目录，默认为logs
+PROFILE_DIR_ENV = "NFZK_PROFILE_DIR"
+
+PROFILE_MODES = ("cprofile", "pyinstrument", "tracemalloc")
+DEFAULT_PROFILE_DIR = "logs"
+
+# 文本报告中列出的函数/代码位置数
+TOP_ENTRIES = 40
+TRACEMALLOC_FRAMES = 1
+
+_NULL_STAGE = nullcontext()
+
+# 进程内的会话序号，写入文件名前缀：常驻进程中一秒内开始的两次运行不会互相覆盖结果文件
+_SESSION_SEQUENCE = itertools.count(1)
+
+
+def env_mode():
+    """环境变量NFZK_PROFILE指定的分析方式，未设置或无效时返回None"""
+    mode = os.environ.get(PROFILE_ENV, "").strip().lower()
+    return mode if mode in PROFILE_MODES else None
+
+
+def add_argument(parser):
+    """为命令行入口添加--profile参数，默认取环境变量NFZK_PROFILE"""
+    parser.add_argument("--profile", type=str, choices=PROFILE_MODES, default=env_mode(),
+                        help=f"分析本次运行并把各阶段的结果写入{DEFAULT_PROFILE_DIR}/：cprofile(函数调用统计)、"
+                             f"pyinstrument(采样调用树，需安装pyinstrument)、tracemalloc(峰值内存和分配最多的位置)，"
+                             f"也可用环境变量{PROFILE_ENV}指定")
+
+
+def peak_rss_mb():
+    """进程的峰值常驻内存(MB)，Linux上ru_maxrss的单位为KB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class CProfileBackend:
+    """cProfile：每个阶段一个.prof(可用snakeviz等工具打开)和按累计耗时排序的文本报告"""
+
+    def start(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def pause(self, profile):
+        profile.disable()
+
+    def resume(self, profile):
+        profile.enable()
+
+    def stop(self, profile):
+        profile.disable()
+        try:
+            return pstats.Stats(profile)
+        except TypeError:
+            # 没有记录到任何调用
+            return None
+
+    def combine(self, result, children):
+        children = [child for child in children if child is not None]
+        if result is None:
+            if not children:
+                return None
+            result, children = children[0], children[1:]
+        if children:
+            # 子阶段的统计并入副本，子阶段自身的结果保持不变
+            combined = pstats.Stats()
+            combined.add(result, *children)
+            return combined
+        return result
+
+    def write(self, result, path_base):
+        if result is None:
+            return []
+        result.dump_stats(path_base + ".prof")
+        with open(path_base + ".txt", 'w', encoding='utf-8') as f:
+            result.stream = f
+            result.sort_stats('cumulative').print_stats(TOP_ENTRIES)
+        return [path_base + ".prof", path_base + ".txt"]
+
+
+class PyinstrumentBackend:
+    """pyinstrument：每个阶段一个可交互的HTML调用树和文本调用树"""
+
+    def __init__(self):
+        # pyinstrument为可选依赖，只在选择该方式时导入
+        from pyinstrument import Profiler
+        from pyinstrument.session import Session
+        self.Profiler = Profiler
+        self.Session = Session
+
+    def start(self):
+        profiler = self.Profiler()
+        profiler.start()
+        return profiler
+
+    def pause(self, profiler):
+        profiler.stop()
+
+    def resume(self, profiler):
+        # 再次start后，stop返回的会话包含之前各段的采样
+        profiler.start()
+
+    def stop(self, profiler):
+        return profiler.stop()
+
+    def combine(self, result, children):
+        for child in children:
+            result = self.Session.combine(result, child)
+        return result
+
+    def write(self, result, path_base):
+        from pyinstrument.renderers import ConsoleRenderer, HTMLRenderer
+        with open(path_base + ".html", 'w', encoding='utf-8') as f:
+            f.write(HTMLRenderer().render(result))
+        with open(path_base + ".txt", 'w', encoding='utf-8') as f:
+            f.write(ConsoleRenderer(unicode=True, color=False).render(result))
+        return [path_base + ".html", path_base + ".txt"]
+
+
+class TracemallocBackend:
+    """tracemalloc：每个阶段的峰值内存、内存增长最多和结束时占用最多的代码位置"""
+
+    def __init__(self):
+        self.started_here = False
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.started_here = True
+        state = {'start': self.snapshot(), 'peak': 0}
+        tracemalloc.reset_peak()
+        return state
+
+    def pause(self, state):
+        # 子阶段会重置峰值，先记下到目前为止的峰值
+        state['peak'] = max(state['peak'], tracemalloc.get_traced_memory()[1])
+
+    def resume(self, state):
+        tracemalloc.reset_peak()
+
+    def stop(self, state):
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'start': state['start'],
+            'end': self.snapshot(),
+            'current': current,
+            'peak': max(state['peak'], peak),
+        }
+
+    def combine(self, result, children):
+        # 快照覆盖了子阶段的分配，只需合并峰值
+        for child in children:
+            result['peak'] = max(result['peak'], child['peak'])
+        return result
+
+    def write(self, result, path_base):
+        lines = [
+            f"峰值内存(tracemalloc): {result['peak'] / 1024 / 1024:.1f} MB",
+            f"结束时内存(tracemalloc): {result['current'] / 1024 / 1024:.1f} MB",
+            f"进程峰值RSS: {peak_rss_mb():.1f} MB",
+            "",
+            f"内存增长最多的{TOP_ENTRIES}个位置:",
+        ]
+        lines.extend(str(stat) for stat in result['end'].compare_to(result['start'], 'lineno')[:TOP_ENTRIES])
+        lines.extend(["", f"结束时占用最多的{TOP_ENTRIES}个位置:"])
+        lines.extend(str(stat) for stat in result['end'].statistics('lineno')[:TOP_ENTRIES])
+        with open(path_base + ".txt", 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        return [path_base + ".txt"]
+
+    def close(self):
+        if self.started_here:
+            tracemalloc.stop()
+
+
+BACKENDS = {
+    'cprofile': CProfileBackend,
+    'pyinstrument': PyinstrumentBackend,
+    'tracemalloc': TracemallocBackend,
+}
+
+
+class StageFrame:
+    """阶段栈中的一层"""
+
+    __slots__ = ('name', 'handle', 'start', 'children')
+
+    def __init__(self, name, handle):
+        self.name = name
+        self.handle = handle
+        self.start = time.perf_counter()
+        self.children = []
+
+
+class ProfileSession:
+    """
+    一次运行的分析：整个运行和其中每个阶段各写一份结果
+    同一时刻只有一个分析器在运行，进入子阶段时暂停外层，子阶段的结果在退出时并入外层，
+    因此每个阶段的结果都包含其中的子阶段；cProfile和pyinstrument只分析启动分析的线程
+    """
+
+    def __init__(self, entry, mode, directory=None):
+        """
+        初始化
+        参数:
+            entry: 入口名称，用于文件名
+            mode: cprofile/pyinstrument/tracemalloc
+            directory: 结果目录，默认为环境变量NFZK_PROFILE_DIR或logs
+        """
+        self.entry = entry
+        self.mode = mode
+        self.backend = BACKENDS[mode]()
+        self.directory = directory or os.environ.get(PROFILE_DIR_ENV, DEFAULT_PROFILE_DIR)
+        self.prefix = os.path.join(
+            self.directory,
+            f"profile_{entry}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{next(_SESSION_SEQUENCE)}"
+        )
+        self.thread = threading.get_ident()
+        self.stack = []
+        self.count = 0
+        # [(序号, 阶段, 耗时, 文件列表)]
+        self.stages = []
+        os.makedirs(self.directory, exist_ok=True)
+
+    def push(self, name):
+        if self.stack:
+            self.backend.pause(self.stack[-1].handle)
+        self.stack.append(StageFrame(name, self.backend.start()))
+
+    def pop(self):
+        frame = self.stack.pop()
+        result = self.backend.combine(self.backend.stop(frame.handle), frame.children)
+        seconds = time.perf_counter() - frame.start
+
+        self.count += 1
+        safe_name = "".join(c if c.isalnum() or c in '._-' else '_' for c in frame.name)
+        try:
+            files = self.backend.write(result, f"{self.prefix}_{self.count:02d}_{safe_name}")
+        except Exception as e:
+            files = [f"写入失败: {e}"]
+        self.stages.append((self.count, frame.name, seconds, files))
+
+        if self.stack:
+            self.stack[-1].children.append(result)
+            self.backend.resume(self.stack[-1].handle)
+
+    def write_summary(self):
+        """写出各阶段的耗时、结果文件和进程峰值内存"""
+        path = f"{self.prefix}_summary.txt"
+        lines = [f"入口: {self.entry}", f"分析方式: {self.mode}", f"进程峰值RSS: {peak_rss_mb():.1f} MB", ""]
+        for index, name, seconds, files in self.stages:
+            lines.append(f"{index:02d} {name}: {seconds:.3f} 秒")
+            lines.extend(f"    {file}" for file in files)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def close(self):
+        if hasattr(self.backend, 'close'):
+            self.backend.close()
+
+
+_session = None
+
+
+@contextmanager
+def session(entry, mode=None):
+    """
+    分析整个with块(整个运行)，mode为None时不分析；已在分析中时作为一个阶段
+    参数:
+        entry: 入口名称，用于文件名和阶段名
+        mode: cprofile/pyinstrument/tracemalloc或None
+    返回:
+        (with的值) 当前的ProfileSession，未分析时为None
+    """
+    global _session
+    if _session is not None:
+        with stage(entry):
+            yield _session
+        return
+    if not mode:
+        yield None
+        return
+
+    try:
+        current = ProfileSession(entry, mode)
+    except ImportError as e:
+        print(f"无法启用{mode}分析，本次运行不分析: {e}")
+        yield None
+        return
+    _session = current
+    current.push(entry)
+    try:
+        yield current
+    finally:
+        while current.stack:
+            current.pop()
+        _session = None
+        current.close()
+        summary = current.write_summary()
+        print(f"已保存分析结果到 {current.prefix}_*，汇总: {summary}")
+
+
+def stage(name):
+    """把with块作为一个阶段单独分析；没有进行中的分析或不在分析线程中时返回空的上下文管理器"""
+    current = _session
+    if current is None or current.thread != threading.get_ident():
+        return _NULL_STAGE
+    return _stage(current, name)
+
+
+@contextmanager
+def _stage(current, name):
+    current.push(name)
+    try:
+        yield
+    finally:
+        current.pop()
+
+
+def profiled(name=None):
+    """把整个函数调用作为一个阶段分析的装饰器，阶段名默认为限定函数名"""
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _session is None:
+                return func(*args, **kwargs)
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
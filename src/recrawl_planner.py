@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import math
+import argparse
+import logging
+import decimal
+import psycopg2
+from datetime import datetime
+
+from db_import import PRODUCT_FIELDS
+
+# 频繁波动、不代表产品资料变化的字段，只有这些字段变化时不计为一次变更
+VOLATILE_FIELDS = ['click_count']
+
+# 没有检查记录时的先验：相当于每prior_days天变化prior_changes次
+PRIOR_CHANGES = 1.0
+PRIOR_DAYS = 30.0
+
+# 变更频率下限(次/天)，保证从未变化的产品也会隔一段时间被重新检查
+MIN_RATE = 1.0 / 180
+
+# 计划中费用-收益曲线的预算取样点(占全量重新爬取的比例)
+CURVE_FRACTIONS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0)
+
+
+def estimate_rate(checks, changes, span_days, history_changes=0, known_days=0.0,
+                  min_rate=MIN_RATE):
+    """
+    估计产品的变更频率(次/天)
+    参数:
+        checks: 观测区间数(首次检查之后的检查次数)
+        changes: 发现变化的区间数
+        span_days: 首次到最近一次检查的天数
+        history_changes: 没有检查记录时使用的历史变更次数(product_changes)
+        known_days: 产品入库至今的天数
+        min_rate: 频率下限
+    返回:
+        每天的期望变更次数
+    """
+    if checks > 0 and span_days > 0:
+        # 每个区间只能看出"变了没有"，区间内变化多次也只计一次，
+        # 用Cho和Garcia-Molina的泊松估计修正：r = -ln((n - X + 0.5) / (n + 0.5))
+        interval = span_days / checks
+        rate = -math.log((checks - changes + 0.5) / (checks + 0.5)) / interval
+    else:
+        rate = (history_changes + PRIOR_CHANGES) / (max(known_days, 0.0) + PRIOR_DAYS)
+    return max(rate, min_rate)
+
+
+class RecrawlPlanner:
+    """按产品变更频率制定重新爬取计划：在请求预算内优先重新爬取最可能已变化的产品"""
+
+    def __init__(self, conn, requests_per_product=2, min_rate=MIN_RATE, logger=None):
+        """
+        初始化计划器
+        参数:
+            conn: 数据库连接
+            requests_per_product: 重新爬取一个产品需要的请求数(详情页和额外详情接口各一次)
+            min_rate: 变更频率下限(次/天)
+            logger: 日志对象
+        """
+        self.conn = conn
+        self.requests_per_product = requests_per_product
+        self.min_rate = min_rate
+        self.logger = logger or logging.getLogger("RecrawlPlanner")
+
+    def record_observations(self, cur, product_ids, changed_ids):
+        """
+        记录一次检查的结果
+        参数:
+            cur: 数据库游标(在调用方的事务中执行)
+            product_ids: 本次检查的产品ID
+            changed_ids: 其中发现变化的产品ID
+        """
+        changed_ids = set(changed_ids)
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        # 首次检查的已入库产品以入库时间为上一次观测，本次即为第一个观测区间
+        cur.execute(
+            """
+            INSERT INTO product_crawl_state AS s
+                (product_id, first_checked_at, last_checked_at, last_changed_at, checks, changes)
+            SELECT o.product_id, coalesce(p.created_at, NOW()), NOW(),
+                   CASE WHEN o.changed THEN NOW() END,
+                   coalesce(p.created_at < NOW(), FALSE)::INTEGER,
+                   coalesce(o.changed AND p.created_at < NOW(), FALSE)::INTEGER
+            FROM unnest(%s::INTEGER[], %s::BOOLEAN[]) AS o(product_id, changed)
+            LEFT JOIN milk_products p ON p.product_id = o.product_id
+            ON CONFLICT (product_id) DO UPDATE SET
+                last_checked_at = EXCLUDED.last_checked_at,
+                last_changed_at = coalesce(EXCLUDED.last_changed_at, s.last_changed_at),
+                checks = s.checks + 1,
+                changes = s.changes + (EXCLUDED.last_changed_at IS NOT NULL)::INTEGER
+            """,
+            (product_ids, [pid in changed_ids for pid in product_ids])
+        )
+
+    def record_recrawl(self, product_ids, run_id):
+        """
+        按计划重新爬取并导入后，根据导入批次的变更记录更新观测
+        参数:
+            product_ids: 本次重新爬取的产品ID
+            run_id: 导入批次ID，为None时视为均未变化
+        返回:
+            发现变化的产品数
+        """
+        with self.conn:
+            with self.conn.cursor() as cur:
+                changed_ids = []
+                if run_id is not None:
+                    cur.execute(
+                        """
+                        SELECT product_id FROM product_changes
+                        WHERE run_id = %s AND product_id = ANY(%s)
+                          AND (op <> 'U' OR NOT changed_fields <@ %s::TEXT[])
+                        """,
+                        (run_id, list(product_ids), VOLATILE_FIELDS)
+                    )
+                    changed_ids = [row[0] for row in cur.fetchall()]
+                self.record_observations(cur, product_ids, changed_ids)
+        self.logger.info(f"重新爬取了 {len(product_ids)} 个产品，其中 {len(changed_ids)} 个有变化")
+        return len(changed_ids)
+
+    def estimate(self):
+        """
+        估计所有产品的变更频率和当前已变化的概率
+        返回:
+            产品字典列表，每项包含product_id、rate、age_days、p_changed、checks、changes
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT p.product_id,
+                       coalesce(s.checks, 0),
+                       coalesce(s.changes, 0),
+                       coalesce(extract(epoch FROM s.last_checked_at - s.first_checked_at) / 86400, 0),
+                       coalesce(h.changes, 0),
+                       coalesce(extract(epoch FROM NOW() - p.created_at) / 86400, 0),
+                       extract(epoch FROM NOW() - coalesce(s.last_checked_at, p.updated_at, p.created_at, NOW())) / 86400
+                FROM milk_products p
+                LEFT JOIN product_crawl_state s ON s.product_id = p.product_id
+                LEFT JOIN (
+                    SELECT product_id, count(*) AS changes
+                    FROM product_changes
+                    WHERE op = 'U' AND NOT changed_fields <@ %s::TEXT[]
+                    GROUP BY product_id
+                ) h ON h.product_id = p.product_id
+                ORDER BY p.product_id
+                """,
+                (VOLATILE_FIELDS,)
+            )
+            rows = cur.fetchall()
+        self.conn.rollback()
+
+        products = []
+        for product_id, checks, changes, span_days, history, known_days, age_days in rows:
+            rate = estimate_rate(checks, changes, float(span_days), history, float(known_days), self.min_rate)
+            age_days = max(float(age_days), 0.0)
+            products.append({
+                'product_id': product_id,
+                'rate': rate,
+                'age_days': age_days,
+                # 泊松过程下距上次检查age天内至少变化一次的概率
+                'p_changed': 1 - math.exp(-rate * age_days),
+                'checks': checks,
+                'changes': changes,
+            })
+        return products
+
+    def plan(self, budget):
+        """
+        在请求预算内选出要重新爬取的产品：按已变化概率从高到低贪心选择
+        参数:
+            budget: 本次运行可用的请求数
+        返回:
+            计划字典，包含汇总信息、费用-收益曲线和选中的产品
+        """
+        products = self.estimate()
+        # 概率相同(如刚全部检查过)时优先变更频率高的产品
+        products.sort(key=lambda item: (item['p_changed'], item['rate']), reverse=True)
+
+        capacity = max(int(budget // self.requests_per_product), 0)
+        selected = products[:capacity]
+
+        total = len(products)
+        expected_total = sum(item['p_changed'] for item in products)
+        expected_captured = sum(item['p_changed'] for item in selected)
+
+        # 每个取样预算下：按变更频率选择与平均分配(随机选同样数量)各能发现多少变化
+        cumulative = [0.0]
+        for item in products:
+            cumulative.append(cumulative[-1] + item['p_changed'])
+        curve = []
+        for fraction in CURVE_FRACTIONS:
+            count = int(round(total * fraction))
+            curve.append({
+                'requests': count * self.requests_per_product,
+                'products': count,
+                'expected_changes': round(cumulative[count], 2),
+                'uniform_expected_changes': round(expected_total * count / total, 2) if total else 0.0,
+                'expected_fresh_ratio': round(1 - (expected_total - cumulative[count]) / total, 4) if total else 1.0,
+            })
+
+        summary = {
+            'generated_at': datetime.now().isoformat(),
+            'budget': budget,
+            'requests_per_product': self.requests_per_product,
+            'products_total': total,
+            'products_selected': len(selected),
+            'requests_planned': len(selected) * self.requests_per_product,
+            'full_recrawl_requests': total * self.requests_per_product,
+            'expected_stale_before': round(expected_total, 2),
+            'expected_changes_captured': round(expected_captured, 2),
+            'uniform_expected_changes': round(expected_total * len(selected) / total, 2) if total else 0.0,
+            'expected_fresh_ratio_before': round(1 - expected_total / total, 4) if total else 1.0,
+            'expected_fresh_ratio_after': round(1 - (expected_total - expected_captured) / total, 4) if total else 1.0,
+        }
+
+        self.logger.info(
+            f"重新爬取计划: 预算 {budget} 次请求，选中 {len(selected)}/{total} 个产品，"
+            f"预计发现 {expected_captured:.1f} 个变化(平均分配约 {summary['uniform_expected_changes']:.1f} 个)，"
+            f"预计新鲜度 {summary['expected_fresh_ratio_before']:.1%} -> {summary['expected_fresh_ratio_after']:.1%}"
+        )
+
+        return {
+            'summary': summary,
+            'curve': curve,
+            'products': [
+                dict(item, rate=round(item['rate'], 5), age_days=round(item['age_days'], 2),
+                     p_changed=round(item['p_changed'], 4))
+                for item in selected
+            ],
+        }
+
+    def listing_records(self, product_ids):
+        """
+        由数据库中的产品基本信息构造与产品列表格式相同的记录，供爬虫流水线直接爬取详情
+        参数:
+            product_ids: 产品ID列表
+        返回:
+            产品列表记录
+        """
+        columns = ', '.join(column for column, _ in PRODUCT_FIELDS)
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT {columns} FROM milk_products WHERE product_id = ANY(%s) ORDER BY product_id",
+                        (list(product_ids),))
+            rows = cur.fetchall()
+        self.conn.rollback()
+
+        records = []
+        for row in rows:
+            record = {}
+            for (_, key), value in zip(PRODUCT_FIELDS, row):
+                record[key] = str(value) if isinstance(value, decimal.Decimal) else value
+            records.append(record)
+        return records
+
+    @staticmethod
+    def save_plan(plan, path):
+        """保存计划为JSON文件"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按产品变更频率制定重新爬取计划")
+    parser.add_argument("--budget", type=int, required=True, help="本次运行可用的请求数")
+    parser.add_argument("--requests-per-product", type=int, default=2, help="重新爬取一个产品需要的请求数，默认为2")
+    parser.add_argument("--min-rate", type=float, default=MIN_RATE, help=f"变更频率下限(次/天)，默认为{MIN_RATE:.4f}")
+    parser.add_argument("--output", "-o", type=str, help="计划JSON文件路径，默认为data/recrawl_plan_时间戳.json")
+    parser.add_argument("--host", type=str, default="localhost", help="数据库主机，默认为localhost")
+    parser.add_argument("--port", type=int, default=5432, help="数据库端口，默认为5432")
+    parser.add_argument("--dbname", type=str, default="milk_products", help="数据库名称，默认为milk_products")
+    parser.add_argument("--user", type=str, default="postgres", help="数据库用户，默认为postgres")
+    parser.add_argument("--password", type=str, default="postgres", help="数据库密码，默认为postgres")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+    try:
+        planner = RecrawlPlanner(conn, requests_per_product=args.requests_per_product, min_rate=args.min_rate)
+        plan = planner.plan(args.budget)
+    finally:
+        conn.close()
+
+    output = args.output or f"data/recrawl_plan_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    planner.save_plan(plan, output)
+
+    print(f"计划已保存到 {output}")
+    print("请求数\t产品数\t预计发现变化\t平均分配\t预计新鲜度")
+    for point in plan['curve']:
+        print(f"{point['requests']}\t{point['products']}\t{point['expected_changes']}\t"
+              f"{point['uniform_expected_changes']}\t{point['expected_fresh_ratio']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
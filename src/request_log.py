@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import glob
+import time
+import atexit
+import argparse
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# 环境变量：请求日志路径(可含strftime格式)，未设置时为logs/requests_%Y%m%d.jsonl，设为off时不记录
+REQUEST_LOG_ENV = "NFZK_REQUEST_LOG"
+DEFAULT_PATH = os.path.join("logs", "requests_%Y%m%d.jsonl")
+DISABLED_VALUES = ("off", "0", "false", "none")
+
+# 缓冲的记录数，达到后追加写入文件
+BUFFER_SIZE = 256
+PERCENTILES = (0.50, 0.95, 0.99)
+
+
+def outcome_of(status):
+    """
+    由状态码或异常类型名得到请求结果: ok/http_error/exception
+    HTTP 200但响应内容表明失败时(如需要登录、无法解析)由调用方传入明确的结果，见record的outcome参数
+    """
+    if isinstance(status, int):
+        return 'ok' if status < 400 else 'http_error'
+    return 'exception'
+
+
+def percentile(ordered, q):
+    """已排序列表的近似分位数(最近秩)"""
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class RequestStats:
+    """累计请求记录，得出按主机的延迟分位数、错误分布和请求放大"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.by_host = Counter()
+        self.errors_by_host = Counter()
+        self.by_kind = Counter()
+        self.errors = Counter()
+        self.retries = 0
+        self.bytes = 0
+        # {去向: 产品数}，去向为db(导入数据库)或file(保存为文件)
+        self.stored = Counter()
+
+    def add(self, record):
+        if 'stored' in record:
+            self.stored[record.get('sink', 'file')] += record['stored']
+            return
+        host = record['host']
+        self.latencies[host].append(record['ms'])
+        self.by_host[host] += 1
+        self.by_kind[record['kind']] += 1
+        self.bytes += record.get('bytes', 0)
+        if record.get('attempt', 0) > 0:
+            self.retries += 1
+        if record['outcome'] != 'ok':
+            self.errors_by_host[host] += 1
+            if record['outcome'] == 'http_error':
+                label = f"HTTP {record['status']}"
+            elif record['outcome'] == 'exception':
+                label = str(record['status'])
+            else:
+                label = record['outcome']
+            self.errors[label] += 1
+
+    @property
+    def total(self):
+        return sum(self.by_host.values())
+
+    def stored_products(self):
+        """成功入库的产品数；本次运行没有导入数据库时取保存到文件的产品数"""
+        return self.stored['db'] if 'db' in self.stored else self.stored['file']
+
+    def report(self):
+        """
+        汇总报告
+        返回:
+            字典：请求总数、重试数、成功保存的产品数、请求放大、各主机的分位数和错误数、错误分布
+        """
+        stored = self.stored_products()
+        hosts = {}
+        for host, values in self.latencies.items():
+            ordered = sorted(values)
+            hosts[host] = {
+                'requests': self.by_host[host],
+                'errors': self.errors_by_host[host],
+                **{f"p{int(q * 100)}_ms": round(percentile(ordered, q), 1) for q in PERCENTILES},
+            }
+        return {
+            'requests': self.total,
+            'retries': self.retries,
+            'bytes': self.bytes,
+            'stored_products': stored,
+            'requests_per_stored_product': round(self.total / stored, 3) if stored else None,
+            'by_kind': dict(self.by_kind),
+            'hosts': hosts,
+            'errors': dict(self.errors.most_common()),
+        }
+
+
+def format_report(report):
+    """把汇总报告格式化为多行文本"""
+    amplification = report['requests_per_stored_product']
+    lines = [
+        f"请求日志汇总: 共 {report['requests']} 次请求(其中重试 {report['retries']} 次)，"
+        f"响应 {report['bytes'] / 1024 / 1024:.1f} MB，成功保存产品 {report['stored_products']} 个，"
+        f"请求放大 {amplification if amplification is not None else '-'} 次/产品",
+        f"按类型: {', '.join(f'{kind} {count}' for kind, count in sorted(report['by_kind'].items())) or '-'}",
+        f"{'主机':<28} {'请求数':>8} {'错误数':>8} {'p50(ms)':>10} {'p95(ms)':>10} {'p99(ms)':>10}",
+    ]
+    for host, row in sorted(report['hosts'].items(), key=lambda item: -item[1]['requests']):
+        lines.append(f"{host:<28} {row['requests']:>8} {row['errors']:>8} {row['p50_ms']:>10.1f} "
+                     f"{row['p95_ms']:>10.1f} {row['p99_ms']:>10.1f}")
+    lines.append(f"错误分布: {', '.join(f'{label} {count}' for label, count in report['errors'].items()) or '无'}")
+    return "\n".join(lines)
+
+
+class RequestLog:
+    """把每次HTTP尝试缓冲后追加写入JSONL文件，同时累计本次运行的统计"""
+
+    def __init__(self, path):
+        """
+        初始化
+        参数:
+            path: 日志文件路径，可含strftime格式，每次写入时按当前时间展开
+        """
+        self.path = path
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.new_run()
+
+    def new_run(self):
+        self.run_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        self.stats = RequestStats()
+
+    def append(self, record):
+        record['run'] = self.run_id
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            self.stats.add(record)
+            self.buffer.append(line)
+            if len(self.buffer) < BUFFER_SIZE:
+                return
+            lines, self.buffer = self.buffer, []
+        self.write(lines)
+
+    def write(self, lines):
+        path = datetime.now().strftime(self.path)
+        directory = os.path.dirname(path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            # 请求日志只用于分析，写入失败不影响爬取
+            print(f"写入请求日志失败: {e}", file=sys.stderr)
+
+    def flush(self):
+        with self.lock:
+            lines, self.buffer = self.buffer, []
+        if lines:
+            self.write(lines)
+
+    def finish_run(self):
+        """写出缓冲的记录，返回本次运行的汇总报告并开始新的运行"""
+        self.flush()
+        with self.lock:
+            stats = self.stats
+            self.new_run()
+        return stats.report()
+
+
+def _log_from_env():
+    path = os.environ.get(REQUEST_LOG_ENV, "").strip() or DEFAULT_PATH
+    if path.lower() in DISABLED_VALUES:
+        return None
+    request_log = RequestLog(path)
+    atexit.register(request_log.flush)
+    return request_log
+
+
+_log = _log_from_env()
+
+
+def enabled():
+    return _log is not None
+
+
+def record(kind, url, status, seconds, nbytes=0, target=None, attempt=0, outcome=None):
+    """
+    记录一次HTTP尝试
+    参数:
+        kind: 请求类型(listing/detail/more_detail/login/image)
+        url: 请求URL
+        status: 状态码，请求异常时为异常类型名
+        seconds: 耗时(秒)
+        nbytes: 响应字节数
+        target: 产品ID或页码
+        attempt: 第几次尝试(从0开始)
+        outcome: 明确的请求结果(如login_required/parse_error/api_error/not_found)，为None时由状态码判断
+    """
+    if _log is None:
+        return
+    _log.append({
+        'ts': round(time.time(), 3),
+        'host': urlsplit(url).hostname or 'unknown',
+        'kind': kind,
+        'id': target,
+        'status': status,
+        'bytes': nbytes,
+        'ms': round(seconds * 1000, 1),
+        'attempt': attempt,
+        'outcome': outcome or outcome_of(status),
+    })
+
+
+def record_stored(count, sink='file'):
+    """
+    记录本次运行成功保存的产品数，用于计算请求放大
+    参数:
+        count: 产品数
+        sink: db(导入数据库)或file(保存为文件)，同一运行中两者都有时以db为准
+    """
+    if _log is None or not count:
+        return
+    _log.append({'ts': round(time.time(), 3), 'stored': count, 'sink': sink})
+
+
+def finish_run(logger=None):
+    """
+    结束一次运行：写出缓冲的记录并输出本次运行的汇总报告
+    参数:
+        logger: 输出报告的日志器，为None时打印
+    返回:
+        汇总报告字典，未启用或本次运行没有请求时返回None
+    """
+    if _log is None:
+        return None
+    report = _log.finish_run()
+    if not report['requests']:
+        return None
+    text = format_report(report)
+    if logger is not None:
+        for line in text.splitlines():
+            logger.info(line)
+    else:
+        print(text)
+    return report
+
+
+def read_records(paths):
+    """逐条读取请求日志文件中的记录，跳过无法解析的行(如进程中途退出时写了一半的行)"""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def main():
+    """主函数：由请求日志文件生成汇总报告"""
+    parser = argparse.ArgumentParser(description="由请求日志(JSONL)生成按主机的延迟分位数、错误分布和请求放大报告")
+    parser.add_argument("files", nargs="*", help="请求日志文件，支持通配符，默认为logs/requests_*.jsonl")
+    parser.add_argument("--run", type=str, help="只统计指定运行ID的记录")
+    parser.add_argument("--by-run", action="store_true", help="每个运行分别输出报告")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+
+    args = parser.parse_args()
+
+    patterns = args.files or [os.path.join("logs", "requests_*.jsonl")]
+    paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    if not paths:
+        print("没有找到请求日志文件")
+        return
+
+    runs = defaultdict(RequestStats)
+    for item in read_records(paths):
+        run_id = item.get('run', '')
+        if args.run and run_id != args.run:
+            continue
+        runs[run_id if args.by_run else 'all'].add(item)
+
+    reports = {run_id: stats.report() for run_id, stats in runs.items()}
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+        return
+    for run_id, report in reports.items():
+        if args.by_run:
+            print(f"运行 {run_id}")
+        print(format_report(report))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,18 @@ import pandas as pd
 from datetime import datetime
 import logging
 import sys
-from tqdm import tqdm
+import time
 
 # 导入爬虫模块
 from naifenzhiku_crawler import NaifenzhikuCrawler
 from naifenzhiku_detail_crawler import NaifenzhikuDetailCrawler
 from naifenzhiku_more_detail_crawler import NaifenzhikuMoreDetailCrawler
+from dead_letter import DeadLetterStore
+import metrics
+import tracing
+import profiling
+import run_status
+import request_log
 
 class CrawlerPipeline:
     """奶粉智库爬虫数据处理流水线"""
@@ -21,7 +27,8 @@ class CrawlerPipeline:
     def __init__(self, output_dir="data", resume_from_page=0, max_pages=0,
                  min_delay=1.0, max_delay=3.0, skip_products=False, 
                  skip_details=False, skip_more_details=False,
-                 product_file=None, username=None, password=None, auth_token=None):
+                 product_file=None, username=None, password=None, auth_token=None, session=None,
+                 dead_letter_file=None):
         """
         初始化数据处理流水线
         参数:
@@ -37,6 +44,8 @@ class CrawlerPipeline:
             username: 奶粉智库账号(手机号)
             password: 奶粉智库密码
             auth_token: 授权token
+            session: 各爬虫共用的requests会话，常驻进程中跨多次运行保持连接
+            dead_letter_file: 失败抓取记录文件，提供时记录获取失败的产品供之后的运行重试
         """
         self.output_dir = output_dir
         self.resume_from_page = resume_from_page
@@ -49,6 +58,8 @@ class CrawlerPipeline:
         self.username = username
         self.password = password
         self.auth_token = auth_token
+        self.session = session
+        self.dead_letters = DeadLetterStore(dead_letter_file) if dead_letter_file else None
         
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
@@ -84,6 +95,7 @@ class CrawlerPipeline:
         )
         self.logger = logging.getLogger("CrawlerPipeline")
     
+    @tracing.traced()
     def run_product_crawler(self):
         """运行产品列表爬虫"""
         if self.skip_products and self.product_file:
@@ -94,16 +106,18 @@ class CrawlerPipeline:
         self.logger.info("开始爬取产品列表...")
         
         # 初始化产品爬虫
-        crawler = NaifenzhikuCrawler(resume_from_page=self.resume_from_page)
+        crawler = NaifenzhikuCrawler(resume_from_page=self.resume_from_page, session=self.session)
         
         # 设置输出目录
         crawler.output_dir = self.output_dir
         
         # 开始爬取
+        start = time.perf_counter()
         if self.max_pages > 0:
             products = crawler.crawl_pages(start_page=self.resume_from_page or 1, max_pages=self.max_pages)
         else:
             products = crawler.crawl_all_products()
+        metrics.record_stage('listing', len(products or []), 0, time.perf_counter() - start)
         
         # 获取最新的产品文件
         self.latest_product_file = self.get_latest_file(self.output_dir, "naifenzhiku_products_final_", ".json")
@@ -117,6 +131,7 @@ class CrawlerPipeline:
         else:
             self.logger.error("未找到产品列表文件！")
     
+    @tracing.traced()
     def run_detail_crawler(self):
         """运行产品详情爬虫"""
         if self.skip_details:
@@ -133,11 +148,15 @@ class CrawlerPipeline:
         crawler = NaifenzhikuDetailCrawler(
             input_file=self.latest_product_file,
             output_dir=self.output_dir,
-            delay_range=self.delay_range
+            delay_range=self.delay_range,
+            session=self.session
         )
         
         # 开始爬取
+        start = time.perf_counter()
         product_details = crawler.crawl_all_details()
+        metrics.record_stage('detail', len(product_details), len(crawler.failed), time.perf_counter() - start)
+        self.record_dead_letters('detail', [d.get('id') for d in product_details], crawler.failed)
         
         # 获取最新的详情文件
         self.latest_detail_file = self.get_latest_file(self.output_dir, "naifenzhiku_details_final_", ".json")
@@ -151,6 +170,7 @@ class CrawlerPipeline:
         else:
             self.logger.error("未找到产品详情文件！")
     
+    @tracing.traced()
     def run_more_detail_crawler(self):
         """运行产品额外详情爬虫"""
         if self.skip_more_details:
@@ -170,11 +190,24 @@ class CrawlerPipeline:
             delay_range=self.delay_range,
             username=self.username,
             password=self.password,
-            auth_token=self.auth_token
+            auth_token=self.auth_token,
+            session=self.session
         )
         
         # 开始爬取
+        start = time.perf_counter()
         more_details = crawler.crawl_all_more_details()
+        metrics.record_stage('more_detail', len(more_details) - len(crawler.failed), len(crawler.failed),
+                             time.perf_counter() - start)
+        failed_ids = {str(k) for k in crawler.failed}
+        self.record_dead_letters(
+            'more_detail',
+            [d.get('id') for d in more_details if str(d.get('id')) not in failed_ids],
+            crawler.failed
+        )
+        
+        # 保留(可能重新登录得到的)token，供后续运行复用
+        self.auth_token = crawler.auth_token
         
         # 获取最新的额外详情文件
         self.latest_more_detail_file = self.get_latest_file(self.output_dir, "naifenzhiku_more_details_final_", ".json")
@@ -188,6 +221,28 @@ class CrawlerPipeline:
         else:
             self.logger.error("未找到产品额外详情文件！")
     
+    def record_dead_letters(self, stage, succeeded, failed):
+        """
+        更新失败抓取记录：成功的产品移出记录，失败的产品记一次失败
+        参数:
+            stage: 阶段(detail/more_detail)
+            succeeded: 本次成功获取的产品ID
+            failed: 本次失败的产品 {产品ID: 失败原因}
+        """
+        if self.dead_letters is None:
+            return
+        
+        for product_id in succeeded:
+            self.dead_letters.resolve(product_id, stage)
+        for product_id, error in failed.items():
+            self.dead_letters.record_failure(product_id, stage, error)
+        self.dead_letters.save()
+        
+        if failed:
+            self.logger.warning(f"{len(failed)} 个产品的{stage}获取失败，已记录到 {self.dead_letters.path}，之后的运行会重试")
+    
+    @tracing.traced('save')
+    @profiling.profiled()
     def combine_data(self):
         """将产品列表和详情数据组合在一起"""
         if not self.latest_product_file or not self.latest_detail_file:
@@ -214,7 +269,7 @@ class CrawlerPipeline:
         
         # 组合数据
         self.combined_data = []
-        with tqdm(total=len(self.products), desc="组合数据", unit="产品") as pbar:
+        with run_status.progress("combine", len(self.products), unit="产品", desc="组合数据") as pbar:
             for product in self.products:
                 product_id = str(product.get('id', ''))
                 if product_id in detail_map:
@@ -260,6 +315,8 @@ class CrawlerPipeline:
             self.logger.error(f"保存组合数据时出错: {e}")
             return False
     
+    @tracing.traced('save')
+    @profiling.profiled()
     def combine_full_data(self):
         """将基础组合数据和额外详情数据进一步组合"""
         if not self.combined_file or not self.latest_more_detail_file:
@@ -286,7 +343,7 @@ class CrawlerPipeline:
         
         # 组合数据
         self.full_data = []
-        with tqdm(total=len(self.combined_data), desc="组合完整数据", unit="产品") as pbar:
+        with run_status.progress("combine_full", len(self.combined_data), unit="产品", desc="组合完整数据") as pbar:
             for product in self.combined_data:
                 product_id = str(product.get('id', ''))
                 
@@ -350,6 +407,7 @@ class CrawlerPipeline:
         # 按文件修改时间排序，返回最新的文件
         return max(files, key=os.path.getmtime)
     
+    @tracing.traced()
     def run_pipeline(self):
         """运行完整的爬虫流水线"""
         self.logger.info("奶粉智库爬虫数据处理流水线启动")
@@ -404,6 +462,8 @@ def main():
     parser.add_argument("--password", type=str, help="奶粉智库密码")
     parser.add_argument("--token", type=str, help="直接提供的授权token")
     parser.add_argument("--token-file", type=str, help="包含授权token的文件路径")
+    parser.add_argument("--dead-letter-file", type=str, help="失败抓取记录文件，记录获取失败的产品供之后重试")
+    profiling.add_argument(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
@@ -426,29 +486,33 @@ def main():
     print("奶粉智库爬虫数据处理流水线启动")
     print("=" * 50)
     
-    # 初始化流水线
-    pipeline = CrawlerPipeline(
-        output_dir=args.output,
-        resume_from_page=args.resume,
-        max_pages=args.pages,
-        min_delay=args.min_delay,
-        max_delay=args.max_delay,
-        skip_products=args.skip_products,
-        skip_details=args.skip_details,
-        skip_more_details=args.skip_more_details,
-        product_file=args.product_file,
-        username=args.username,
-        password=args.password,
-        auth_token=auth_token
-    )
+    with profiling.session('run_crawler_pipeline', args.profile), run_status.run('run_crawler_pipeline'):
+        # 初始化流水线
+        pipeline = CrawlerPipeline(
+            output_dir=args.output,
+            resume_from_page=args.resume,
+            max_pages=args.pages,
+            min_delay=args.min_delay,
+            max_delay=args.max_delay,
+            skip_products=args.skip_products,
+            skip_details=args.skip_details,
+            skip_more_details=args.skip_more_details,
+            product_file=args.product_file,
+            username=args.username,
+            password=args.password,
+            auth_token=auth_token,
+            dead_letter_file=args.dead_letter_file
+        )
     
-    # 运行流水线
-    result_file = pipeline.run_pipeline()
+        # 运行流水线
+        result_file = pipeline.run_pipeline()
     
-    if result_file:
-        print(f"流水线执行成功！数据已保存至: {result_file}")
-    else:
-        print("流水线执行失败！")
+        if result_file:
+            request_log.record_stored(len(pipeline.full_data))
+            print(f"流水线执行成功！数据已保存至: {result_file}")
+        else:
+            print("流水线执行失败！")
+        request_log.finish_run()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from tqdm import tqdm
+
+# 环境变量：运行状态文件路径，未设置时为logs/run_status.json，设为off时不写文件(常驻进程的/progress接口仍可用)
+STATUS_FILE_ENV = "NFZK_STATUS_FILE"
+# 状态文件的重写间隔(秒)
+STATUS_INTERVAL_ENV = "NFZK_STATUS_INTERVAL"
+
+DEFAULT_STATUS_FILE = os.path.join("logs", "run_status.json")
+DEFAULT_INTERVAL = 5.0
+DISABLED_VALUES = ("off", "0", "false", "none")
+
+# 计算当前速率的时间窗口(秒)
+RATE_WINDOW = 30.0
+
+
+def is_tty():
+    """标准错误是否连接到终端；cron和容器日志中不是终端，此时不显示进度条"""
+    try:
+        return sys.stderr.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class StageProgress:
+    """一个阶段的进度：完成数/总数、错误数、最近一段时间的速率和预计剩余时间"""
+
+    def __init__(self, name, total=None, unit="", desc=None):
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.errors = 0
+        self.description = desc or name
+        self.started = time.time()
+        self.finished = None
+        # (时间, 完成数)采样，用于计算最近RATE_WINDOW秒的速率
+        self.samples = deque([(self.started, 0)])
+
+    def advance(self, n):
+        self.done += n
+        now = time.time()
+        if now - self.samples[-1][0] >= 1.0:
+            self.samples.append((now, self.done))
+            while len(self.samples) > 2 and now - self.samples[0][0] > RATE_WINDOW:
+                self.samples.popleft()
+
+    def rate(self):
+        """最近一段时间的每秒完成数"""
+        end = self.finished or time.time()
+        start_time, start_done = self.samples[0]
+        if end - start_time <= 0:
+            return 0.0
+        return (self.done - start_done) / (end - start_time)
+
+    def snapshot(self):
+        rate = self.rate()
+        eta = None
+        if self.finished is None and self.total and rate > 0:
+            eta = round(max(self.total - self.done, 0) / rate, 1)
+        return {
+            'description': self.description,
+            'done': self.done,
+            'total': self.total,
+            'unit': self.unit,
+            'errors': self.errors,
+            'rate_per_second': round(rate, 3),
+            'eta_seconds': eta,
+            'started_at': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'finished_at': datetime.fromtimestamp(self.finished).isoformat(timespec='seconds') if self.finished else None,
+        }
+
+
+class StatusBoard:
+    """一次运行的状态：各阶段进度、队列深度、错误数和当前限速，定期原子地重写到JSON文件"""
+
+    def __init__(self, path=None, interval=DEFAULT_INTERVAL):
+        """
+        初始化
+        参数:
+            path: 状态文件路径，None时只保存在内存中
+            interval: 运行期间重写状态文件的间隔(秒)
+        """
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.writer = None
+        self.reset(None)
+
+    def reset(self, entry, **info):
+        self.entry = entry
+        self.info = info
+        self.state = 'idle' if entry is None else 'running'
+        self.started = time.time() if entry else None
+        self.finished = None
+        self.current = None
+        self.stages = {}
+        self.queues = {}
+        self.errors = 0
+        self.throttle = {}
+
+    def start_run(self, entry, **info):
+        with self.lock:
+            self.reset(entry, **info)
+        self.ensure_writer()
+        self.write()
+
+    def finish_run(self, success):
+        with self.lock:
+            self.state = 'finished' if success else 'failed'
+            self.finished = time.time()
+            self.current = None
+        self.write()
+
+    def start_stage(self, name, total=None, unit="", desc=None):
+        with self.lock:
+            stage = self.stages[name] = StageProgress(name, total, unit, desc)
+            self.current = name
+        return stage
+
+    def finish_stage(self, stage):
+        with self.lock:
+            stage.finished = time.time()
+            if self.current == stage.name:
+                self.current = None
+
+    def advance(self, stage, n=1):
+        with self.lock:
+            stage.advance(n)
+
+    def error(self, stage=None, n=1):
+        with self.lock:
+            self.errors += n
+            if stage is not None:
+                stage.errors += n
+
+    def set_queue(self, name, depth):
+        with self.lock:
+            self.queues[name] = depth
+
+    def set_throttle(self, delay_seconds, **details):
+        with self.lock:
+            self.throttle = {'delay_seconds': round(delay_seconds, 3), **details,
+                             'updated_at': datetime.now().isoformat(timespec='seconds')}
+
+    def snapshot(self):
+        """当前状态的字典，可直接序列化为JSON"""
+        with self.lock:
+            stages = {name: stage.snapshot() for name, stage in self.stages.items()}
+            return {
+                'entry': self.entry,
+                'pid': os.getpid(),
+                'state': self.state,
+                **self.info,
+                'started_at': datetime.fromtimestamp(self.started).isoformat(timespec='seconds') if self.started else None,
+                'finished_at': datetime.fromtimestamp(self.finished).isoformat(timespec='seconds') if self.finished else None,
+                'updated_at': datetime.now().isoformat(timespec='seconds'),
+                'elapsed_seconds': round((self.finished or time.time()) - self.started, 1) if self.started else None,
+                'stage': self.current,
+                'current': stages.get(self.current),
+                'stages': stages,
+                'queues': dict(self.queues),
+                'errors': self.errors,
+                'throttle': dict(self.throttle),
+            }
+
+    def write(self):
+        """把当前状态写入状态文件(先写临时文件再替换，读者不会读到写了一半的文件)"""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.run_status_', suffix='.json.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            # 状态文件只用于观察进度，写入失败不影响运行
+            print(f"写入运行状态文件失败: {e}", file=sys.stderr)
+
+    def ensure_writer(self):
+        """启动定期重写状态文件的后台线程，阶段卡在单个请求上时更新时间和速率仍会刷新"""
+        if not self.path or self.writer is not None:
+            return
+        self.writer = threading.Thread(target=self.write_loop, name="run-status", daemon=True)
+        self.writer.start()
+
+    def write_loop(self):
+        while True:
+            time.sleep(self.interval)
+            if self.state == 'running':
+                self.write()
+
+
+class Progress:
+    """
+    阶段进度：接口与本仓库用到的tqdm子集一致(update/set_description/close/with)，
+    更新运行状态，只在终端中运行时同时显示tqdm进度条
+    """
+
+    def __init__(self, board, name, total=None, unit="", desc=None):
+        self.board = board
+        self.stage = board.start_stage(name, total, unit, desc)
+        self.bar = None
+        if is_tty():
+            self.bar = tqdm(total=total, desc=desc or name, unit=unit)
+
+    def update(self, n=1):
+        self.board.advance(self.stage, n)
+        if self.bar is not None:
+            self.bar.update(n)
+
+    def error(self, n=1):
+        """记录本阶段的失败项目"""
+        self.board.error(self.stage, n)
+
+    def set_description(self, desc):
+        self.stage.description = desc
+        if self.bar is not None:
+            self.bar.set_description(desc)
+
+    def close(self):
+        if self.stage.finished is None:
+            self.board.finish_stage(self.stage)
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _board_from_env():
+    path = os.environ.get(STATUS_FILE_ENV, "").strip() or DEFAULT_STATUS_FILE
+    if path.lower() in DISABLED_VALUES:
+        path = None
+    interval = float(os.environ.get(STATUS_INTERVAL_ENV, DEFAULT_INTERVAL))
+    return StatusBoard(path, interval)
+
+
+BOARD = _board_from_env()
+
+
+def start_run(entry, **info):
+    """开始一次运行，清空上一次运行的阶段和计数"""
+    BOARD.start_run(entry, **info)
+
+
+def finish_run(success=True):
+    """结束本次运行并写出最终状态"""
+    BOARD.finish_run(success)
+
+
+@contextmanager
+def run(entry, **info):
+    """
+    把with块作为一次运行；已在运行中(如定时任务调用流水线)时不重新开始
+    参数:
+        entry: 入口名称
+        info: 写入状态的其他信息(如运行模式)
+    """
+    if BOARD.state == 'running':
+        yield BOARD
+        return
+    start_run(entry, **info)
+    success = False
+    try:
+        yield BOARD
+        success = True
+    finally:
+        finish_run(success)
+
+
+def progress(name, total=None, unit="", desc=None):
+    """
+    开始一个阶段并返回进度对象，替代tqdm(total=...)
+    参数:
+        name: 阶段名称，状态中的键
+        total: 总项目数，未知时为None(不计算预计剩余时间)
+        unit: 单位
+        desc: 终端进度条的描述，默认为阶段名称
+    """
+    return Progress(BOARD, name, total, unit, desc)
+
+
+def track(iterable, name, unit="", desc=None, total=None):
+    """逐项迭代并更新阶段进度，替代for item in tqdm(iterable)"""
+    if total is None and hasattr(iterable, '__len__'):
+        total = len(iterable)
+    with progress(name, total, unit, desc) as bar:
+        for item in iterable:
+            yield item
+            bar.update(1)
+
+
+def set_queue(name, depth):
+    """记录某个队列(如待重试的失败记录、待下载的图片)当前的深度"""
+    BOARD.set_queue(name, depth)
+
+
+def set_throttle(delay_seconds, **details):
+    """记录当前的请求间隔(秒)等限速设置"""
+    BOARD.set_throttle(delay_seconds, **details)
+
+
+def snapshot():
+    """当前运行状态的字典"""
+    return BOARD.snapshot()
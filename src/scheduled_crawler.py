@@ -6,6 +6,7 @@ import json
 import argparse
 import logging
 import sys
+import time
 import psycopg2
 from psycopg2 import extras
 from datetime import datetime
@@ -16,7 +17,17 @@ from naifenzhiku_crawler import NaifenzhikuCrawler
 from naifenzhiku_detail_crawler import NaifenzhikuDetailCrawler
 from naifenzhiku_more_detail_crawler import NaifenzhikuMoreDetailCrawler
 from run_crawler_pipeline import CrawlerPipeline
-from db_import import DatabaseImporter
+from db_import import DatabaseImporter, CopyRowStream
+from image_downloader import ImageDownloader
+from recrawl_planner import RecrawlPlanner
+from dead_letter import DeadLetterStore
+from product_repair import ProductRepairer
+from crawl_slices import SliceTracker
+import metrics
+import tracing
+import profiling
+import request_log
+import run_status
 
 class ScheduledCrawler:
     """定时爬虫：根据tag_time判断是否需要更新产品详情"""
@@ -24,7 +35,10 @@ class ScheduledCrawler:
     def __init__(self, output_dir="data", check_updates=False, skip_existing=False,
                  db_host="localhost", db_port=5432, db_name="milk_products", 
                  db_user="postgres", db_password="postgres",
-                 max_pages=0, min_delay=2.0, max_delay=5.0, config_file=None):
+                 max_pages=0, min_delay=2.0, max_delay=5.0, config_file=None,
+                 download_images=False, image_dir=None, session=None, auth_token=None, db_pool=None,
+                 recrawl_budget=0, listing_sort=None, stop_after_unchanged=0, slices=0, slice_listing_pages=2,
+                 backfill=False, backfill_limit=None, metrics_file=None, profile=None):
         """
         初始化定时爬虫
         参数:
@@ -40,6 +54,20 @@ class ScheduledCrawler:
             min_delay: 最小请求延迟(秒)
             max_delay: 最大请求延迟(秒)
             config_file: 配置文件路径
+            download_images: 导入后是否下载产品缩略图和图标
+            image_dir: 图片存储目录，默认为输出目录下的images
+            session: 复用的requests会话，常驻进程中跨多次运行保持HTTP连接
+            auth_token: 上次运行得到的授权token，提供时无需重新登录
+            db_pool: 数据库连接池，提供时从池中借用连接而不是每次新建
+            recrawl_budget: 大于0时按变更频率计划重新爬取，不再读取产品列表，值为本次运行的请求预算
+            listing_sort: 附加在列表URL上的排序参数，使列表按更新时间倒序
+            stop_after_unchanged: 检查更新时，列表按更新时间倒序且连续这么多页都没有变化就提前结束，0表示爬取全部页面
+            slices: 大于0时滚动分片爬取，产品按ID哈希分成这么多片，每次运行只重新爬取最久未刷新的一片
+            slice_listing_pages: 分片模式检查更新时只请求列表的前几页，0表示爬取全部页面
+            backfill: 是否只补齐数据库中缺失的详情和额外详情，不读取产品列表
+            backfill_limit: 补齐模式本次最多补齐的项数，None表示不限制
+            metrics_file: 运行结束后写入Prometheus文本格式指标的文件(供node_exporter textfile收集器读取)
+            profile: 分析每次运行的方式(cprofile/pyinstrument/tracemalloc)，结果写入logs/，None表示不分析
         """
         self.output_dir = output_dir
         self.check_updates = check_updates
@@ -51,9 +79,21 @@ class ScheduledCrawler:
         self.db_password = db_password
         self.max_pages = max_pages
         self.delay_range = (min_delay, max_delay)
-        
-        # 存储已有产品信息
-        self.existing_products = {}
+        self.download_images = download_images
+        self.image_dir = image_dir
+        self.session = session
+        self.auth_token = auth_token
+        self.db_pool = db_pool
+        self.recrawl_budget = recrawl_budget
+        self.listing_sort = listing_sort
+        self.stop_after_unchanged = stop_after_unchanged
+        self.slices = slices
+        self.slice_listing_pages = slice_listing_pages
+        self.backfill = backfill
+        self.backfill_limit = backfill_limit
+        self.metrics_file = metrics_file
+        self.profile = profile
+        self.last_run_id = None
         
         # 存储登录信息
         self.username = None
@@ -85,10 +125,12 @@ class ScheduledCrawler:
             except Exception as e:
                 self.logger.error(f"读取配置文件时出错: {e}")
         
-        # 如果需要检查更新，连接数据库并获取已有产品信息
-        if check_updates:
+        # 获取失败的产品记录在输出目录中，跨运行保留
+        self.dead_letter_file = os.path.join(self.output_dir, "dead_letters.json")
+        
+        # 如果需要检查更新、按计划或按分片重新爬取，连接数据库(新旧产品的比较、计划和分片进度都在数据库中)
+        if check_updates or recrawl_budget > 0 or slices > 0:
             self.connect_db()
-            self.load_existing_products()
     
     def setup_logger(self):
         """设置日志"""
@@ -103,16 +145,50 @@ class ScheduledCrawler:
         )
         self.logger = logging.getLogger("ScheduledCrawler")
     
-    def connect_db(self):
-        """连接到PostgreSQL数据库"""
-        try:
-            self.conn = psycopg2.connect(
+    def acquire_conn(self):
+        """获取数据库连接：有连接池时借用并检查连接是否仍可用，否则新建连接"""
+        if self.db_pool is None:
+            return psycopg2.connect(
                 host=self.db_host,
                 port=self.db_port,
                 dbname=self.db_name,
                 user=self.db_user,
                 password=self.db_password
             )
+        
+        conn = self.db_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            # 数据库重启或空闲连接被断开，丢弃后换一个新连接
+            self.logger.warning("连接池中的数据库连接已失效，重新建立连接")
+            self.db_pool.putconn(conn, close=True)
+            conn = self.db_pool.getconn()
+        return conn
+    
+    def release_conn(self, conn):
+        """归还数据库连接：连接池中的连接重置会话状态后放回，否则直接关闭"""
+        if self.db_pool is None:
+            conn.close()
+            return
+        
+        try:
+            conn.rollback()
+            conn.autocommit = True
+            # 释放可能遗留的导入锁和会话变量，避免影响下一次运行
+            with conn.cursor() as cur:
+                cur.execute("DISCARD ALL")
+            conn.autocommit = False
+            self.db_pool.putconn(conn)
+        except psycopg2.Error:
+            self.db_pool.putconn(conn, close=True)
+    
+    def connect_db(self):
+        """连接到PostgreSQL数据库"""
+        try:
+            self.conn = self.acquire_conn()
             self.logger.info(f"已成功连接到数据库: {self.db_name}@{self.db_host}:{self.db_port}")
             
             # 创建游标
@@ -132,38 +208,110 @@ class ScheduledCrawler:
             self.cur.close()
         
         if hasattr(self, 'conn') and self.conn:
-            self.conn.close()
+            self.release_conn(self.conn)
+            self.conn = None
             self.logger.info("数据库连接已关闭")
     
-    def load_existing_products(self):
-        """从数据库加载已有产品信息"""
-        try:
-            sql = """
-            SELECT product_id, tag_time, updated_at
-            FROM milk_products
-            """
-            
-            self.cur.execute(sql)
-            products = self.cur.fetchall()
-            
-            for product in products:
-                self.existing_products[str(product['product_id'])] = {
-                    'tag_time': product['tag_time'],
-                    'updated_at': product['updated_at']
-                }
-            
-            self.logger.info(f"已从数据库加载 {len(self.existing_products)} 个产品信息")
-            return True
-        except Exception as e:
-            self.logger.error(f"加载已有产品信息时出错: {e}")
-            return False
+    @tracing.traced('db')
+    @profiling.profiled()
+    def classify_products(self, products, full_listing=False):
+        """
+        在数据库中比较爬取到的产品列表与已有产品的tag_time
+        参数:
+            products: 爬取到的产品列表
+            full_listing: 是否爬取了完整列表，只有完整列表才能判断哪些产品已从列表中消失
+        返回:
+            (新产品列表, tag_time变化的产品列表, 未变化产品数, 已消失的产品ID列表)
+        """
+        # 同一产品在列表中重复出现时以最后一次为准
+        crawled = {}
+        for product in products:
+            try:
+                product_id = int(product.get('id'))
+            except (TypeError, ValueError):
+                continue
+            crawled[product_id] = product
+        
+        def tag_time_of(product):
+            try:
+                return int(product.get('tag_time'))
+            except (TypeError, ValueError):
+                return None
+        
+        join = "FULL JOIN" if full_listing else "LEFT JOIN"
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute("CREATE TEMP TABLE crawled_products (product_id INTEGER, tag_time BIGINT) ON COMMIT DROP")
+                cur.copy_expert(
+                    "COPY crawled_products (product_id, tag_time) FROM STDIN",
+                    CopyRowStream((pid, tag_time_of(product)) for pid, product in crawled.items())
+                )
+                cur.execute(f"""
+                    SELECT product_id, status FROM (
+                        SELECT coalesce(c.product_id, p.product_id) AS product_id,
+                               CASE WHEN p.product_id IS NULL THEN 'new'
+                                    WHEN c.product_id IS NULL THEN 'disappeared'
+                                    WHEN c.tag_time IS DISTINCT FROM p.tag_time THEN 'changed'
+                                    ELSE 'unchanged' END AS status
+                        FROM crawled_products c
+                        {join} milk_products p ON p.product_id = c.product_id
+                    ) diff
+                    WHERE status <> 'unchanged'
+                    ORDER BY product_id
+                """)
+                rows = cur.fetchall()
+                
+                # 记录本次检查的观测，供重新爬取计划估计变更频率
+                RecrawlPlanner(self.conn, logger=self.logger).record_observations(
+                    cur, crawled.keys(), [pid for pid, status in rows if status == 'changed']
+                )
+        
+        new_products = [crawled[pid] for pid, status in rows if status == 'new']
+        updated_products = [crawled[pid] for pid, status in rows if status == 'changed']
+        disappeared = [pid for pid, status in rows if status == 'disappeared']
+        unchanged_count = len(crawled) - len(new_products) - len(updated_products)
+        return new_products, updated_products, unchanged_count, disappeared
+    
+    def page_unchanged(self, products):
+        """判断一页产品是否都已入库且tag_time与数据库一致"""
+        ids = []
+        tag_times = []
+        for product in products:
+            try:
+                ids.append(int(product.get('id')))
+                tag_times.append(int(product.get('tag_time')))
+            except (TypeError, ValueError):
+                return False
+        
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT count(*)
+                FROM unnest(%s::INTEGER[], %s::BIGINT[]) AS c(product_id, tag_time)
+                JOIN milk_products p ON p.product_id = c.product_id AND p.tag_time = c.tag_time
+            """, (ids, tag_times))
+            matched = cur.fetchone()[0]
+        self.conn.rollback()
+        return matched == len(ids)
     
-    def run_crawler_and_filter(self):
-        """运行爬虫并根据tag_time筛选需要更新的产品"""
+    @tracing.traced()
+    @profiling.profiled()
+    def run_crawler_and_filter(self, max_pages=None):
+        """
+        运行爬虫并根据tag_time筛选需要更新的产品
+        参数:
+            max_pages: 最大爬取页数，0表示爬取所有页面，None时使用--max-pages
+        """
         self.logger.info("开始运行爬虫并筛选需要更新的产品...")
+        if max_pages is None:
+            max_pages = self.max_pages
         
-        # 初始化产品爬虫
-        crawler = NaifenzhikuCrawler()
+        # 初始化产品爬虫(列表按更新时间倒序时可在连续多页无变化后提前结束)
+        crawler = NaifenzhikuCrawler(
+            session=self.session,
+            sort_param=self.listing_sort,
+            stop_after_unchanged=self.stop_after_unchanged,
+            page_unchanged=self.page_unchanged
+        )
         
         # 确保爬虫使用正确的输出目录
         crawler.output_dir = self.output_dir
@@ -172,10 +320,10 @@ class ScheduledCrawler:
         products = []
         
         try:
-            if self.max_pages > 0:
+            if max_pages > 0:
                 # 爬取指定页数
-                self.logger.info(f"爬取前 {self.max_pages} 页的产品")
-                products = crawler.crawl_pages(start_page=1, max_pages=self.max_pages)
+                self.logger.info(f"爬取前 {max_pages} 页的产品")
+                products = crawler.crawl_pages(start_page=1, max_pages=max_pages)
                 
                 # 确保产品数据被保存
                 if products and len(products) > 0 and crawler.all_products:
@@ -192,34 +340,24 @@ class ScheduledCrawler:
             return None
         
         # 筛选需要更新的产品
-        new_products = []
-        updated_products = []
-        unchanged_products = []
+        try:
+            # 提前结束时列表不完整，不能据此判断产品已消失
+            new_products, updated_products, unchanged_count, disappeared = self.classify_products(
+                products, full_listing=max_pages == 0 and not crawler.stopped_early
+            )
+        except Exception as e:
+            self.logger.error(f"比较产品列表时出错: {e}")
+            return None
         
-        for product in products:
-            product_id = str(product.get('id', ''))
-            
-            # 如果产品ID不存在，跳过
-            if not product_id:
-                continue
-            
-            # 获取产品的tag_time
-            tag_time = product.get('tag_time', 0)
-            
-            # 判断是否需要更新
-            if product_id not in self.existing_products:
-                # 新产品
-                new_products.append(product)
-                self.logger.info(f"发现新产品: {product_id} - {product.get('name', '')}")
-            elif tag_time != self.existing_products[product_id]['tag_time']:
-                # tag_time变化，需要更新
-                updated_products.append(product)
-                self.logger.info(f"发现需要更新的产品: {product_id} - {product.get('name', '')}")
-            else:
-                # 产品未变化
-                unchanged_products.append(product)
+        for product in new_products:
+            self.logger.info(f"发现新产品: {product.get('id')} - {product.get('name', '')}")
+        for product in updated_products:
+            self.logger.info(f"发现需要更新的产品: {product.get('id')} - {product.get('name', '')}")
+        
+        self.logger.info(f"共发现 {len(new_products)} 个新产品, {len(updated_products)} 个需要更新的产品, {unchanged_count} 个无需更新的产品")
         
-        self.logger.info(f"共发现 {len(new_products)} 个新产品, {len(updated_products)} 个需要更新的产品, {len(unchanged_products)} 个无需更新的产品")
+        if disappeared:
+            self.save_disappeared_products(disappeared)
         
         # 创建要处理的产品列表
         products_to_process = new_products + updated_products
@@ -242,6 +380,20 @@ class ScheduledCrawler:
             self.logger.error(f"保存产品列表时出错: {e}")
             return None
     
+    def save_disappeared_products(self, product_ids):
+        """记录已从产品列表中消失的产品ID"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        disappeared_file = f"{self.output_dir}/naifenzhiku_products_disappeared_{timestamp}.json"
+        
+        try:
+            with open(disappeared_file, 'w', encoding='utf-8') as f:
+                json.dump(product_ids, f, ensure_ascii=False, indent=2)
+            self.logger.warning(f"有 {len(product_ids)} 个数据库中的产品未出现在本次完整列表中，已保存到 {disappeared_file}")
+        except Exception as e:
+            self.logger.error(f"保存已消失产品列表时出错: {e}")
+    
+    @tracing.traced()
+    @profiling.profiled()
     def process_products(self, products_file):
         """处理需要更新的产品"""
         self.logger.info(f"开始处理需要更新的产品: {products_file}")
@@ -254,11 +406,15 @@ class ScheduledCrawler:
             min_delay=self.delay_range[0],
             max_delay=self.delay_range[1],
             username=self.username,
-            password=self.password
+            password=self.password,
+            auth_token=self.auth_token,
+            session=self.session,
+            dead_letter_file=self.dead_letter_file
         )
         
         # 运行流水线
         result_file = pipeline.run_pipeline()
+        self.auth_token = pipeline.auth_token
         
         if result_file:
             self.logger.info(f"产品更新完成，结果保存在: {result_file}")
@@ -267,47 +423,299 @@ class ScheduledCrawler:
             self.logger.error("产品更新失败!")
             return None
     
+    @tracing.traced('db')
+    @profiling.profiled()
     def import_to_database(self, data_file):
         """将更新后的产品数据导入到数据库"""
         self.logger.info(f"开始将更新后的产品数据导入到数据库: {data_file}")
         
-        # 初始化数据库导入器
-        importer = DatabaseImporter(
-            host=self.db_host,
-            port=self.db_port,
-            dbname=self.db_name,
-            user=self.db_user,
-            password=self.db_password,
-            json_file=data_file
-        )
-        
-        # 执行数据导入
-        success = importer.import_data()
+        # 初始化数据库导入器(有连接池时使用池中的连接)
+        conn = self.acquire_conn() if self.db_pool is not None else None
+        try:
+            importer = DatabaseImporter(
+                host=self.db_host,
+                port=self.db_port,
+                dbname=self.db_name,
+                user=self.db_user,
+                password=self.db_password,
+                json_file=data_file,
+                conn=conn
+            )
+            
+            # 执行数据导入
+            success = importer.import_data()
+            self.last_run_id = importer.last_run_id
+        finally:
+            if conn is not None:
+                self.release_conn(conn)
         
         if success:
             self.logger.info("数据导入成功!")
+            if self.download_images:
+                self.download_product_images(data_file)
             return True
         else:
             self.logger.error("数据导入失败!")
             return False
     
+    @tracing.traced()
+    @profiling.profiled()
+    def download_product_images(self, data_file):
+        """下载本次导入产品的缩略图和图标，失败不影响任务结果"""
+        try:
+            with open(data_file, 'r', encoding='utf-8') as f:
+                product_ids = [int(item['id']) for item in json.load(f) if str(item.get('id', '')).isdigit()]
+            
+            conn = self.acquire_conn()
+            try:
+                downloader = ImageDownloader(
+                    conn,
+                    image_dir=self.image_dir or os.path.join(self.output_dir, "images"),
+                    logger=self.logger
+                )
+                downloader.run(product_ids=product_ids)
+            finally:
+                self.release_conn(conn)
+        except Exception as e:
+            self.logger.error(f"下载产品图片时出错: {e}")
+    
+    @tracing.traced()
+    @profiling.profiled()
+    def run_planned_recrawl(self):
+        """按变更频率计划重新爬取：在请求预算内只重新爬取最可能已变化的产品"""
+        planner = RecrawlPlanner(self.conn, logger=self.logger)
+        plan = planner.plan(self.recrawl_budget)
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        plan_file = f"{self.output_dir}/recrawl_plan_{timestamp}.json"
+        planner.save_plan(plan, plan_file)
+        self.logger.info(f"已保存重新爬取计划到 {plan_file}")
+        
+        product_ids = [item['product_id'] for item in plan['products']]
+        if not product_ids:
+            self.logger.info("计划中没有需要重新爬取的产品，任务结束")
+            return True
+        
+        return self.recrawl_products(product_ids, planner)
+    
+    def recrawl_products(self, product_ids, planner):
+        """
+        重新爬取数据库中已有的产品并导入，同时记录观测结果供变更频率估计使用
+        参数:
+            product_ids: 产品ID列表
+            planner: RecrawlPlanner
+        返回:
+            是否成功
+        """
+        # 直接由数据库中的产品基本信息生成产品列表文件，跳过列表爬取
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        products_file = f"{self.output_dir}/naifenzhiku_products_to_update_{timestamp}.json"
+        with open(products_file, 'w', encoding='utf-8') as f:
+            json.dump(planner.listing_records(product_ids), f, ensure_ascii=False, indent=2)
+        
+        result_file = self.process_products(products_file)
+        if not result_file:
+            self.logger.error("处理产品失败!")
+            return False
+        
+        success = self.import_to_database(result_file)
+        if success:
+            planner.record_recrawl(product_ids, self.last_run_id)
+        return success
+    
+    @tracing.traced()
+    @profiling.profiled()
+    def run_slice(self):
+        """滚动分片爬取：只重新爬取最久未刷新的一个分片，把整个目录的刷新分摊到多次运行"""
+        tracker = SliceTracker(self.conn, self.slices, logger=self.logger)
+        slice_index = tracker.claim()
+        if slice_index is None:
+            self.logger.info("所有分片都在其他进程中刷新，任务结束")
+            return True
+        
+        product_ids = tracker.products_in_slice(slice_index)
+        self.logger.info(f"刷新分片 {slice_index}/{self.slices}，共 {len(product_ids)} 个产品")
+        
+        success = False
+        try:
+            if product_ids:
+                success = self.recrawl_products(product_ids, RecrawlPlanner(self.conn, logger=self.logger))
+            else:
+                success = True
+        finally:
+            tracker.finish(slice_index, len(product_ids), success)
+        
+        done, total, oldest = tracker.progress()
+        self.logger.info(f"分片进度: 已刷新过 {done}/{total} 个分片，最久未刷新的分片完成于 {oldest or '从未'}")
+        return success
+    
+    @tracing.traced()
+    @profiling.profiled()
+    def run_backfill(self):
+        """补齐模式：在数据库中找出缺失详情或营养成分的产品，只重新获取缺失的阶段后批量导入"""
+        store = DeadLetterStore(self.dead_letter_file)
+        # 已在失败记录中的项按退避时间重试，这里不重复请求
+        pending = {(entry['product_id'], entry['stage']) for entry in store.entries.values()}
+        
+        conn = self.acquire_conn()
+        try:
+            repairer = ProductRepairer(
+                conn,
+                output_dir=self.output_dir,
+                delay_range=self.delay_range,
+                session=self.session,
+                auth_token=self.auth_token,
+                username=self.username,
+                password=self.password,
+                logger=self.logger
+            )
+            gaps = repairer.find_gaps(exclude=pending, limit=self.backfill_limit)
+            detail_gaps = sum(1 for _, stage in gaps if stage == 'detail')
+            self.logger.info(f"发现 {len(gaps)} 项缺失数据: 缺详情 {detail_gaps} 项，缺营养成分 {len(gaps) - detail_gaps} 项")
+            if not gaps:
+                return True
+            
+            records, succeeded, failed = repairer.repair(gaps)
+            self.auth_token = repairer.auth_token or self.auth_token
+        finally:
+            self.release_conn(conn)
+        
+        # 本次仍然失败的项交给失败记录按退避时间重试
+        for (product_id, stage), error in failed.items():
+            store.record_failure(product_id, stage, error)
+        store.save()
+        
+        if not records:
+            self.logger.warning("没有补齐成功的产品")
+            return not failed
+        return self.import_to_database(repairer.save_records(records))
+    
+    @tracing.traced()
+    @profiling.profiled()
+    def drain_dead_letters(self):
+        """在新的爬取之前，先重试之前运行中获取失败且已到重试时间的产品"""
+        store = DeadLetterStore(self.dead_letter_file)
+        run_status.set_queue('dead_letters', len(store))
+        if not store.due():
+            return
+        
+        conn = self.acquire_conn()
+        try:
+            repairer = ProductRepairer(
+                conn,
+                output_dir=self.output_dir,
+                delay_range=self.delay_range,
+                session=self.session,
+                auth_token=self.auth_token,
+                username=self.username,
+                password=self.password,
+                logger=self.logger
+            )
+            records_file, succeeded = repairer.drain(store)
+            self.auth_token = repairer.auth_token or self.auth_token
+        finally:
+            self.release_conn(conn)
+        
+        # 导入成功后才移出记录，导入失败时下次运行会再次重试
+        if records_file and self.import_to_database(records_file):
+            for product_id, stage in succeeded:
+                store.resolve(product_id, stage)
+            store.save()
+            run_status.set_queue('dead_letters', len(store))
+            self.logger.info(f"已修复 {len(succeeded)} 项之前获取失败的数据，剩余 {len(store)} 条失败记录")
+    
+    def run_check_updates(self, max_pages=None):
+        """
+        检查更新：爬取产品列表，筛选新产品和tag_time有变化的产品，获取详情后导入数据库
+        参数:
+            max_pages: 最大爬取的列表页数，0表示爬取所有页面，None时使用--max-pages
+        返回:
+            是否成功，没有需要更新的产品时也返回True
+        """
+        products_file = self.run_crawler_and_filter(max_pages)
+        if not products_file:
+            self.logger.info("没有需要更新的产品")
+            return True
+        
+        # 处理需要更新的产品
+        result_file = self.process_products(products_file)
+        if not result_file:
+            self.logger.error("处理产品失败!")
+            return False
+        
+        # 导入到数据库
+        return self.import_to_database(result_file)
+    
+    def run_mode(self):
+        """本次运行的模式，用作运行指标的mode标签"""
+        if self.backfill:
+            return 'backfill'
+        if self.recrawl_budget > 0:
+            return 'recrawl'
+        if self.slices > 0:
+            return 'slice'
+        return 'check_updates' if self.check_updates else 'full'
+    
     def run(self):
+        """运行定时爬虫任务，记录本次运行的耗时和结果，启用追踪或分析时写出追踪文件和分析结果，并输出本次运行的请求日志汇总"""
+        start = time.perf_counter()
+        success = False
+        run_status.start_run('scheduled_crawler', mode=self.run_mode())
+        try:
+            with tracing.span('ScheduledCrawler.run', mode=self.run_mode()), \
+                    profiling.session('scheduled_crawler', self.profile):
+                success = self.run_tasks()
+            return success
+        finally:
+            metrics.record_run(self.run_mode(), success, time.perf_counter() - start)
+            run_status.finish_run(success)
+            trace_file = tracing.save()
+            if trace_file:
+                self.logger.info(f"已保存本次运行的追踪文件到 {trace_file}")
+            request_log.finish_run(self.logger)
+            if self.metrics_file:
+                try:
+                    metrics.write_textfile(self.metrics_file)
+                except OSError as e:
+                    self.logger.error(f"写入指标文件时出错: {e}")
+    
+    def run_tasks(self):
         """运行定时爬虫任务"""
         self.logger.info("定时爬虫任务开始执行...")
         
         try:
+            # 0. 先重试之前获取失败的产品，失败不影响本次爬取
+            try:
+                self.drain_dead_letters()
+            except Exception as e:
+                self.logger.error(f"重试失败记录时出错: {e}")
+            
+            if self.backfill:
+                return self.run_backfill()
+            
+            if self.recrawl_budget > 0:
+                return self.run_planned_recrawl()
+            
+            if self.slices > 0:
+                # 分片只刷新已入库的产品：检查更新时先从列表前几页发现新产品和有变化的产品，再刷新本次领取的分片；
+                # 分片每小时运行，每次都遍历整个列表会使列表请求成倍增加
+                discovered = True
+                if self.check_updates:
+                    pages = self.slice_listing_pages
+                    if self.max_pages > 0:
+                        pages = min(pages, self.max_pages) if pages > 0 else self.max_pages
+                    discovered = self.run_check_updates(max_pages=pages)
+                refreshed = self.run_slice()
+                return discovered and refreshed
+            
             # 1. 运行爬虫并筛选需要更新的产品
             if self.check_updates:
-                products_file = self.run_crawler_and_filter()
-                
-                if not products_file:
-                    self.logger.info("没有需要更新的产品，任务结束")
-                    return True
+                return self.run_check_updates()
             else:
                 # 直接运行完整流水线
                 # 先爬取产品列表
                 if self.max_pages > 0:
-                    crawler = NaifenzhikuCrawler()
+                    crawler = NaifenzhikuCrawler(session=self.session)
                     crawler.output_dir = self.output_dir
                     products = crawler.crawl_pages(start_page=1, max_pages=self.max_pages)
                     if products and len(products) > 0:
@@ -322,7 +730,10 @@ class ScheduledCrawler:
                             min_delay=self.delay_range[0],
                             max_delay=self.delay_range[1],
                             username=self.username,
-                            password=self.password
+                            password=self.password,
+                            auth_token=self.auth_token,
+                            session=self.session,
+                            dead_letter_file=self.dead_letter_file
                         )
                     else:
                         self.logger.error("爬取产品列表失败!")
@@ -335,10 +746,14 @@ class ScheduledCrawler:
                         min_delay=self.delay_range[0],
                         max_delay=self.delay_range[1],
                         username=self.username,
-                        password=self.password
+                        password=self.password,
+                        auth_token=self.auth_token,
+                        session=self.session,
+                        dead_letter_file=self.dead_letter_file
                     )
                 
                 result_file = pipeline.run_pipeline()
+                self.auth_token = pipeline.auth_token
                 
                 if result_file:
                     self.logger.info(f"爬虫流水线执行成功，结果保存在: {result_file}")
@@ -349,18 +764,6 @@ class ScheduledCrawler:
                 else:
                     self.logger.error("爬虫流水线执行失败!")
                     return False
-            
-            # 2. 处理需要更新的产品
-            result_file = self.process_products(products_file)
-            
-            if not result_file:
-                self.logger.error("处理产品失败!")
-                return False
-            
-            # 3. 导入到数据库
-            success = self.import_to_database(result_file)
-            
-            return success
         except Exception as e:
             self.logger.error(f"执行定时爬虫任务时出错: {e}")
             return False
@@ -385,16 +788,49 @@ def main():
     parser.add_argument("--min-delay", type=float, default=2.0, help="最小请求延迟(秒)，默认为2.0秒")
     parser.add_argument("--max-delay", type=float, default=5.0, help="最大请求延迟(秒)，默认为5.0秒")
     parser.add_argument("--config-file", type=str, help="配置文件路径")
+    parser.add_argument("--download-images", action="store_true", help="导入后下载产品缩略图和图标")
+    parser.add_argument("--image-dir", type=str, help="图片存储目录，默认为输出目录下的images")
+    parser.add_argument("--recrawl-budget", type=int, default=0,
+                        help="按变更频率计划重新爬取，不读取产品列表，值为本次运行的请求预算；0表示不使用(默认)")
+    parser.add_argument("--listing-sort", type=str, help="附加在列表URL上的排序参数，使列表按更新时间倒序，如order=tag_time")
+    parser.add_argument("--stop-after-unchanged", type=int, default=int(os.environ.get("CRAWL_STOP_AFTER_UNCHANGED", "0")),
+                        help="检查更新时，列表按更新时间倒序且连续N页均无变化则提前结束，默认取环境变量CRAWL_STOP_AFTER_UNCHANGED，0表示爬取全部页面")
+    parser.add_argument("--slices", type=int, default=int(os.environ.get("CRAWL_SLICES", "0")),
+                        help="滚动分片爬取：产品按ID哈希分成N片，每次运行只刷新最久未刷新的一片，默认取环境变量CRAWL_SLICES，0表示不分片")
+    parser.add_argument("--slice-listing-pages", type=int, default=int(os.environ.get("CRAWL_SLICE_LISTING_PAGES", "2")),
+                        help="分片模式检查更新时只请求列表的前N页，默认取环境变量CRAWL_SLICE_LISTING_PAGES，否则为2，0表示爬取全部页面")
+    parser.add_argument("--backfill", action="store_true", help="只补齐数据库中缺失详情或营养成分的产品，不读取产品列表")
+    parser.add_argument("--backfill-limit", type=int, help="补齐模式本次最多补齐的项数，默认不限制")
+    parser.add_argument("--metrics-file", type=str, default=os.environ.get("NFZK_METRICS_FILE"),
+                        help="运行结束后写入Prometheus文本格式指标的文件，默认取环境变量NFZK_METRICS_FILE")
+    profiling.add_argument(parser)
+    parser.add_argument("--daemon", action="store_true", help="以常驻进程运行，按--schedule定时执行并跨运行保持连接和登录状态")
+    parser.add_argument("--schedule", type=str, default=os.environ.get("CRON_SCHEDULE", "0 2 * * 0"),
+                        help="常驻模式的cron表达式(分 时 日 月 周)，默认取环境变量CRON_SCHEDULE，否则为每周日凌晨2点")
+    parser.add_argument("--run-on-start", action="store_true", help="常驻模式启动后立即运行一次")
+    parser.add_argument("--control-port", type=int, default=8765, help="常驻模式控制接口端口(仅监听127.0.0.1)，为0时不启动，默认为8765")
+    parser.add_argument("--trigger", action="store_true", help="请求正在运行的常驻进程立即执行一次后退出")
+    parser.add_argument("--watch", action="store_true", help="监视列表头部：定期请求前几页，发现新产品或tag_time变化时立即爬取并导入")
+    parser.add_argument("--watch-pages", type=int, default=2, help="监视模式每次请求的列表页数，默认为2")
+    parser.add_argument("--watch-interval", type=int, default=600, help="监视模式的轮询间隔(秒)，默认为600秒")
     
     # 解析命令行参数
     args = parser.parse_args()
     
+    if args.trigger or args.daemon:
+        # 常驻模式依赖本模块，放在这里导入以避免循环导入
+        from crawler_daemon import CrawlerDaemon, send_trigger
+    
+    if args.trigger:
+        accepted, message = send_trigger(port=args.control_port)
+        print(message)
+        sys.exit(0 if accepted else 1)
+    
     print("=" * 50)
     print("定时爬虫启动")
     print("=" * 50)
     
-    # 初始化定时爬虫
-    crawler = ScheduledCrawler(
+    crawler_options = dict(
         output_dir=args.output,
         check_updates=args.check_updates,
         skip_existing=args.skip_existing,
@@ -406,9 +842,46 @@ def main():
         max_pages=args.max_pages,
         min_delay=args.min_delay,
         max_delay=args.max_delay,
-        config_file=args.config_file
+        config_file=args.config_file,
+        download_images=args.download_images,
+        image_dir=args.image_dir,
+        recrawl_budget=args.recrawl_budget,
+        listing_sort=args.listing_sort,
+        stop_after_unchanged=args.stop_after_unchanged,
+        slices=args.slices,
+        slice_listing_pages=args.slice_listing_pages,
+        backfill=args.backfill,
+        backfill_limit=args.backfill_limit,
+        metrics_file=args.metrics_file,
+        profile=args.profile
     )
     
+    if args.watch:
+        # 监视模式依赖本模块，放在这里导入以避免循环导入
+        from listing_watcher import ListingWatcher
+        watcher = ListingWatcher(
+            crawler_options=crawler_options,
+            pages=args.watch_pages,
+            interval=args.watch_interval
+        )
+        watcher.install_signal_handlers()
+        watcher.serve_forever()
+        sys.exit(0)
+    
+    if args.daemon:
+        daemon = CrawlerDaemon(
+            schedule=args.schedule,
+            crawler_options=crawler_options,
+            control_port=args.control_port,
+            run_on_start=args.run_on_start
+        )
+        daemon.install_signal_handlers()
+        daemon.serve_forever()
+        sys.exit(0)
+    
+    # 初始化定时爬虫
+    crawler = ScheduledCrawler(**crawler_options)
+    
     # 运行定时爬虫
     success = crawler.run()
     
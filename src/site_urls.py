@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""奶粉智库站点地址：可用环境变量指向本地模拟服务(benchmarks/mock_server.py)，离线测量爬虫性能"""
+
+import os
+
+# 数据接口(列表、额外详情、登录)
+API_BASE = os.environ.get("NFZK_API_BASE", "https://data.naifenzhiku.com").rstrip('/')
+# 网页(详情页)
+WEB_BASE = os.environ.get("NFZK_WEB_BASE", "https://naifenzhiku.com").rstrip('/')
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import random
+import atexit
+import tempfile
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# 环境变量：NFZK_TRACE为输出文件路径(可含strftime格式，如logs/trace_%Y%m%d_%H%M%S.json)，未设置时不记录
+TRACE_ENV = "NFZK_TRACE"
+# 逐项操作(单个请求、解析、等待)的采样率，各阶段的span总是记录
+SAMPLE_ENV = "NFZK_TRACE_SAMPLE"
+# 输出格式: chrome(chrome://tracing/Perfetto)或otlp(OpenTelemetry OTLP JSON)，默认按扩展名.otlp.json判断
+FORMAT_ENV = "NFZK_TRACE_FORMAT"
+
+DEFAULT_SAMPLE_RATE = 0.1
+SERVICE_NAME = "nf-data-crawler"
+
+_NULL_SPAN = nullcontext()
+
+
+class Frame:
+    """线程内span栈中的一层"""
+
+    __slots__ = ('span_id', 'recording', 'decided')
+
+    def __init__(self, span_id, recording, decided):
+        self.span_id = span_id
+        self.recording = recording
+        self.decided = decided
+
+
+class Tracer:
+    """记录一次运行中的span，保存为Chrome trace或OTLP JSON"""
+
+    def __init__(self, path, sample_rate=DEFAULT_SAMPLE_RATE, fmt=None):
+        """
+        初始化
+        参数:
+            path: 输出文件路径，可含strftime格式
+            sample_rate: 逐项操作的采样率(0~1)
+            fmt: chrome/otlp，None时按扩展名判断
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.format = fmt or ('otlp' if path.endswith('.otlp.json') else 'chrome')
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pid = os.getpid()
+        self.trace_id = os.urandom(16).hex()
+        # perf_counter_ns到Unix时间的偏移，OTLP需要绝对时间
+        self.epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, category, sample, attributes):
+        stack = self.stack()
+        parent = stack[-1] if stack else None
+        if parent is not None and not parent.recording:
+            recording, decided = False, True
+        elif sample and not (parent and parent.decided):
+            # 最外层的逐项span决定是否采样，其内部的span跟随该决定
+            recording, decided = random.random() < self.sample_rate, True
+        else:
+            recording, decided = True, bool(parent and parent.decided)
+
+        frame = Frame(os.urandom(8).hex(), recording, decided)
+        stack.append(frame)
+        start = time.perf_counter_ns()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            stack.pop()
+            if recording:
+                if error:
+                    attributes = dict(attributes, error=error)
+                with self.lock:
+                    self.spans.append((
+                        name, category, start, end, threading.get_ident(), threading.current_thread().name,
+                        frame.span_id, parent.span_id if parent else None, attributes
+                    ))
+
+    def chrome_trace(self, spans):
+        """chrome://tracing和Perfetto可直接打开的Trace Event格式"""
+        tids = {}
+        events = []
+        for name, category, start, end, ident, thread_name, _, _, attributes in spans:
+            if ident not in tids:
+                tids[ident] = len(tids) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tids[ident],
+                               'args': {'name': thread_name}})
+            events.append({
+                'name': name, 'cat': category, 'ph': 'X', 'pid': self.pid, 'tid': tids[ident],
+                'ts': start / 1000, 'dur': (end - start) / 1000, 'args': attributes
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def otlp_trace(self, spans):
+        """OpenTelemetry OTLP/JSON格式，可由collector的otlpjsonfile接收器读取"""
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {'key': key, 'value': {'boolValue': value}}
+            if isinstance(value, int):
+                return {'key': key, 'value': {'intValue': str(value)}}
+            if isinstance(value, float):
+                return {'key': key, 'value': {'doubleValue': value}}
+            return {'key': key, 'value': {'stringValue': str(value)}}
+
+        otlp_spans = []
+        for name, category, start, end, _, thread_name, span_id, parent_id, attributes in spans:
+            span = {
+                'traceId': self.trace_id,
+                'spanId': span_id,
+                'name': name,
+                'kind': 1,
+                'startTimeUnixNano': str(start + self.epoch_offset_ns),
+                'endTimeUnixNano': str(end + self.epoch_offset_ns),
+                'attributes': [attribute('category', category), attribute('thread.name', thread_name)]
+                              + [attribute(k, v) for k, v in attributes.items()],
+            }
+            if parent_id:
+                span['parentSpanId'] = parent_id
+            if 'error' in attributes:
+                span['status'] = {'code': 2, 'message': attributes['error']}
+            otlp_spans.append(span)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', SERVICE_NAME)]},
+            'scopeSpans': [{'scope': {'name': 'nfzk.tracing'}, 'spans': otlp_spans}]
+        }]}
+
+    def save(self):
+        """
+        写出已结束的span并清空，常驻进程中每次运行各写一个文件(路径需含时间格式)
+        返回:
+            文件路径，没有span时返回None
+        """
+        with self.lock:
+            spans, self.spans = self.spans, []
+        if not spans:
+            return None
+
+        spans.sort(key=lambda s: s[2])
+        payload = self.otlp_trace(spans) if self.format == 'otlp' else self.chrome_trace(spans)
+        path = datetime.now().strftime(self.path)
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.trace_', suffix='.json.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return path
+
+
+def _tracer_from_env():
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return None
+    sample_rate = float(os.environ.get(SAMPLE_ENV, DEFAULT_SAMPLE_RATE))
+    tracer = Tracer(path, sample_rate=sample_rate, fmt=os.environ.get(FORMAT_ENV))
+    atexit.register(tracer.save)
+    return tracer
+
+
+_tracer = _tracer_from_env()
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, category='stage', sample=False, **attributes):
+    """
+    记录with块的span；未启用追踪时返回空的上下文管理器，开销可忽略
+    参数:
+        name: span名称
+        category: 类别(stage/http/parse/save/sleep/db等)
+        sample: 是否为逐项操作，逐项操作按采样率记录
+        attributes: 附加属性
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, sample, attributes)
+
+
+def traced(category='stage', sample=False, name=None):
+    """把整个函数调用记录为一个span的装饰器，span名称默认为限定函数名"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(span_name, category, sample, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def sleep(seconds):
+    """time.sleep，启用追踪时记录为sleep span，便于区分等待时间和实际工作"""
+    with span('sleep', 'sleep', sample=True, seconds=round(seconds, 3)):
+        time.sleep(seconds)
+
+
+def save():
+    """写出追踪文件，返回文件路径；未启用时返回None"""
+    if _tracer is None:
+        return None
+    return _tracer.save()